@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# ccxt 异步接口依赖 aiohttp，未安装时继续使用同步的 OKXTrader
+try:
+    import aiohttp
+    import ccxt.async_support as ccxt_async
+    HAS_ASYNC_CCXT = True
+except ImportError:
+    HAS_ASYNC_CCXT = False
+
+# 异步交易所访问
+#
+# AsyncOKXTrader 基于 ccxt.async_support.okx，所有请求共用一个 aiohttp 会话和连接池，
+# 多个交易对的行情、K线、余额用 asyncio.gather 并发获取，耗时约等于最慢的一次请求。
+# SyncOKXTrader 在后台线程运行事件循环，对外提供与 ccxt 同名的同步方法（行情、K线、余额、
+# 下单撤单，其它 fetch_*/create_*/cancel_* 方法和 markets 等属性直接转发），
+# 可以直接作为 exchange 传给 TradingFramework.fetch_market_snapshot 等现有调用方。
+# 限速与同步交易所共用 OKXTrader 的 RequestScheduler 令牌桶（优先级通道和请求合并同样生效），
+# 不会出现两套限速各自计算额度；调度器关闭时才使用 ccxt 自带的节流器（enableRateLimit）。
+
+# K线请求: (symbol, timeframe, since, limit)
+OHLCVRequest = Tuple[str, str, Optional[int], Optional[int]]
+
+class AsyncOKXTrader:
+    """OKX 异步交易所连接，共享会话与连接池，支持多交易对并发请求"""
+
+    def __init__(self, config: Optional[Dict] = None, max_connections: Optional[int] = None,
+                 concurrency: Optional[int] = None, scheduler=None):
+        """
+        Args:
+            scheduler: 请求调度器，默认与同步交易所共用 OKXTrader 的调度器（配置关闭时为 None）
+        """
+        from config import Config
+        from trading import OKXTrader
+        if not HAS_ASYNC_CCXT:
+            raise RuntimeError("未安装 aiohttp，无法使用异步交易所: pip install aiohttp")
+        market_config = Config.get_market_data_config()
+        self.config = config if config is not None else Config.get_okx_config()
+        self.max_connections = max_connections or market_config['async_max_connections']
+        self.concurrency = concurrency or market_config['async_concurrency']
+        self.scheduler = scheduler if scheduler is not None else OKXTrader._get_scheduler()
+        self.exchange = None
+        self._session = None
+        self._semaphore = None
+        self._open_lock = None
+        self.logger = logging.getLogger("async_trading")
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """创建共享的连接池和交易所对象（必须在运行中的事件循环里调用）"""
+        from config import Config
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self.exchange is not None:
+                return
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300,
+                                             enable_cleanup_closed=True)
+            self._session = aiohttp.ClientSession(connector=connector, trust_env=True)
+            # 传入 session 后 ccxt 不再自行创建和关闭会话，所有请求复用同一个连接池
+            config = dict(self.config, session=self._session)
+            if self.scheduler is not None:
+                # 由调度器限速，关闭 ccxt 自带的节流器
+                config['enableRateLimit'] = False
+            self.exchange = ccxt_async.okx(config)
+            # 与同步交易所共用磁盘上的市场信息缓存，命中时不再请求市场信息
+            from markets_cache import cache_key, read_markets_cache
+            market_config = Config.get_market_data_config()
+            if market_config['markets_cache_path']:
+                cached = read_markets_cache(market_config['markets_cache_path'], cache_key(self.exchange),
+                                            market_config['markets_cache_ttl'])
+                if cached is not None:
+                    self.exchange.set_markets(list(cached['markets'].values()), cached.get('currencies'))
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def close(self):
+        """关闭交易所对象和连接池"""
+        if self.exchange is not None:
+            await self.exchange.close()
+            self.exchange = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def priority(self, lane: str):
+        """在 with 块内以指定优先级通道发出请求（与 OKXTrader.priority 相同）"""
+        if self.scheduler is None:
+            from contextlib import nullcontext
+            return nullcontext()
+        return self.scheduler.priority(lane)
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        """调用任意 ccxt 异步方法，网络请求经过调度器限速"""
+        await self.open()
+
+        async def request(*args, **kwargs):
+            async with self._semaphore:
+                return await getattr(self.exchange, method)(*args, **kwargs)
+
+        if self.scheduler is None:
+            return await request(*args, **kwargs)
+        # 先在调度器中排队等待令牌，再占用连接数
+        return await self.scheduler.call_async(method, request, *args, **kwargs)
+
+    async def load_markets(self, reload: bool = False) -> Dict:
+        return await self.call('load_markets', reload)
+
+    async def fetch_ticker(self, symbol: str) -> Dict:
+        return await self.call('fetch_ticker', symbol)
+
+    async def fetch_ohlcv(self, symbol: str, timeframe: str = '1m', since: Optional[int] = None,
+                          limit: Optional[int] = None) -> List[List[float]]:
+        return await self.call('fetch_ohlcv', symbol, timeframe, since=since, limit=limit)
+
+    async def fetch_balance(self) -> Dict:
+        return await self.call('fetch_balance')
+
+    async def create_order(self, symbol: str, type: str, side: str, amount: float,
+                           price: Optional[float] = None, params: Optional[Dict] = None) -> Dict:
+        return await self.call('create_order', symbol, type, side, amount, price, params or {})
+
+    async def cancel_order(self, id: str, symbol: Optional[str] = None, params: Optional[Dict] = None) -> Dict:
+        return await self.call('cancel_order', id, symbol, params or {})
+
+    async def fetch_order(self, id: str, symbol: Optional[str] = None, params: Optional[Dict] = None) -> Dict:
+        return await self.call('fetch_order', id, symbol, params or {})
+
+    async def fetch_open_orders(self, symbol: Optional[str] = None, since: Optional[int] = None,
+                                limit: Optional[int] = None, params: Optional[Dict] = None) -> List[Dict]:
+        return await self.call('fetch_open_orders', symbol, since, limit, params or {})
+
+    @property
+    def markets(self) -> Optional[Dict]:
+        return self.exchange.markets if self.exchange is not None else None
+
+    async def get_usdc_balance(self) -> float:
+        """获取 OKX 账户可用 USDC 余额"""
+        try:
+            balance = await self.fetch_balance()
+            return balance.get('USDC', {}).get('free', 0.0)
+        except Exception as e:
+            print(f"Error fetching OKX balance: {e}")
+            return 0.0
+
+    async def fetch_tickers_many(self, symbols: Sequence[str]) -> Dict[str, Dict]:
+        """并发获取多个交易对的最新行情
+        Returns: {symbol: ticker}，请求失败的交易对不在结果中
+        """
+        results = await asyncio.gather(*(self.fetch_ticker(symbol) for symbol in symbols),
+                                       return_exceptions=True)
+        tickers = {}
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, BaseException):
+                self.logger.error(f"获取行情 {symbol} 失败: {result}")
+            else:
+                tickers[symbol] = result
+        return tickers
+
+    async def fetch_ohlcv_many(self, requests: Sequence[OHLCVRequest]) -> Dict[Tuple[str, str], List]:
+        """并发获取多个K线序列
+        Args:
+            requests: [(symbol, timeframe, since, limit), ...]
+        Returns: {(symbol, timeframe): candles}，请求失败的序列对应的值为异常对象
+        """
+        results = await asyncio.gather(
+            *(self.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+              for symbol, timeframe, since, limit in requests),
+            return_exceptions=True)
+        return {(symbol, timeframe): result for (symbol, timeframe, _, _), result in zip(requests, results)}
+
+    async def fetch_snapshot(self, symbols: Sequence[str], ohlcv_requests: Sequence[OHLCVRequest] = (),
+                             include_balance: bool = False) -> Dict:
+        """一次并发获取行情、K线和（可选）余额"""
+        tasks = [self.fetch_tickers_many(symbols), self.fetch_ohlcv_many(ohlcv_requests)]
+        if include_balance:
+            tasks.append(self.fetch_balance())
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        snapshot = {'tickers': results[0], 'ohlcv': results[1]}
+        if include_balance:
+            snapshot['balance'] = results[2]
+        for key, value in snapshot.items():
+            if isinstance(value, BaseException):
+                self.logger.error(f"获取 {key} 失败: {value}")
+                snapshot[key] = None
+        return snapshot
+
+class SyncOKXTrader:
+    """AsyncOKXTrader 的同步外观：事件循环在后台线程运行，现有的同步调用方无需修改
+
+    除下面列出的方法外，其它 fetch_*/create_*/cancel_*/edit_* 方法经调度器转发到异步交易所，
+    markets、market()、amount_to_precision() 等非请求属性直接读取底层 ccxt 异步交易所对象。
+    """
+
+    def __init__(self, trader: Optional[AsyncOKXTrader] = None, timeout: float = 60.0):
+        self.trader = trader or AsyncOKXTrader()
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-exchange", daemon=True)
+        self._thread.start()
+
+    def _run(self, coro):
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("不能在异步交易所的事件循环线程中调用同步方法")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(self.timeout)
+
+    def load_markets(self, reload: bool = False) -> Dict:
+        return self._run(self.trader.load_markets(reload))
+
+    def fetch_ticker(self, symbol: str) -> Dict:
+        return self._run(self.trader.fetch_ticker(symbol))
+
+    def fetch_ohlcv(self, symbol: str, timeframe: str = '1m', since: Optional[int] = None,
+                    limit: Optional[int] = None) -> List[List[float]]:
+        return self._run(self.trader.fetch_ohlcv(symbol, timeframe, since=since, limit=limit))
+
+    def fetch_balance(self) -> Dict:
+        return self._run(self.trader.fetch_balance())
+
+    def create_order(self, symbol: str, type: str, side: str, amount: float,
+                     price: Optional[float] = None, params: Optional[Dict] = None) -> Dict:
+        return self._run(self.trader.create_order(symbol, type, side, amount, price, params))
+
+    def cancel_order(self, id: str, symbol: Optional[str] = None, params: Optional[Dict] = None) -> Dict:
+        return self._run(self.trader.cancel_order(id, symbol, params))
+
+    def fetch_order(self, id: str, symbol: Optional[str] = None, params: Optional[Dict] = None) -> Dict:
+        return self._run(self.trader.fetch_order(id, symbol, params))
+
+    def fetch_open_orders(self, symbol: Optional[str] = None, since: Optional[int] = None,
+                          limit: Optional[int] = None, params: Optional[Dict] = None) -> List[Dict]:
+        return self._run(self.trader.fetch_open_orders(symbol, since, limit, params))
+
+    def priority(self, lane: str):
+        """在 with 块内以指定优先级通道发出请求（通道随调用上下文带到事件循环线程）"""
+        return self.trader.priority(lane)
+
+    @property
+    def markets(self) -> Optional[Dict]:
+        self._run(self.trader.open())
+        return self.trader.markets
+
+    def __getattr__(self, name: str):
+        from request_scheduler import SCHEDULED_PREFIXES
+        if name.startswith('_') or name in ('trader', 'timeout'):
+            raise AttributeError(name)
+        if name.startswith(SCHEDULED_PREFIXES):
+            def call(*args, **kwargs):
+                return self._run(self.trader.call(name, *args, **kwargs))
+            call.__name__ = name
+            return call
+        self._run(self.trader.open())
+        return getattr(self.trader.exchange, name)
+
+    def get_usdc_balance(self) -> float:
+        return self._run(self.trader.get_usdc_balance())
+
+    def fetch_tickers_many(self, symbols: Sequence[str]) -> Dict[str, Dict]:
+        return self._run(self.trader.fetch_tickers_many(symbols))
+
+    def fetch_ohlcv_many(self, requests: Sequence[OHLCVRequest]) -> Dict[Tuple[str, str], List]:
+        return self._run(self.trader.fetch_ohlcv_many(requests))
+
+    def fetch_snapshot(self, symbols: Sequence[str], ohlcv_requests: Sequence[OHLCVRequest] = (),
+                       include_balance: bool = False) -> Dict:
+        return self._run(self.trader.fetch_snapshot(symbols, ohlcv_requests, include_balance))
+
+    def close(self):
+        """关闭连接池并停止后台事件循环"""
+        if not self._loop.is_running():
+            return
+        try:
+            self._run(self.trader.close())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+            self._loop.close()
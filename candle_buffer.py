@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# 实时K线环形缓冲区
+#
+# 每个 (symbol, timeframe) 一个定长缓冲区，按列存放 ts/open/high/low/close/volume。
+# 每根K线同时写入位置 i 和 i + capacity（双写），因此最近 n 根K线在内存中总是连续的，
+# open/high/low/close/volume 属性直接返回切片视图，不需要拷贝也不需要从列表重建数组。
+# 指定文件路径时缓冲区由 np.memmap 支撑，图表等其它进程可以只读打开同一个文件；
+# 也可以传入现成的 int64 数组（例如共享内存）作为存储，见 plugin_host。
+
+COLUMNS = ('ts', 'open', 'high', 'low', 'close', 'volume')
+
+# 文件头（int64）: [capacity, total, seq]
+#   total: 累计写入的K线数量；seq: 写入序号，写入过程中为奇数，读取方据此判断是否读到半写状态
+_META_SIZE = 3
+
+class CandleRingBuffer:
+    """定长K线环形缓冲区，可选内存映射到文件"""
+
+    def __init__(self, capacity: int = 1000, path: Optional[str] = None, readonly: bool = False,
+                 storage: Optional[np.ndarray] = None):
+        self.path = path
+        self.readonly = readonly
+        if storage is not None:
+            # 使用外部内存（由 copy_into 写入的完整存储，包含文件头）
+            self._storage = storage
+            capacity = int(self._storage[0])
+        elif path and os.path.exists(path):
+            self._storage = np.memmap(path, dtype=np.int64, mode='r' if readonly else 'r+')
+            capacity = int(self._storage[0])
+        elif path:
+            if readonly:
+                raise FileNotFoundError(path)
+            size = _META_SIZE + len(COLUMNS) * 2 * capacity
+            self._storage = np.memmap(path, dtype=np.int64, mode='w+', shape=(size,))
+            self._storage[0] = capacity
+        else:
+            self._storage = np.zeros(_META_SIZE + len(COLUMNS) * 2 * capacity, dtype=np.int64)
+            self._storage[0] = capacity
+
+        self.capacity = capacity
+        self._meta = self._storage[:_META_SIZE]
+        # 同一块内存按 float64 解释为 (列, 2 * capacity)
+        self._data = self._storage[_META_SIZE:].view(np.float64).reshape(len(COLUMNS), 2 * capacity)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return int(min(self._meta[1], self.capacity))
+
+    @property
+    def total(self) -> int:
+        """累计写入的K线数量"""
+        return int(self._meta[1])
+
+    @property
+    def last_ts(self) -> Optional[int]:
+        if self._meta[1] == 0:
+            return None
+        return int(self._data[0, (self._meta[1] - 1) % self.capacity])
+
+    def _write(self, index: int, candle):
+        position = index % self.capacity
+        for column, value in enumerate(candle[:len(COLUMNS)]):
+            value = 0.0 if value is None else value
+            self._data[column, position] = value
+            self._data[column, position + self.capacity] = value
+
+    def append(self, candle) -> bool:
+        """写入一根K线 [ts, open, high, low, close, volume]
+
+        时间戳与最新一根相同时原地更新（未收盘K线的最新价），更早的K线被忽略。
+        Returns: 是否写入
+        """
+        if self.readonly:
+            raise RuntimeError("只读缓冲区不能写入")
+        with self._lock:
+            total = int(self._meta[1])
+            last_ts = self.last_ts
+            if last_ts is not None and candle[0] < last_ts:
+                return False
+            self._meta[2] += 1
+            if last_ts is not None and candle[0] == last_ts:
+                self._write(total - 1, candle)
+            else:
+                self._write(total, candle)
+                self._meta[1] = total + 1
+            self._meta[2] += 1
+            return True
+
+    def extend(self, candles: List[List[float]]) -> int:
+        """按时间顺序写入多根K线
+        Returns: 写入（含原地更新）的K线数量
+        """
+        return sum(1 for candle in candles if self.append(candle))
+
+    def clear(self):
+        """清空缓冲区（例如与新数据之间出现断档时）"""
+        with self._lock:
+            self._meta[2] += 1
+            self._meta[1] = 0
+            self._meta[2] += 1
+
+    def window(self, name: str, limit: Optional[int] = None) -> np.ndarray:
+        """返回某一列最近 limit 根K线的只读视图（零拷贝）"""
+        count = len(self)
+        limit = count if limit is None else min(limit, count)
+        start = (int(self._meta[1]) - limit) % self.capacity
+        view = self._data[COLUMNS.index(name), start:start + limit]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.window('ts')
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.window('open')
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.window('high')
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.window('low')
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.window('close')
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.window('volume')
+
+    def snapshot(self, limit: Optional[int] = None, retries: int = 100) -> Dict[str, np.ndarray]:
+        """拷贝一份一致的数据（跨进程读取时使用，避免读到写入一半的K线）
+
+        读到写入中的状态时让出CPU再重试（写入方可能是等待GIL的同进程线程），
+        连续失败时逐步退避，最长每次等待1毫秒。
+        """
+        for attempt in range(retries):
+            seq = int(self._meta[2])
+            if seq % 2 == 0:
+                data = {name: np.array(self.window(name, limit)) for name in COLUMNS}
+                if int(self._meta[2]) == seq:
+                    return data
+            time.sleep(0 if attempt < 10 else min(0.001, 1e-5 * 2 ** (attempt - 10)))
+        raise RuntimeError("缓冲区持续写入中，无法获取一致的快照")
+
+    def to_list(self, limit: Optional[int] = None) -> List[List[float]]:
+        """转换为 fetch_ohlcv 格式的列表"""
+        data = self.snapshot(limit)
+        rows = np.column_stack([data[name] for name in COLUMNS]).tolist()
+        for row in rows:
+            row[0] = int(row[0])
+        return rows
+
+    @property
+    def nbytes(self) -> int:
+        """存储（文件头 + 双写数据）占用的字节数"""
+        return self._storage.nbytes
+
+    def copy_into(self, target: np.ndarray):
+        """把完整存储拷贝到 target（int64，长度为 nbytes // 8），可用 CandleRingBuffer(storage=target) 读取"""
+        with self._lock:
+            target[:] = self._storage
+
+    def flush(self):
+        """内存映射模式下把修改同步到文件"""
+        if isinstance(self._storage, np.memmap) and not self.readonly:
+            self._storage.flush()
+
+_buffers: Dict[Tuple[str, str], CandleRingBuffer] = {}
+_buffers_lock = threading.Lock()
+
+def buffer_path(directory: str, symbol: str, timeframe: str) -> str:
+    """缓冲区文件路径，例如 <dir>/BTC-USDT_1m.candles"""
+    return os.path.join(directory, f"{symbol.replace('/', '-').replace(':', '_')}_{timeframe}.candles")
+
+def get_candle_buffer(symbol: str, timeframe: str, capacity: Optional[int] = None) -> CandleRingBuffer:
+    """获取进程内共享的K线缓冲区（按配置决定是否内存映射到文件）"""
+    from config import Config
+    key = (symbol, timeframe)
+    with _buffers_lock:
+        buffer = _buffers.get(key)
+        if buffer is None:
+            market_config = Config.get_market_data_config()
+            capacity = capacity or market_config['candle_buffer_capacity']
+            directory = market_config.get('candle_buffer_dir')
+            path = None
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+                path = buffer_path(directory, symbol, timeframe)
+            buffer = CandleRingBuffer(capacity, path)
+            _buffers[key] = buffer
+        return buffer
+
+def open_candle_buffer(symbol: str, timeframe: str, directory: Optional[str] = None) -> Optional[CandleRingBuffer]:
+    """只读打开其它进程写入的K线缓冲区文件，不存在时返回 None"""
+    from config import Config
+    directory = directory or Config.get_market_data_config().get('candle_buffer_dir')
+    if not directory:
+        return None
+    path = buffer_path(directory, symbol, timeframe)
+    if not os.path.exists(path):
+        return None
+    return CandleRingBuffer(path=path, readonly=True)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from database import ConnectionManager
+
+# 本地K线存储
+#
+# K线按 (symbol, timeframe, ts) 保存在独立的 candles.db 中，
+# ohlcv_coverage 记录每个序列已经从交易所完整获取过的时间区间。
+# 查询时只请求未覆盖的区间，重叠的分页用 INSERT OR REPLACE 去重，
+# 重复打开图表或回测时直接从本地读取。
+#
+# 下载长区间时按K线周期预先切分页边界，各页互不依赖，由线程池并发请求
+# （限速和优先级由 request_scheduler 负责），完成后按时间顺序写入，只重试失败的页。
+
+_UNIT_MS = {
+    's': 1000,
+    'm': 60 * 1000,
+    'h': 60 * 60 * 1000,
+    'd': 24 * 60 * 60 * 1000,
+    'w': 7 * 24 * 60 * 60 * 1000,
+    'M': 30 * 24 * 60 * 60 * 1000,  # 与 ccxt 一致，按30天计
+    'y': 365 * 24 * 60 * 60 * 1000,
+}
+
+def timeframe_to_ms(timeframe: str) -> int:
+    """K线周期转换为毫秒，例如 '5m' -> 300000"""
+    amount, unit = timeframe[:-1], timeframe[-1]
+    if unit not in _UNIT_MS or not amount.isdigit():
+        raise ValueError(f"不支持的K线周期: {timeframe}")
+    return int(amount) * _UNIT_MS[unit]
+
+def plan_pages(start_ms: int, end_ms: int, step: int, page_limit: int) -> List[Tuple[int, int]]:
+    """把 [start_ms, end_ms] 切分为每页 page_limit 根K线的闭区间"""
+    span = step * page_limit
+    return [(page_start, min(page_start + span - step, end_ms))
+            for page_start in range(start_ms, end_ms + 1, span)]
+
+class CandleStore:
+    """本地持久化K线存储，按需增量补齐缺失区间"""
+
+    def __init__(self, db_path: Optional[str] = None, page_limit: Optional[int] = None,
+                 page_delay: Optional[float] = None, workers: Optional[int] = None,
+                 page_retries: Optional[int] = None):
+        from config import Config
+        market_config = Config.get_market_data_config()
+        self.db_path = db_path or market_config['candle_db_path']
+        self.page_limit = page_limit or market_config['candle_page_limit']
+        self.page_delay = market_config['candle_page_delay'] if page_delay is None else page_delay
+        self.workers = workers or market_config['candle_download_workers']
+        self.page_retries = market_config['candle_page_retries'] if page_retries is None else page_retries
+        self.db = ConnectionManager.get(self.db_path)
+        self._init_database()
+
+    def _init_database(self):
+        with self.db.transaction():
+            self.db.execute('''
+                CREATE TABLE IF NOT EXISTS ohlcv (
+                    symbol TEXT NOT NULL,
+                    timeframe TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    open REAL NOT NULL,
+                    high REAL NOT NULL,
+                    low REAL NOT NULL,
+                    close REAL NOT NULL,
+                    volume REAL NOT NULL,
+                    PRIMARY KEY (symbol, timeframe, ts)
+                ) WITHOUT ROWID
+            ''')
+            # 已完整获取过的区间（闭区间，按K线开盘时间），区间内没有K线表示交易所本身无数据
+            self.db.execute('''
+                CREATE TABLE IF NOT EXISTS ohlcv_coverage (
+                    symbol TEXT NOT NULL,
+                    timeframe TEXT NOT NULL,
+                    start_ts INTEGER NOT NULL,
+                    end_ts INTEGER NOT NULL,
+                    PRIMARY KEY (symbol, timeframe, start_ts)
+                ) WITHOUT ROWID
+            ''')
+
+    def get_candles(self, exchange, symbol: str, timeframe: str, start_ms: int, end_ms: int) -> List[Tuple]:
+        """获取 [start_ms, end_ms] 内的K线，本地缺失的区间先从交易所补齐
+        Returns: [(ts, open, high, low, close, volume), ...]，按时间升序
+        """
+        if exchange is not None:
+            for gap_start, gap_end in self.missing_ranges(symbol, timeframe, start_ms, end_ms):
+                self.download(exchange, symbol, timeframe, gap_start, gap_end)
+        return self.load(symbol, timeframe, start_ms, end_ms)
+
+    def load(self, symbol: str, timeframe: str, start_ms: int, end_ms: int) -> List[Tuple]:
+        """只读取本地已有的K线"""
+        return self.db.execute('''
+            SELECT ts, open, high, low, close, volume FROM ohlcv
+            WHERE symbol = ? AND timeframe = ? AND ts >= ? AND ts <= ?
+            ORDER BY ts
+        ''', (symbol, timeframe, start_ms, end_ms)).fetchall()
+
+    def missing_ranges(self, symbol: str, timeframe: str, start_ms: int, end_ms: int) -> List[Tuple[int, int]]:
+        """计算 [start_ms, end_ms] 中尚未覆盖的区间（按K线周期对齐）"""
+        step = timeframe_to_ms(timeframe)
+        start = start_ms - start_ms % step
+        end = end_ms - end_ms % step
+        if end < start:
+            return []
+
+        covered = self.db.execute('''
+            SELECT start_ts, end_ts FROM ohlcv_coverage
+            WHERE symbol = ? AND timeframe = ? AND end_ts >= ? AND start_ts <= ?
+            ORDER BY start_ts
+        ''', (symbol, timeframe, start, end)).fetchall()
+
+        missing = []
+        cursor = start
+        for covered_start, covered_end in covered:
+            if covered_start > cursor:
+                missing.append((cursor, covered_start - step))
+            cursor = max(cursor, covered_end + step)
+            if cursor > end:
+                break
+        if cursor <= end:
+            missing.append((cursor, end))
+        return missing
+
+    def download(self, exchange, symbol: str, timeframe: str, start_ms: int, end_ms: int) -> int:
+        """从交易所并发分页下载 [start_ms, end_ms] 的K线并记录覆盖区间
+        Returns: 写入的K线数量
+        """
+        step = timeframe_to_ms(timeframe)
+        # 尚未收盘的K线会继续变化，只把已收盘的部分记为已覆盖
+        last_closed = int(time.time() * 1000) // step * step - step
+
+        pages = plan_pages(start_ms, end_ms, step, self.page_limit)
+        stored = 0
+        for attempt in range(self.page_retries + 1):
+            results = self._fetch_pages(exchange, symbol, timeframe, pages)
+            failed = []
+            # 按时间顺序写入，每页成功后立即记录覆盖区间
+            for (page_start, page_end), (candles, error) in zip(pages, results):
+                if error is not None:
+                    failed.append((page_start, page_end))
+                    continue
+                if candles:
+                    self.store(symbol, timeframe, candles)
+                    stored += len(candles)
+                covered_end = min(page_end, last_closed)
+                if covered_end >= page_start:
+                    self.mark_covered(symbol, timeframe, page_start, covered_end)
+            if not failed:
+                break
+            pages = failed
+            if attempt < self.page_retries:
+                print(f"⚠️ {len(failed)} 页K线获取失败，重试中...")
+        else:
+            print(f"获取K线数据出错: {len(pages)} 页多次重试后仍失败，下次查询时重新下载")
+        return stored
+
+    def _fetch_pages(self, exchange, symbol: str, timeframe: str,
+                     pages: List[Tuple[int, int]]) -> List[Tuple[List, Optional[Exception]]]:
+        """并发获取多页K线
+        Returns: 与 pages 一一对应的 (K线, 异常)
+        """
+        if self.workers <= 1 or len(pages) <= 1:
+            return [self._fetch_page(exchange, symbol, timeframe, *page) for page in pages]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(pages)),
+                                thread_name_prefix="candle-download") as executor:
+            # 每个任务带上调用方的上下文（请求调度器的优先级通道）
+            futures = [executor.submit(contextvars.copy_context().run, self._fetch_page,
+                                       exchange, symbol, timeframe, page_start, page_end)
+                       for page_start, page_end in pages]
+            return [future.result() for future in futures]
+
+    def _fetch_page(self, exchange, symbol: str, timeframe: str,
+                    page_start: int, page_end: int) -> Tuple[List, Optional[Exception]]:
+        """获取一页K线；交易所单次返回的数量少于请求数量时在页内继续请求"""
+        step = timeframe_to_ms(timeframe)
+        since = page_start
+        page = []
+        try:
+            while since <= page_end:
+                candles = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=self.page_limit)
+                candles = [candle for candle in candles if since <= candle[0] <= page_end]
+                if not candles:
+                    # 交易所在该区间没有更多数据（例如上市之前或未来时间）
+                    break
+                page.extend(candles)
+                since = candles[-1][0] + step
+                if self.page_delay:
+                    # 避免请求过于频繁
+                    time.sleep(self.page_delay)
+        except Exception as e:
+            return page, e
+        return page, None
+
+    def store(self, symbol: str, timeframe: str, candles: List[List[float]]):
+        """写入K线，同一时间戳的K线以新数据为准（重叠分页自动去重）"""
+        with self.db.transaction():
+            self.db.executemany('''
+                INSERT OR REPLACE INTO ohlcv (symbol, timeframe, ts, open, high, low, close, volume)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(symbol, timeframe, int(c[0]), c[1], c[2], c[3], c[4], c[5] or 0.0) for c in candles])
+
+    def mark_covered(self, symbol: str, timeframe: str, start_ms: int, end_ms: int):
+        """记录覆盖区间，并与重叠或相邻的已有区间合并"""
+        step = timeframe_to_ms(timeframe)
+        with self.db.transaction():
+            overlapping = self.db.execute('''
+                SELECT start_ts, end_ts FROM ohlcv_coverage
+                WHERE symbol = ? AND timeframe = ? AND end_ts >= ? AND start_ts <= ?
+            ''', (symbol, timeframe, start_ms - step, end_ms + step)).fetchall()
+            for covered_start, covered_end in overlapping:
+                start_ms = min(start_ms, covered_start)
+                end_ms = max(end_ms, covered_end)
+            self.db.execute('''
+                DELETE FROM ohlcv_coverage
+                WHERE symbol = ? AND timeframe = ? AND start_ts >= ? AND start_ts <= ?
+            ''', (symbol, timeframe, start_ms, end_ms))
+            self.db.execute('''
+                INSERT INTO ohlcv_coverage (symbol, timeframe, start_ts, end_ts) VALUES (?, ?, ?, ?)
+            ''', (symbol, timeframe, start_ms, end_ms))
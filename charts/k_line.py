@@ -1,36 +1,52 @@
 # -*- coding: utf-8 -*-
 
-import ccxt
-import sqlite3
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 from datetime import datetime, timedelta
-import numpy as np
-from typing import Optional, Tuple
+from typing import Optional
 import argparse
-# 交互功能的可选导入
-try:
-    from matplotlib.widgets import Button
-    INTERACTIVE_AVAILABLE = True
-except ImportError:
-    INTERACTIVE_AVAILABLE = False
-
-# 配置matplotlib支持中文显示
-try:
-    from chinese_font_config import setup_chinese_font
-    setup_chinese_font()
-except ImportError:
-    # 如果无法导入中文字体配置模块，使用简单的配置
-    import platform
-    system = platform.system()
-    if system == "Darwin":  # macOS
-        plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'PingFang SC', 'Heiti SC', 'sans-serif']
-    elif system == "Windows":
-        plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'SimSun', 'sans-serif']
-    else:  # Linux
-        plt.rcParams['font.sans-serif'] = ['WenQuanYi Micro Hei', 'DejaVu Sans', 'sans-serif']
-    plt.rcParams['axes.unicode_minus'] = False
+
+# pandas、matplotlib 导入较慢，只在读取K线数据或绘图时加载（见 _load_pandas / _load_matplotlib）
+pd = None
+plt = None
+mdates = None
+INTERACTIVE_AVAILABLE = False
+
+def _load_pandas():
+    global pd
+    if pd is None:
+        import pandas
+        pd = pandas
+
+def _load_matplotlib():
+    """导入 matplotlib 并配置中文显示（只执行一次）"""
+    global plt, mdates, INTERACTIVE_AVAILABLE
+    if plt is not None:
+        return
+    import matplotlib.pyplot as pyplot
+    import matplotlib.dates as dates
+    plt, mdates = pyplot, dates
+    
+    # 交互功能的可选导入
+    try:
+        from matplotlib.widgets import Button
+        INTERACTIVE_AVAILABLE = True
+    except ImportError:
+        INTERACTIVE_AVAILABLE = False
+    
+    # 配置matplotlib支持中文显示
+    try:
+        from chinese_font_config import setup_chinese_font
+        setup_chinese_font()
+    except ImportError:
+        # 如果无法导入中文字体配置模块，使用简单的配置
+        import platform
+        system = platform.system()
+        if system == "Darwin":  # macOS
+            plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'PingFang SC', 'Heiti SC', 'sans-serif']
+        elif system == "Windows":
+            plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'SimSun', 'sans-serif']
+        else:  # Linux
+            plt.rcParams['font.sans-serif'] = ['WenQuanYi Micro Hei', 'DejaVu Sans', 'sans-serif']
+        plt.rcParams['axes.unicode_minus'] = False
 
 class TradingChartViewer:
     """交易K线图查看器"""
@@ -40,77 +56,70 @@ class TradingChartViewer:
         
         self.db_path = db_path
         
-        # 使用统一的OKXTrader获取交易所对象
+        # 启动时自动执行数据库迁移（索引、ts_ms 列等）
+        from database import ConnectionManager
+        from migrations import migrate
+        migrate(ConnectionManager.get(db_path))
+        
+        # 使用统一的OKXTrader获取交易所对象（本地K线已覆盖时不创建交易所连接）
         from trading import OKXTrader
-        okx_trader = OKXTrader()
-        self.exchange = okx_trader.get_exchange()
+        self.okx_trader = OKXTrader()
+        
+        # 本地K线存储，重复打开图表时直接从磁盘读取
+        from candle_store import CandleStore
+        self.candle_store = CandleStore()
       
-    def get_kline_data(self, symbol: str, start_date: str, end_date: str, timeframe: str = '5m') -> pd.DataFrame:
-        """获取K线数据"""
+    @property
+    def exchange(self):
+        """交易所对象，第一次需要从交易所补齐K线时才创建"""
+        return self.okx_trader.get_exchange()
+    
+    def get_kline_data(self, symbol: str, start_date: str, end_date: str, timeframe: str = '5m') -> 'pd.DataFrame':
+        """获取K线数据（优先读取本地K线存储，只向交易所请求缺失的区间）"""
+        _load_pandas()
         try:
             # 转换日期格式
             start_timestamp = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp() * 1000)
             end_timestamp = int(datetime.strptime(end_date, '%Y-%m-%d').timestamp() * 1000)
             
-            # 获取K线数据
-            ohlcv_data = []
-            current_timestamp = start_timestamp
-            
-            while current_timestamp < end_timestamp:
-                try:
-                    ohlcv = self.exchange.fetch_ohlcv(
-                        symbol, 
-                        timeframe, 
-                        since=current_timestamp,
-                        limit=1000
-                    )
-                    
-                    if not ohlcv:
-                        break
-                    
-                    ohlcv_data.extend(ohlcv)
-                    current_timestamp = ohlcv[-1][0] + 1
-                    
-                    # 避免请求过于频繁
-                    import time
-                    time.sleep(0.1)
-                    
-                except Exception as e:
-                    print(f"获取K线数据出错: {e}")
-                    break
+            # 图表回填使用最低优先级，不影响机器人的行情和下单请求
+            with self.okx_trader.priority('backfill'):
+                missing = self.candle_store.missing_ranges(symbol, timeframe, start_timestamp, end_timestamp)
+                ohlcv_data = self.candle_store.get_candles(self.exchange if missing else None, symbol,
+                                                           timeframe, start_timestamp, end_timestamp)
             
             # 转换为DataFrame
             df = pd.DataFrame(ohlcv_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
             df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df = df[(df['timestamp'] >= start_timestamp) & (df['timestamp'] <= end_timestamp)]
             
-            return df.sort_values('timestamp').reset_index(drop=True)
+            return df.reset_index(drop=True)
             
         except Exception as e:
             print(f"获取K线数据失败: {e}")
             # 返回空DataFrame，但包含必要的列
             return pd.DataFrame(columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'datetime'])
     
-    def get_trading_records(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+    def get_trading_records(self, symbol: str, start_date: str, end_date: str) -> 'pd.DataFrame':
         """获取交易记录"""
-        conn = sqlite3.connect(self.db_path)
+        _load_pandas()
+        # 复用线程长连接（WAL模式下读取不阻塞机器人写入）
+        from database import ConnectionManager
+        conn = ConnectionManager.get(self.db_path).connection()
+        
+        # 使用 (symbol, ts_ms) 索引做范围查询
+        start_ms = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp() * 1000)
+        end_ms = int((datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).timestamp() * 1000) - 1
         
         query = '''
             SELECT datetime, action, price, amount, usdc_amount, signal_reason, timestamp
             FROM trading_records 
             WHERE symbol = ? 
-            AND datetime >= ? 
-            AND datetime <= ?
-            ORDER BY timestamp
+            AND ts_ms >= ? 
+            AND ts_ms <= ?
+            ORDER BY ts_ms
         '''
         
-        df = pd.read_sql_query(query, conn, params=(
-            symbol, 
-            f"{start_date} 00:00:00", 
-            f"{end_date} 23:59:59"
-        ))
-        
-        conn.close()
+        df = pd.read_sql_query(query, conn, params=(symbol, start_ms, end_ms))
         
         if not df.empty:
             df['datetime'] = pd.to_datetime(df['datetime'])
@@ -120,6 +129,7 @@ class TradingChartViewer:
     def plot_kline_with_trades(self, symbol: str, start_date: str, end_date: str,
                               timeframe: str = '5m', save_path: Optional[str] = None, interactive: bool = True):
         """绘制带交易标记的K线图"""
+        _load_matplotlib()
         if interactive and save_path is None:
             # 使用交互式模式
             self._plot_interactive_kline(symbol, start_date, end_date, timeframe)
@@ -147,6 +157,7 @@ class TradingChartViewer:
 
         # 绘制K线图
         self._plot_candlestick(ax1, kline_df)
+        self._plot_indicators(ax1, kline_df)
 
         # 标注交易点
         if not trades_df.empty:
@@ -175,7 +186,7 @@ class TradingChartViewer:
         ax2.grid(True, alpha=0.3)
 
         # 添加图例
-        if not trades_df.empty:
+        if ax1.get_legend_handles_labels()[0]:
             ax1.legend(loc='upper left')
 
         plt.tight_layout()
@@ -252,6 +263,7 @@ class TradingChartViewer:
 
         # 绘制K线图
         self._plot_candlestick(self.ax1, self.kline_df)
+        self._plot_indicators(self.ax1, self.kline_df)
 
         # 标注交易点
         if not self.trades_df.empty:
@@ -287,7 +299,7 @@ class TradingChartViewer:
         self.ax2.grid(True, alpha=0.3)
 
         # 添加图例
-        if not self.trades_df.empty:
+        if self.ax1.get_legend_handles_labels()[0]:
             self.ax1.legend(loc='upper left')
 
         # 刷新图表
@@ -423,6 +435,19 @@ class TradingChartViewer:
         ax.vlines(df.loc[down, 'datetime'], df.loc[down, 'low'], df.loc[down, 'high'],
                  color='green', alpha=0.8, linewidth=0.5)
     
+    def _plot_indicators(self, ax, df):
+        """叠加布林带和VWAP（与策略插件使用相同的指标实现）"""
+        if df.empty:
+            return
+        from indicators import vectorized
+        middle, upper, lower = vectorized.bollinger(df['close'].to_numpy(), 20, 2)
+        ax.plot(df['datetime'], middle, color='tab:blue', linewidth=0.8, alpha=0.8, label='BOLL(20,2)')
+        ax.plot(df['datetime'], upper, color='tab:blue', linewidth=0.6, alpha=0.5, linestyle='--')
+        ax.plot(df['datetime'], lower, color='tab:blue', linewidth=0.6, alpha=0.5, linestyle='--')
+        vwap = vectorized.vwap(df['timestamp'].to_numpy(), df['high'].to_numpy(), df['low'].to_numpy(),
+                               df['close'].to_numpy(), df['volume'].to_numpy())
+        ax.plot(df['datetime'], vwap, color='tab:orange', linewidth=0.8, alpha=0.8, label='VWAP')
+    
     def _plot_trade_markers(self, ax, trades_df):
         """绘制交易标记"""
         buy_trades = trades_df[trades_df['action'] == 'BUY']
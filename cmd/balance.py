@@ -9,62 +9,150 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 try:
-    from trading import get_balance, VirtualTrader, OKXTrader
+    from trading import get_balance, get_consolidated_view, list_accounts, VirtualTrader, OKXTrader, DEFAULT_ACCOUNT
     HAS_TRADING_MODULE = True
 except ImportError as e:
     print(f"警告: 无法导入trading模块: {e}")
     HAS_TRADING_MODULE = False
 
-def set_virtual_balance(amount: float):
+def set_virtual_balance(amount: float, account: str = 'default'):
     """设置虚拟账户余额"""
     try:
-        trader = VirtualTrader()
+        trader = VirtualTrader(account=account)
         old_balance = trader.get_usdc_balance()
         trader.update_balance(amount)
-        print(f"✅ 虚拟账户余额已更新")
+        print(f"✅ 虚拟账户 {account} 余额已更新")
         print(f"   原余额: {old_balance:.2f} USDC")
         print(f"   新余额: {amount:.2f} USDC")
     except Exception as e:
         print(f"❌ 设置虚拟账户余额失败: {e}")
         sys.exit(1)
 
+def group_accounts_by_db(account: str = None) -> dict:
+    """按数据库文件分组账户（开启 per_account_db 时账户分布在多个文件中）
+    Returns: {数据库路径: [账户名]}
+    """
+    databases = {}
+    for name, db_path in list_accounts().items():
+        if account is None or name == account:
+            databases.setdefault(db_path, []).append(name)
+    return databases
+
+def compact_balance_journal(keep_days: int, account: str = None):
+    """压缩虚拟账户余额流水（每个数据库文件分别压缩）"""
+    databases = group_accounts_by_db(account)
+    if not databases:
+        print(f"❌ 未找到虚拟账户: {account}")
+        sys.exit(1)
+    try:
+        for db_path, accounts in databases.items():
+            trader = VirtualTrader(db_path, async_journal=False, account=accounts[0])
+            compacted = trader.compact_balance_journal(keep_days, accounts if account else None)
+            print(f"✅ {db_path}: 已将 {keep_days} 天之前的 {compacted} 条余额流水压缩为按日检查点 "
+                  f"(账户: {', '.join(accounts)})")
+    except Exception as e:
+        print(f"❌ 压缩余额流水失败: {e}")
+        sys.exit(1)
+
+def verify_ledger(account: str = None, repair: bool = False, tolerance: float = 1e-6, export_dir: str = None):
+    """用交易记录重放校验虚拟账户余额和持仓"""
+    import time
+    from ledger_verify import verify_ledger as run_verify, repair_ledger
+
+    # 按数据库文件分组校验
+    databases = group_accounts_by_db(account)
+    if not databases:
+        print(f"❌ 未找到虚拟账户: {account}")
+        sys.exit(1)
+
+    all_ok = True
+    for db_path, accounts in databases.items():
+        start = time.time()
+        report = run_verify(db_path, accounts, tolerance=tolerance, export_dir=export_dir)
+        elapsed = time.time() - start
+        print(f"🔍 {db_path}: 重放 {report['trades']} 笔交易，耗时 {elapsed:.2f} 秒")
+
+        if report['arithmetic_errors']:
+            sample = ', '.join(str(trade_id) for trade_id in report['arithmetic_errors'][:10])
+            print(f"   ⚠️ {len(report['arithmetic_errors'])} 笔交易前后数值不一致 (id: {sample})")
+
+        for item in report['balances']:
+            status = '✅' if item['ok'] else '❌'
+            print(f"   {status} [{item['account']}] USDC 余额: 当前 {item['actual_balance']:.6f}, "
+                  f"重放 {item['expected_balance']:.6f}, 偏差 {item['drift']:+.6f}")
+            if item['adjustments']:
+                print(f"      交易之间有 {item['adjustments']} 次外部调整，合计 {item['adjustment_total']:+.2f} USDC")
+            if item['source'] == 'journal':
+                print(f"      最后一笔交易之后余额被外部设置过，以余额流水为准")
+            elif item['source'] == 'checkpoint':
+                print(f"      余额流水已压缩，以最新检查点的余额为准")
+
+        for item in report['positions']:
+            if item['ok']:
+                continue
+            print(f"   ❌ [{item['account']}] {item['symbol']}: 持仓 当前 {item['actual_position']:.8f}, "
+                  f"重放 {item['expected_position']:.8f}, 偏差 {item['drift']:+.8f}; "
+                  f"成本偏差 {item['cost_drift']:+.6f}")
+            if item['chain_breaks']:
+                print(f"      交易记录有 {item['chain_breaks']} 处前后持仓不连续，需要人工检查")
+        if all(item['ok'] for item in report['positions']):
+            print(f"   ✅ {len(report['positions'])} 个持仓全部一致")
+
+        if not report['ok']:
+            all_ok = False
+            if repair:
+                repaired = repair_ledger(db_path, report)
+                print(f"   🔧 已按重放结果修复 {repaired} 条记录")
+
+    if not all_ok and not repair:
+        print("❌ 账本不一致，可使用 --repair 按交易记录修复")
+        sys.exit(2)
+
+def print_virtual_account(virtual_balance: float, positions: dict):
+    """打印单个虚拟账户（或汇总）的余额与持仓"""
+    print(f"💰 USDC 余额: {virtual_balance:.2f}")
+
+    if positions:
+        print(f"📈 持仓信息:")
+        total_position_value = 0
+        for symbol, pos_info in positions.items():
+            position_size = pos_info['position_size']
+            avg_price = pos_info['avg_price']
+            total_cost = pos_info['total_cost']
+            current_value = position_size * avg_price  # 这里用平均价格估算，实际应该用当前价格
+
+            print(f"   {symbol}:")
+            print(f"     持仓数量: {position_size:.6f}")
+            print(f"     平均价格: {avg_price:.2f} USDT")
+            print(f"     总成本: {total_cost:.2f} USDC")
+            print(f"     估算价值: {current_value:.2f} USDC")
+            total_position_value += current_value
+
+        total_value = virtual_balance + total_position_value
+        print(f"📊 总资产估值: {total_value:.2f} USDC")
+    else:
+        print("📈 持仓信息: 无持仓")
+        print(f"📊 总资产估值: {virtual_balance:.2f} USDC")
+
 def list_all_accounts():
     """列出所有账户信息"""
     print("=" * 60)
     print("📊 账户信息总览")
     print("=" * 60)
 
-    # 虚拟账户信息
+    # 虚拟账户信息（每个子账户以及跨账户汇总）
     try:
-        trader = VirtualTrader()
-        virtual_balance = trader.get_usdc_balance()
-        positions = trader.get_all_positions()
+        view = get_consolidated_view()
 
-        print("\n🏦 虚拟账户")
-        print("-" * 30)
-        print(f"💰 USDC 余额: {virtual_balance:.2f}")
-
-        if positions:
-            print(f"📈 持仓信息:")
-            total_position_value = 0
-            for symbol, pos_info in positions.items():
-                position_size = pos_info['position_size']
-                avg_price = pos_info['avg_price']
-                total_cost = pos_info['total_cost']
-                current_value = position_size * avg_price  # 这里用平均价格估算，实际应该用当前价格
-
-                print(f"   {symbol}:")
-                print(f"     持仓数量: {position_size:.6f}")
-                print(f"     平均价格: {avg_price:.2f} USDT")
-                print(f"     总成本: {total_cost:.2f} USDC")
-                print(f"     估算价值: {current_value:.2f} USDC")
-                total_position_value += current_value
-
-            total_value = virtual_balance + total_position_value
-            print(f"📊 总资产估值: {total_value:.2f} USDC")
-        else:
-            print("📈 持仓信息: 无持仓")
-            print(f"📊 总资产估值: {virtual_balance:.2f} USDC")
+        for account, account_info in view['accounts'].items():
+            print(f"\n🏦 虚拟账户: {account}")
+            print("-" * 30)
+            print_virtual_account(account_info['usdc_balance'], account_info['positions'])
+
+        if len(view['accounts']) > 1:
+            print(f"\n🧮 虚拟账户汇总 ({len(view['accounts'])} 个账户)")
+            print("-" * 30)
+            print_virtual_account(view['total_usdc_balance'], view['positions'])
 
     except Exception as e:
         print(f"❌ 获取虚拟账户信息失败: {e}")
@@ -101,16 +189,36 @@ def main():
     balance_parser = subparsers.add_parser('get', help='查看账户余额')
     balance_parser.add_argument('--source', choices=['virtual', 'okx'], default='virtual',
                                help='余额来源: virtual 或 okx (默认: virtual)')
+    balance_parser.add_argument('--account', default=DEFAULT_ACCOUNT,
+                               help='虚拟账户名称 (默认: default)')
 
     # 设置虚拟余额命令
     set_parser = subparsers.add_parser('set', help='设置虚拟账户余额')
     set_parser.add_argument('amount', type=float, help='要设置的余额金额')
+    set_parser.add_argument('--account', default=DEFAULT_ACCOUNT, help='虚拟账户名称 (默认: default)')
 
     # 列出所有账户命令
     list_parser = subparsers.add_parser('list', help='列出所有账户信息')
 
+    # 压缩余额流水命令
+    compact_parser = subparsers.add_parser('compact', help='将旧的余额流水压缩为按日检查点')
+    compact_parser.add_argument('--keep-days', type=int, default=7,
+                                help='保留最近几天的原始流水 (默认: 7)')
+    compact_parser.add_argument('--account', help='只压缩指定虚拟账户 (默认: 全部)')
+
+    # 校验账本命令
+    verify_parser = subparsers.add_parser('verify', help='用交易记录重放校验余额和持仓')
+    verify_parser.add_argument('--account', help='只校验指定虚拟账户 (默认: 全部)')
+    verify_parser.add_argument('--repair', action='store_true', help='按重放结果修复当前余额和持仓')
+    verify_parser.add_argument('--tolerance', type=float, default=1e-6, help='允许的绝对误差 (默认: 1e-6)')
+    verify_parser.add_argument('--export-dir', help='从列式导出目录读取交易记录')
+
     args = parser.parse_args()
 
+    # 与机器人一致地读取环境变量（例如 PER_ACCOUNT_DB、TRADING_ACCOUNT）
+    from config import Config
+    Config.from_env()
+
     # 如果没有指定命令，默认显示虚拟账户余额
     if not args.command:
         try:
@@ -125,7 +233,7 @@ def main():
     try:
         if args.command == 'get':
             if args.source == 'virtual':
-                balance = get_balance('virtual')
+                balance = get_balance('virtual', account=args.account)
                 print(f"Virtual USDC Balance: {balance:.2f}")
             elif args.source == 'okx':
                 balance = get_balance('okx')
@@ -135,11 +243,20 @@ def main():
             if args.amount < 0:
                 print("❌ 余额金额不能为负数")
                 sys.exit(1)
-            set_virtual_balance(args.amount)
+            set_virtual_balance(args.amount, args.account)
 
         elif args.command == 'list':
             list_all_accounts()
 
+        elif args.command == 'compact':
+            if args.keep_days < 0:
+                print("❌ 保留天数不能为负数")
+                sys.exit(1)
+            compact_balance_journal(args.keep_days, args.account)
+
+        elif args.command == 'verify':
+            verify_ledger(args.account, args.repair, args.tolerance, args.export_dir)
+
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+import os
+
+# Add parent directory to path to import ledger_export module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from ledger_export import EXPORT_TABLES, export_all, compact_table
+    HAS_EXPORT_MODULE = True
+except ImportError as e:
+    print(f"警告: 无法导入ledger_export模块: {e}")
+    HAS_EXPORT_MODULE = False
+
+def main():
+    if not HAS_EXPORT_MODULE:
+        print("❌ 无法启动: ledger_export模块导入失败")
+        print("请确保已安装所需依赖: pip install numpy")
+        sys.exit(1)
+
+    parser = argparse.ArgumentParser(description='将交易记录与余额流水增量导出为列式 .npy 文件')
+    parser.add_argument('--db', default='trading.db', help='数据库路径 (默认: trading.db)')
+    parser.add_argument('--out', default='exports', help='导出目录 (默认: exports)')
+    parser.add_argument('--tables', nargs='+', choices=list(EXPORT_TABLES),
+                        help='要导出的表 (默认: 全部)')
+    parser.add_argument('--compact', action='store_true', help='导出后将每张表的分区合并为一个')
+
+    args = parser.parse_args()
+
+    try:
+        results = export_all(args.db, args.out, args.tables)
+        print(f"✅ 导出完成: {args.out}")
+        for table, count in results.items():
+            print(f"   {table}: 新增 {count} 行")
+
+        if args.compact:
+            for table in results:
+                merged = compact_table(args.out, table)
+                if merged > 1:
+                    print(f"   {table}: 已合并 {merged} 个分区")
+    except Exception as e:
+        print(f"❌ 导出失败: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
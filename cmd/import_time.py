@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# 启动耗时检查
+#
+# 用 python -X importtime 测量各命令行入口的导入耗时（扣除解释器本身的启动开销），
+# 超出预算或导入了不该导入的重量级依赖（ccxt/pandas/matplotlib）时以非零状态退出，供 CI 使用。
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('ccxt', 'pandas', 'matplotlib')
+
+# 名称 -> (命令参数, 预算毫秒, 禁止导入的模块)
+CHECKS: Dict[str, Tuple[List[str], float, Tuple[str, ...]]] = {
+    'balance': (['cmd/balance.py', '--help'], 100.0, HEAVY_MODULES),
+    'export_ledger': (['cmd/export_ledger.py', '--help'], 200.0, HEAVY_MODULES),
+    'trading': (['-c', 'import trading'], 100.0, HEAVY_MODULES),
+    'trading_framework': (['-c', 'import trading_framework'], 200.0, HEAVY_MODULES),
+    'charts.k_line': (['-c', 'import charts.k_line'], 100.0, HEAVY_MODULES),
+}
+
+def measure(args: List[str]) -> Tuple[float, set]:
+    """运行一次命令
+    Returns: (顶层导入的累计耗时毫秒, 导入过的顶层包名)
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    total_us = 0
+    packages = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|', 2)
+        if not cumulative.strip().isdigit():
+            continue  # 表头
+        packages.add(name.strip().split('.')[0])
+        if not name.startswith('  '):  # 只统计顶层导入，嵌套导入已包含在累计时间里
+            total_us += int(cumulative)
+    return total_us / 1000, packages
+
+def median_time(args: List[str], repeat: int) -> Tuple[float, set]:
+    packages = set()
+    timings = []
+    for _ in range(repeat):
+        elapsed, imported = measure(args)
+        timings.append(elapsed)
+        packages |= imported
+    return statistics.median(timings), packages
+
+def main():
+    parser = argparse.ArgumentParser(description='检查命令行入口的导入耗时是否超出预算')
+    parser.add_argument('--repeat', type=int, default=5, help='每项测量次数，取中位数 (默认: 5)')
+    parser.add_argument('--scale', type=float, default=1.0, help='预算倍数，较慢的机器上可以放宽 (默认: 1.0)')
+    parser.add_argument('--only', nargs='*', choices=list(CHECKS), help='只检查指定项')
+    args = parser.parse_args()
+
+    # 解释器自身启动（site 等）的导入耗时，各项结果扣除这部分
+    baseline, _ = median_time(['-c', 'pass'], args.repeat)
+    print(f"解释器启动导入耗时: {baseline:.1f} ms（已从各项中扣除）")
+    print(f"{'入口':<20}{'耗时(ms)':>10}{'预算(ms)':>10}  结果")
+
+    failed = False
+    for name, (command, budget, forbidden) in CHECKS.items():
+        if args.only and name not in args.only:
+            continue
+        elapsed, packages = median_time(command, args.repeat)
+        elapsed = max(elapsed - baseline, 0.0)
+        budget *= args.scale
+        problems = []
+        if elapsed > budget:
+            problems.append("超出预算")
+        heavy = sorted(set(forbidden) & packages)
+        if heavy:
+            problems.append(f"导入了 {', '.join(heavy)}")
+        failed = failed or bool(problems)
+        print(f"{name:<20}{elapsed:>10.1f}{budget:>10.1f}  {'❌ ' + '，'.join(problems) if problems else '✅'}")
+
+    if failed:
+        print("\n❌ 启动耗时检查未通过：重量级依赖请在用到的函数内导入")
+        sys.exit(1)
+    print("\n✅ 启动耗时检查通过")
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,7 @@ class Config:
     # 交易配置
     TRADING_CONFIG = {
         'default_symbol': 'BTC/USDT',
+        'account': 'default',  # 虚拟账户名称
         'check_interval': 65,  # 检查间隔（秒）
         'default_buy_amount': 50.0,  # 默认买入金额
         'max_position_usdc': 500.0,  # 最大持仓限制
@@ -28,6 +29,88 @@ class Config:
     # 数据库配置
     DATABASE_CONFIG = {
         'db_path': 'trading.db',
+        # 多账户: 开启后非默认账户使用独立的数据库文件，避免多个机器人争用写锁
+        'per_account_db': False,
+        'account_db_template': 'trading_{account}.db',
+        'busy_timeout': 5.0,  # 等待写锁的超时时间（秒）
+        'cached_statements': 128,  # 每个连接的预编译语句缓存数量
+        'pragmas': {
+            'journal_mode': 'WAL',  # 读写并发，读不阻塞写
+            'synchronous': 'NORMAL',  # WAL模式下兼顾持久性与性能
+            'cache_size': -16000,  # 页缓存约16MB
+            'temp_store': 'MEMORY',
+        },
+        # 异步交易流水（group commit），交易记录不再阻塞交易决策线程
+        'async_journal': False,
+        'journal_queue_size': 10000,  # 队列容量，满时提交方阻塞
+        'journal_flush_interval': 0.5,  # 批次最长等待时间（秒）
+        'journal_batch_size': 500,  # 每批最多写入条数
+        'journal_durability': 'normal',  # off / normal / full
+    }
+    
+    # 行情数据配置
+    MARKET_DATA_CONFIG = {
+        'candle_db_path': 'candles.db',  # 本地K线存储
+        'candle_page_limit': 1000,  # 每次请求的K线数量
+        'candle_page_delay': 0.0,  # 分页请求间隔（秒），限速已由请求调度器负责
+        'candle_download_workers': 4,  # 长区间K线并发下载的线程数
+        'candle_page_retries': 2,  # 下载失败的页的重试次数
+        'markets_cache_path': os.path.join('.cache', 'okx_markets.json.gz'),  # 交易所市场信息缓存，None 关闭
+        'markets_cache_ttl': 24 * 60 * 60,  # 市场信息缓存有效期（秒）
+        'candle_buffer_capacity': 1000,  # 每个实时K线环形缓冲区保留的K线数量
+        'candle_buffer_dir': None,  # 设置目录后缓冲区内存映射到文件，可供图表进程只读共享
+        # WebSocket 行情推送（需要安装 websockets），关闭时使用 REST 轮询
+        'feed_enabled': False,
+        'feed_channels': ['tickers', 'candles', 'trades'],
+        'feed_urls': None,  # 覆盖默认地址，例如 {'public': 'ws://127.0.0.1:8765/ws/v5/public'}
+        'feed_reconnect_max_delay': 30.0,  # 重连退避的最大间隔（秒）
+        'feed_stale_after': 60.0,  # 超过该时间没有推送视为数据过期，退回 REST（秒）
+        'feed_ping_interval': 25.0,  # 空闲时发送 ping 的间隔（秒）
+        'feed_record_path': None,  # 录制原始推送的 JSONL 文件，可用 ReplayWebSocketServer 回放
+        # 异步并发获取多个交易对/周期的行情（需要安装 aiohttp）
+        'async_fetch': False,
+        'async_max_connections': 20,  # 共享连接池的最大连接数
+        'async_concurrency': 10,  # 同时进行的请求数上限
+    }
+    
+    # 交易所请求调度配置
+    SCHEDULER_CONFIG = {
+        'enabled': True,  # 开启后由调度器限速（关闭 ccxt 自带的全局限速）
+        'coalesce': True,  # 合并并发的相同 fetch_* 请求
+        'max_retries': 2,  # 触发限速错误后的重试次数
+        'rate_limit_penalty': 2.0,  # 触发限速后该接口暂停的时间（秒）
+        # 限速分组 -> (请求数, 周期秒)，参考 OKX 各接口的限速规则
+        'limits': {
+            'candles': (20, 2),
+            'ticker': (20, 2),
+            'tickers': (20, 2),
+            'books': (40, 2),
+            'trades': (100, 2),
+            'instruments': (20, 2),
+            'balance': (10, 2),
+            'positions': (10, 2),
+            'orders': (60, 2),
+            'order': (60, 2),
+            'default': (10, 1),
+        },
+    }
+    
+    # 插件执行配置
+    PLUGIN_CONFIG = {
+        # 默认开启：互不依赖的插件在线程池中并发执行（插件在它依赖的插件结束后才开始），
+        # 每轮耗时取决于依赖链上最慢的插件；关闭后按依赖顺序逐个执行（PARALLEL_PLUGINS=false）
+        'parallel': True,
+        'max_workers': 4,  # 线程池大小
+        'timeout': 30.0,  # 单个插件的超时时间（秒），超时的结果丢弃，None 不限制
+        # execution="process" 的插件在工作进程中执行，超时未返回的工作进程被结束并在下一轮重启
+        'process_start_method': 'spawn',  # spawn / forkserver / fork
+    }
+    
+    # 交易所录制/回放配置（离线、可复现地运行机器人、插件和图表）
+    REPLAY_CONFIG = {
+        'mode': None,  # None: 直接访问交易所；'record': 录制请求与响应；'replay': 从录制文件回放
+        'path': 'okx_recording.jsonl.gz',
+        'speed': 0.0,  # 回放速度：0 不等待，1.0 按录制时的节奏，2.0 两倍速
     }
     
     @classmethod
@@ -45,6 +128,26 @@ class Config:
         """获取数据库配置"""
         return cls.DATABASE_CONFIG.copy()
     
+    @classmethod
+    def get_market_data_config(cls) -> Dict[str, Any]:
+        """获取行情数据配置"""
+        return cls.MARKET_DATA_CONFIG.copy()
+    
+    @classmethod
+    def get_scheduler_config(cls) -> Dict[str, Any]:
+        """获取请求调度配置"""
+        return cls.SCHEDULER_CONFIG.copy()
+    
+    @classmethod
+    def get_plugin_config(cls) -> Dict[str, Any]:
+        """获取插件执行配置"""
+        return cls.PLUGIN_CONFIG.copy()
+    
+    @classmethod
+    def get_replay_config(cls) -> Dict[str, Any]:
+        """获取交易所录制/回放配置"""
+        return cls.REPLAY_CONFIG.copy()
+    
     @classmethod
     def from_env(cls):
         """从环境变量加载配置"""
@@ -55,4 +158,20 @@ class Config:
         if os.getenv('OKX_PASSWORD'):
             cls.OKX_CONFIG['password'] = os.getenv('OKX_PASSWORD')
         if os.getenv('OKX_SANDBOX'):
-            cls.OKX_CONFIG['sandbox'] = os.getenv('OKX_SANDBOX').lower() == 'true'
\ No newline at end of file
+            cls.OKX_CONFIG['sandbox'] = os.getenv('OKX_SANDBOX').lower() == 'true'
+        if os.getenv('TRADING_ACCOUNT'):
+            cls.TRADING_CONFIG['account'] = os.getenv('TRADING_ACCOUNT')
+        if os.getenv('MARKET_FEED'):
+            cls.MARKET_DATA_CONFIG['feed_enabled'] = os.getenv('MARKET_FEED').lower() == 'true'
+        if os.getenv('ASYNC_FETCH'):
+            cls.MARKET_DATA_CONFIG['async_fetch'] = os.getenv('ASYNC_FETCH').lower() == 'true'
+        if os.getenv('PARALLEL_PLUGINS'):
+            cls.PLUGIN_CONFIG['parallel'] = os.getenv('PARALLEL_PLUGINS').lower() == 'true'
+        if os.getenv('EXCHANGE_MODE'):
+            cls.REPLAY_CONFIG['mode'] = os.getenv('EXCHANGE_MODE').lower()
+        if os.getenv('EXCHANGE_RECORDING'):
+            cls.REPLAY_CONFIG['path'] = os.getenv('EXCHANGE_RECORDING')
+        if os.getenv('REPLAY_SPEED'):
+            cls.REPLAY_CONFIG['speed'] = float(os.getenv('REPLAY_SPEED'))
+        if os.getenv('PER_ACCOUNT_DB'):
+            cls.DATABASE_CONFIG['per_account_db'] = os.getenv('PER_ACCOUNT_DB').lower() == 'true'
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+class ConnectionManager:
+    """SQLite连接管理器
+
+    每个数据库文件对应一个管理器，每个线程持有一个长连接。
+    连接使用 WAL 日志模式，读操作不会阻塞机器人写入。
+    """
+
+    _managers: Dict[Tuple[int, str], 'ConnectionManager'] = {}
+    _managers_lock = threading.Lock()
+
+    def __init__(self, db_path: str, pragmas: Optional[Dict] = None, cached_statements: int = 128,
+                 busy_timeout: float = 5.0):
+        self.db_path = db_path
+        self.pragmas = pragmas or {}
+        self.cached_statements = cached_statements
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, db_path: str) -> 'ConnectionManager':
+        """获取指定数据库的连接管理器（同一进程内按路径共享）"""
+        key = (os.getpid(), os.path.abspath(db_path))
+        manager = cls._managers.get(key)
+        if manager is None:
+            with cls._managers_lock:
+                manager = cls._managers.get(key)
+                if manager is None:
+                    from config import Config
+                    db_config = Config.get_database_config()
+                    manager = cls(
+                        db_path,
+                        pragmas=db_config.get('pragmas'),
+                        cached_statements=db_config.get('cached_statements', 128),
+                        busy_timeout=db_config.get('busy_timeout', 5.0),
+                    )
+                    cls._managers[key] = manager
+        return manager
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建新连接并应用 PRAGMA 配置"""
+        # isolation_level=None: 由调用方显式控制事务，避免 sqlite3 模块隐式 BEGIN
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """获取当前线程的长连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        """在当前线程的连接上执行SQL（复用预编译语句缓存）"""
+        return self.connection().execute(sql, params)
+
+    def executemany(self, sql: str, seq_of_params) -> sqlite3.Cursor:
+        """批量执行SQL"""
+        return self.connection().executemany(sql, seq_of_params)
+
+    @contextmanager
+    def transaction(self):
+        """写事务上下文: BEGIN IMMEDIATE ... COMMIT，异常时回滚
+
+        可嵌套使用，只有最外层负责提交，内部调用共享同一事务。
+        """
+        conn = self.connection()
+        depth = getattr(self._local, 'tx_depth', 0)
+        if depth > 0:
+            self._local.tx_depth = depth + 1
+            try:
+                yield conn
+            finally:
+                self._local.tx_depth = depth
+            return
+
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.tx_depth = 1
+        self._local.commit_callbacks = []
+        self._local.rollback_callbacks = []
+        try:
+            try:
+                yield conn
+                # COMMIT 失败（例如 SQLITE_BUSY）时同样回滚，连接不会停留在未结束的事务中
+                conn.execute('COMMIT')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                rollback_callbacks = self._local.rollback_callbacks
+                self._local.tx_depth = 0
+                self._run_callbacks(rollback_callbacks, '回滚')
+                raise
+            callbacks = self._local.commit_callbacks
+        finally:
+            self._local.tx_depth = 0
+            self._local.commit_callbacks = []
+            self._local.rollback_callbacks = []
+        self._run_callbacks(callbacks)
+
+    @staticmethod
+    def _run_callbacks(callbacks, stage: str = '提交'):
+        """事务已结束，逐个执行回调；某个回调出错不影响其它回调（例如账本缓存的更新）"""
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.getLogger("database").error(f"{stage}后回调执行失败: {e}", exc_info=True)
+
+    def in_transaction(self) -> bool:
+        """当前线程是否处于 transaction() 上下文中"""
+        return getattr(self._local, 'tx_depth', 0) > 0
+
+    def on_commit(self, callback):
+        """注册提交后回调；不在事务中时立即执行，事务回滚时丢弃"""
+        if self.in_transaction():
+            self._local.commit_callbacks.append(callback)
+        else:
+            callback()
+
+    def on_rollback(self, callback):
+        """注册回滚后回调（例如丢弃在事务中读到的未提交数据）；不在事务中或事务提交时不执行"""
+        if self.in_transaction():
+            self._local.rollback_callbacks.append(callback)
+
+    def close(self):
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def close_all(self):
+        """关闭该数据库的所有连接（进程退出时调用）"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
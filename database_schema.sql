@@ -1,8 +1,36 @@
--- Virtual balance table
+-- trading.db 结构参考（对应 migrations.py 中全部迁移执行后的结果，PRAGMA user_version = 6）
+-- 实际建表与升级由 migrations.migrate() 在启动时自动完成
+
+-- Virtual balance journal（余额变动流水）
 CREATE TABLE virtual_balance (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     usdc_balance REAL NOT NULL,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    reason TEXT,  -- 变动原因: INIT/BUY/SELL/SET
+    account TEXT NOT NULL DEFAULT 'default'
+);
+
+-- Current virtual balance（当前余额，每个账户一行，原地更新）
+CREATE TABLE virtual_balance_state (
+    account TEXT PRIMARY KEY,
+    usdc_balance REAL NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    ledger_version INTEGER NOT NULL DEFAULT 0  -- 余额或持仓每次修改时加一，供账本缓存检测外部修改
+);
+
+-- Compacted balance journal checkpoints（按日汇总的余额流水）
+CREATE TABLE virtual_balance_checkpoints (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    period_start TEXT NOT NULL,
+    entries INTEGER NOT NULL,
+    first_journal_id INTEGER NOT NULL,
+    last_journal_id INTEGER NOT NULL,
+    open_balance REAL NOT NULL,
+    close_balance REAL NOT NULL,
+    min_balance REAL NOT NULL,
+    max_balance REAL NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    account TEXT NOT NULL DEFAULT 'default'
 );
 
 -- Trading records table
@@ -19,8 +47,52 @@ CREATE TABLE trading_records (
     position_after REAL NOT NULL,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     datetime TEXT,  -- 添加可读日期时间
-    signal_reason TEXT  -- 添加交易信号原因
+    signal_reason TEXT,  -- 添加交易信号原因
+    ts_ms INTEGER,  -- 本地时间对应的epoch毫秒
+    account TEXT NOT NULL DEFAULT 'default'
+);
+
+-- Virtual positions table
+CREATE TABLE virtual_positions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL DEFAULT 'default',
+    symbol TEXT NOT NULL,
+    position_size REAL NOT NULL DEFAULT 0.0,
+    avg_price REAL NOT NULL DEFAULT 0.0,
+    total_cost REAL NOT NULL DEFAULT 0.0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (account, symbol)
+);
+
+-- Audit events（审计事件，由异步交易流水写入器批量写入）
+CREATE TABLE audit_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type TEXT NOT NULL,
+    payload TEXT,  -- JSON
+    ts_ms INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    account TEXT NOT NULL DEFAULT 'default'
 );
 
+-- Indexes
+CREATE INDEX idx_trading_records_symbol_ts ON trading_records (symbol, ts_ms);
+CREATE INDEX idx_trading_records_ts ON trading_records (ts_ms);
+CREATE INDEX idx_virtual_balance_updated_at ON virtual_balance (updated_at);
+CREATE INDEX idx_audit_events_ts ON audit_events (ts_ms);
+CREATE INDEX idx_trading_records_account_symbol_ts ON trading_records (account, symbol, ts_ms);
+CREATE INDEX idx_virtual_balance_account ON virtual_balance (account, id);
+
+-- Consolidated positions across accounts（跨账户汇总持仓）
+CREATE VIEW consolidated_positions AS
+SELECT symbol,
+       SUM(position_size) AS position_size,
+       SUM(total_cost) AS total_cost,
+       CASE WHEN SUM(position_size) > 0 THEN SUM(total_cost) / SUM(position_size) ELSE 0.0 END AS avg_price,
+       COUNT(*) AS accounts
+FROM virtual_positions
+WHERE position_size > 0
+GROUP BY symbol;
+
 -- Initialize virtual balance with 1000 USDC
-INSERT INTO virtual_balance (usdc_balance) VALUES (1000.0);
\ No newline at end of file
+INSERT INTO virtual_balance (usdc_balance, reason, account) VALUES (1000.0, 'INIT', 'default');
+INSERT INTO virtual_balance_state (account, usdc_balance) VALUES ('default', 1000.0);
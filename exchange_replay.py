@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import gzip
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+# 交易所请求录制与回放
+#
+# RecordingExchange 代理真实的 ccxt 交易所对象，把行情、K线、余额、订单等请求的参数和返回值
+# （或异常）逐行写入 gzip 压缩的 JSONL 文件；ReplayExchange 读取录制文件，以同样的方法名
+# 返回录制的结果，不需要网络，也不需要安装 ccxt。机器人、插件、图表可以离线、可复现地运行。
+#
+# 回放时请求按以下顺序匹配录制记录（同一匹配下按录制顺序依次返回，最后一条重复使用）：
+#   1. 方法名 + 完整参数；2. 方法名 + 交易对；3. 方法名。
+
+RECORDED_METHODS = (
+    'fetch_ticker', 'fetch_tickers', 'fetch_ohlcv', 'fetch_order_book', 'fetch_trades',
+    'fetch_balance', 'fetch_positions', 'fetch_open_orders', 'fetch_order', 'fetch_my_trades',
+    'create_order', 'cancel_order', 'edit_order', 'load_markets', 'fetch_markets',
+)
+
+# 录制文件中保存市场信息的记录
+_MARKETS_RECORD = '__markets__'
+
+class ReplayMissError(LookupError):
+    """回放文件中没有与请求匹配的记录"""
+
+def _normalize(value):
+    """转换为 JSON 可表示的形式（tuple -> list 等），录制和回放时参数一致"""
+    return json.loads(json.dumps(value, default=str))
+
+def _request_key(args, kwargs) -> str:
+    return json.dumps([_normalize(list(args)), _normalize(kwargs)], sort_keys=True)
+
+class RecordingExchange:
+    """录制模式：转发到真实交易所，同时记录请求与响应"""
+
+    def __init__(self, exchange, path: str):
+        object.__setattr__(self, '_exchange', exchange)
+        object.__setattr__(self, '_path', path)
+        object.__setattr__(self, '_file', gzip.open(path, 'at', encoding='utf-8'))
+        object.__setattr__(self, '_lock', threading.Lock())
+        object.__setattr__(self, '_start', time.monotonic())
+        object.__setattr__(self, 'logger', logging.getLogger("exchange_replay"))
+        atexit.register(self.close)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._exchange, name)
+        if callable(attr) and name in RECORDED_METHODS:
+            def recorded(*args, **kwargs):
+                return self._call(name, attr, args, kwargs)
+            recorded.__name__ = name
+            return recorded
+        return attr
+
+    def __setattr__(self, name: str, value):
+        setattr(self._exchange, name, value)
+
+    @property
+    def unwrapped(self):
+        """原始的 ccxt 交易所对象"""
+        return self._exchange
+
+    def _call(self, method: str, func, args, kwargs):
+        record = {
+            'offset': time.monotonic() - self._start,  # 距录制开始的秒数，回放时按此控制节奏
+            'time': time.time(),
+            'method': method,
+            'args': _normalize(list(args)),
+            'kwargs': _normalize(kwargs),
+        }
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            record['error'] = {'type': type(e).__name__, 'message': str(e)}
+            self._write(record)
+            raise
+        record['result'] = _normalize(result)
+        self._write(record)
+        return result
+
+    def _write(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + '\n')
+
+    def close(self):
+        """写入市场信息并关闭录制文件"""
+        markets = getattr(self._exchange, 'markets', None)
+        if markets:
+            self._write({'offset': time.monotonic() - self._start, 'time': time.time(),
+                         'method': _MARKETS_RECORD, 'args': [], 'kwargs': {}, 'result': _normalize(markets)})
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                object.__setattr__(self, '_file', None)
+
+class ReplayExchange:
+    """回放模式：用录制文件中的响应实现 ccxt 交易所的同名方法
+
+    speed: 0 或 None 表示不等待，尽快返回；1.0 按录制时的时间间隔返回；2.0 两倍速，依此类推。
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = None):
+        self.path = path
+        self.speed = speed
+        self.id = 'replay'
+        self.markets: Dict[str, Dict] = {}
+        self.symbols = []
+        self.rateLimit = 0
+        self.enableRateLimit = False
+        self.options: Dict[str, Any] = {}
+        self._exact: Dict[Tuple[str, str], deque] = {}
+        self._by_symbol: Dict[Tuple[str, Any], deque] = {}
+        self._by_method: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._clock = None  # 最近一次返回的记录的录制时间
+        self._started = None
+        self.stats = {'served': 0, 'exact': 0, 'fallback': 0, 'missed': 0}
+        self._load()
+
+    def _load(self):
+        count = 0
+        for record in self._read_records():
+            if record['method'] == _MARKETS_RECORD:
+                self.markets = record['result']
+                self.symbols = sorted(self.markets)
+                continue
+            method, args = record['method'], record['args']
+            record['used'] = False
+            self._exact.setdefault((method, _request_key(args, record['kwargs'])), deque()).append(record)
+            if args:
+                self._by_symbol.setdefault((method, json.dumps(args[0])), deque()).append(record)
+            self._by_method.setdefault(method, deque()).append(record)
+            count += 1
+        if count == 0:
+            raise ValueError(f"录制文件中没有请求记录: {self.path}")
+
+    def _read_records(self):
+        # 录制进程被强制结束时最后一段 gzip 数据可能不完整，保留之前的记录
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as e:
+            logging.getLogger("exchange_replay").warning(f"录制文件末尾不完整，已忽略: {e}")
+
+    @staticmethod
+    def _take(queue: deque) -> Dict:
+        # 按录制顺序返回未使用过的记录（同一条记录同时在三个索引中），最后一条保留供重复请求使用
+        while len(queue) > 1 and queue[0]['used']:
+            queue.popleft()
+        record = queue.popleft() if len(queue) > 1 else queue[0]
+        record['used'] = True
+        return record
+
+    def _find(self, method: str, args, kwargs) -> Dict:
+        with self._lock:
+            queue = self._exact.get((method, _request_key(args, kwargs)))
+            if queue:
+                self.stats['exact'] += 1
+                return self._take(queue)
+            queues = []
+            if args:
+                queues.append(self._by_symbol.get((method, json.dumps(_normalize(args[0])))))
+            queues.append(self._by_method.get(method))
+            for queue in queues:
+                if queue:
+                    self.stats['fallback'] += 1
+                    return self._take(queue)
+            self.stats['missed'] += 1
+        raise ReplayMissError(f"回放文件中没有 {method}{tuple(args)} 的记录")
+
+    def _pace(self, record: Dict):
+        """按录制时的时间间隔等待（speed 为 0 时不等待）"""
+        if not self.speed:
+            return
+        now = time.monotonic()
+        if self._started is None:
+            self._started = (now, record['offset'])
+            return
+        start_wall, start_offset = self._started
+        delay = (record['offset'] - start_offset) / self.speed - (now - start_wall)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _serve(self, method: str, args, kwargs):
+        record = self._find(method, args, kwargs)
+        self._pace(record)
+        self._clock = record['time']
+        self.stats['served'] += 1
+        if 'error' in record:
+            raise _rebuild_error(record['error'])
+        return record['result']
+
+    def __getattr__(self, name: str):
+        if name in RECORDED_METHODS:
+            def replayed(*args, **kwargs):
+                return self._serve(name, args, kwargs)
+            replayed.__name__ = name
+            return replayed
+        raise AttributeError(name)
+
+    def load_markets(self, reload: bool = False, params: Optional[Dict] = None) -> Dict:
+        if self.markets:
+            return self.markets
+        self.markets = self._serve('load_markets', (), {})
+        self.symbols = sorted(self.markets)
+        return self.markets
+
+    def market(self, symbol: str) -> Dict:
+        return self.load_markets()[symbol]
+
+    def milliseconds(self) -> int:
+        """回放时钟：最近一次返回的记录的录制时间，尚未回放任何请求时为当前时间"""
+        return int((self._clock if self._clock is not None else time.time()) * 1000)
+
+    def close(self):
+        pass
+
+def _rebuild_error(error: Dict) -> Exception:
+    """还原录制的异常；安装了 ccxt 时使用同名的 ccxt 异常类型，调用方的异常处理保持一致"""
+    try:
+        import ccxt
+        error_class = getattr(ccxt, error['type'], None)
+    except ImportError:
+        error_class = None
+    if not (isinstance(error_class, type) and issubclass(error_class, Exception)):
+        error_class = RuntimeError
+    return error_class(error['message'])
+
+def create_exchange(exchange=None, mode: Optional[str] = None, path: Optional[str] = None,
+                    speed: Optional[float] = None):
+    """按配置返回录制/回放模式的交易所对象
+    Args:
+        exchange: 真实交易所对象（录制模式需要）
+        mode: None（直接返回 exchange）/ 'record' / 'replay'
+    """
+    from config import Config
+    replay_config = Config.get_replay_config()
+    mode = mode if mode is not None else replay_config['mode']
+    path = path or replay_config['path']
+    speed = replay_config['speed'] if speed is None else speed
+    if not mode:
+        return exchange
+    if mode == 'record':
+        if exchange is None:
+            raise ValueError("录制模式需要真实的交易所对象")
+        return RecordingExchange(exchange, path)
+    if mode == 'replay':
+        return ReplayExchange(path, speed)
+    raise ValueError(f"未知的交易所模式: {mode}，可选 record / replay")
@@ -0,0 +1 @@
+# 技术指标模块
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+import math
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+import numpy as np
+from candle_store import timeframe_to_ms
+
+# 流式技术指标
+#
+# 每根K线收盘时以 O(1) 更新指标状态，不再每轮对整个窗口重新计算：
+#   - 滚动均值/方差: Welford 算法，窗口满后先移除最旧的值再加入新值
+#   - EMA: 以前 period 个值的均值作为初值；MACD 由两条 EMA 及其差值的 EMA 组成
+#   - RSI/ATR: Wilder 平滑（首个平均值为前 period 个值的均值）
+#   - VWAP: 按交易时段（默认按天）累计，时段切换时重新开始
+# 下面的标量计算函数同时被 indicators.vectorized 使用，两边的结果逐位一致。
+#
+# IndicatorEngine 按 (交易对, 周期, 指标, 参数) 共享指标状态，多个插件请求同一指标时只计算一次。
+# 缓冲区中最新的一根K线视为未收盘，不写入状态；需要包含它的值时用 peek() 临时计算。
+
+# ---------- 标量计算函数 ----------
+
+def welford_add(count: int, mean: float, m2: float, value: float) -> Tuple[int, float, float]:
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    m2 += delta * (value - mean)
+    return count, mean, m2
+
+def welford_remove(count: int, mean: float, m2: float, value: float) -> Tuple[int, float, float]:
+    if count <= 1:
+        return 0, 0.0, 0.0
+    count -= 1
+    delta = value - mean
+    mean -= delta / count
+    m2 -= delta * (value - mean)
+    return count, mean, max(m2, 0.0)
+
+def ema_step(previous: float, value: float, alpha: float) -> float:
+    return previous + alpha * (value - previous)
+
+def wilder_step(previous: float, value: float, period: int) -> float:
+    return (previous * (period - 1) + value) / period
+
+def rsi_from_averages(avg_gain: float, avg_loss: float) -> float:
+    if avg_loss == 0:
+        return 100.0
+    rs = avg_gain / avg_loss
+    return 100 - (100 / (1 + rs))
+
+def true_range(high: float, low: float, previous_close: Optional[float]) -> float:
+    if previous_close is None:
+        return high - low
+    return max(high - low, abs(high - previous_close), abs(low - previous_close))
+
+# ---------- 指标 ----------
+
+class RollingStats:
+    """滚动窗口均值与总体方差（与 np.mean / np.std 的定义一致）"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.window = deque()
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, value: float):
+        if len(self.window) == self.period:
+            self.count, self.mean, self.m2 = welford_remove(self.count, self.mean, self.m2, self.window.popleft())
+        self.window.append(value)
+        self.count, self.mean, self.m2 = welford_add(self.count, self.mean, self.m2, value)
+
+    @property
+    def ready(self) -> bool:
+        return self.count == self.period
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+class SMA:
+    """简单移动平均（滚动窗口均值）"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.stats = RollingStats(period)
+
+    def update(self, close: float):
+        self.stats.update(close)
+
+    @property
+    def ready(self) -> bool:
+        return self.stats.ready
+
+    @property
+    def value(self) -> Optional[float]:
+        if not self.ready:
+            return None
+        return self.stats.mean
+
+class BollingerBands:
+    """布林带: (中轨, 上轨, 下轨)"""
+
+    def __init__(self, period: int = 20, num_std: float = 2.0):
+        self.period = period
+        self.num_std = num_std
+        self.stats = RollingStats(period)
+
+    def update(self, close: float):
+        self.stats.update(close)
+
+    @property
+    def ready(self) -> bool:
+        return self.stats.ready
+
+    @property
+    def value(self) -> Optional[Tuple[float, float, float]]:
+        if not self.ready:
+            return None
+        middle, width = self.stats.mean, self.num_std * self.stats.std
+        return middle, middle + width, middle - width
+
+class EMA:
+    """指数移动平均"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.count = 0
+        self.seed = 0.0  # 预热期间的累计值
+        self.ema: Optional[float] = None
+
+    def update(self, value: float):
+        self.count += 1
+        if self.ema is not None:
+            self.ema = ema_step(self.ema, value, self.alpha)
+        elif self.count < self.period:
+            self.seed += value
+        else:
+            self.ema = (self.seed + value) / self.period
+
+    @property
+    def ready(self) -> bool:
+        return self.ema is not None
+
+    @property
+    def value(self) -> Optional[float]:
+        return self.ema
+
+    def peek(self, value: float) -> Optional[float]:
+        """假设再加入 value 时的 EMA（不修改状态）"""
+        if self.ema is not None:
+            return ema_step(self.ema, value, self.alpha)
+        if self.count + 1 == self.period:
+            return (self.seed + value) / self.period
+        return None
+
+class WilderRSI:
+    """Wilder 平滑的 RSI"""
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.last_close: Optional[float] = None
+        self.count = 0  # 已加入的涨跌幅数量
+        self.gain_sum = 0.0  # 预热期间的累计值
+        self.loss_sum = 0.0
+        self.avg_gain: Optional[float] = None
+        self.avg_loss: Optional[float] = None
+
+    def _next_averages(self, close: float) -> Tuple[Optional[float], Optional[float], float, float]:
+        change = close - self.last_close
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        if self.avg_gain is not None:
+            return (wilder_step(self.avg_gain, gain, self.period),
+                    wilder_step(self.avg_loss, loss, self.period), gain, loss)
+        if self.count + 1 == self.period:
+            return (self.gain_sum + gain) / self.period, (self.loss_sum + loss) / self.period, gain, loss
+        return None, None, gain, loss
+
+    def update(self, close: float):
+        if self.last_close is not None:
+            avg_gain, avg_loss, gain, loss = self._next_averages(close)
+            self.count += 1
+            if avg_gain is None:
+                self.gain_sum += gain
+                self.loss_sum += loss
+            self.avg_gain, self.avg_loss = avg_gain, avg_loss
+        self.last_close = close
+
+    @property
+    def ready(self) -> bool:
+        return self.avg_gain is not None
+
+    @property
+    def value(self) -> Optional[float]:
+        if self.avg_gain is None:
+            return None
+        return rsi_from_averages(self.avg_gain, self.avg_loss)
+
+    def peek(self, close: float) -> Optional[float]:
+        """假设再加入 close 时的 RSI（不修改状态），用于包含未收盘K线的实时值"""
+        if self.last_close is None:
+            return None
+        avg_gain, avg_loss, _, _ = self._next_averages(close)
+        if avg_gain is None:
+            return None
+        return rsi_from_averages(avg_gain, avg_loss)
+
+class MACD:
+    """MACD: (MACD线, 信号线, 柱)"""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+        self.line: Optional[float] = None
+
+    def update(self, close: float):
+        self.fast.update(close)
+        self.slow.update(close)
+        if self.fast.ready and self.slow.ready:
+            self.line = self.fast.ema - self.slow.ema
+            self.signal.update(self.line)
+
+    @property
+    def ready(self) -> bool:
+        return self.signal.ready
+
+    @property
+    def value(self) -> Optional[Tuple[float, float, float]]:
+        if not self.ready:
+            return None
+        return self.line, self.signal.ema, self.line - self.signal.ema
+
+class ATR:
+    """Wilder 平滑的平均真实波幅"""
+
+    inputs = ('high', 'low', 'close')
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.previous_close: Optional[float] = None
+        self.count = 0
+        self.tr_sum = 0.0  # 预热期间的累计值
+        self.atr: Optional[float] = None
+
+    def update(self, high: float, low: float, close: float):
+        tr = true_range(high, low, self.previous_close)
+        self.count += 1
+        if self.atr is not None:
+            self.atr = wilder_step(self.atr, tr, self.period)
+        elif self.count < self.period:
+            self.tr_sum += tr
+        else:
+            self.atr = (self.tr_sum + tr) / self.period
+        self.previous_close = close
+
+    @property
+    def ready(self) -> bool:
+        return self.atr is not None
+
+    @property
+    def value(self) -> Optional[float]:
+        return self.atr
+
+class VWAP:
+    """按时段累计的成交量加权平均价，典型价格为 (高+低+收)/3"""
+
+    inputs = ('ts', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, session: str = '1d'):
+        self.session = session
+        self.session_ms = timeframe_to_ms(session)
+        self.current_session: Optional[int] = None
+        self.pv_sum = 0.0
+        self.volume_sum = 0.0
+
+    def update(self, ts: float, high: float, low: float, close: float, volume: float):
+        session = int(ts) // self.session_ms
+        if session != self.current_session:
+            self.current_session = session
+            self.pv_sum = 0.0
+            self.volume_sum = 0.0
+        typical = (high + low + close) / 3
+        self.pv_sum += typical * volume
+        self.volume_sum += volume
+
+    @property
+    def ready(self) -> bool:
+        return self.volume_sum > 0
+
+    @property
+    def value(self) -> Optional[float]:
+        if not self.ready:
+            return None
+        return self.pv_sum / self.volume_sum
+
+INDICATORS = {
+    'atr': ATR,
+    'bollinger': BollingerBands,
+    'ema': EMA,
+    'macd': MACD,
+    'rsi': WilderRSI,
+    'sma': SMA,
+    'stats': RollingStats,
+    'vwap': VWAP,
+}
+
+# ---------- 共享引擎 ----------
+
+class SeriesIndicator:
+    """绑定到一个K线序列的指标，记录已经写入状态的最后一根K线"""
+
+    def __init__(self, symbol: str, timeframe: str, kind: str, params: Dict):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.kind = kind
+        self.params = dict(params)
+        self.step = timeframe_to_ms(timeframe)
+        self.indicator = INDICATORS[kind](**params)
+        self.last_ts: Optional[int] = None
+        self.latest_close: Optional[float] = None  # 最新一根（未收盘）K线的收盘价
+        self.lock = threading.Lock()
+
+    def reset(self):
+        self.indicator = INDICATORS[self.kind](**self.params)
+        self.last_ts = None
+
+    def sync(self, buffer) -> int:
+        """把缓冲区中新收盘的K线写入指标状态（最新一根视为未收盘）
+        Returns: 本次写入的K线数量
+        """
+        with self.lock:
+            limit = None
+            newest = buffer.last_ts
+            if self.last_ts is not None and newest is not None and newest >= self.last_ts:
+                # 只读取上次处理之后的K线（多取一根用于判断是否连续）
+                limit = (newest - self.last_ts) // self.step + 2
+            snapshot = buffer.snapshot(limit)
+            timestamps, closes = snapshot['ts'], snapshot['close']
+            start = 0
+            if self.last_ts is not None:
+                start = int(np.searchsorted(timestamps, self.last_ts, side='right'))
+                if start == 0:
+                    # 缓冲区被清空或与已处理的K线之间有断档，用缓冲区中的全部K线重新预热
+                    self.reset()
+                    if limit is not None:
+                        snapshot = buffer.snapshot()
+                        timestamps, closes = snapshot['ts'], snapshot['close']
+            closed = len(timestamps) - 1
+            if closed >= 0:
+                self.latest_close = float(closes[-1])
+            # 多数指标只需要收盘价，ATR/VWAP 等通过 inputs 声明需要的列
+            columns = [snapshot[name].tolist() for name in getattr(self.indicator, 'inputs', ('close',))]
+            for index in range(start, closed):
+                self.indicator.update(*(column[index] for column in columns))
+            if closed > start:
+                self.last_ts = int(timestamps[closed - 1])
+            return max(closed - start, 0)
+
+class IndicatorEngine:
+    """按 (symbol, timeframe, 指标, 参数) 共享的流式指标"""
+
+    def __init__(self):
+        self._indicators: Dict[Tuple, SeriesIndicator] = {}
+        self._lock = threading.Lock()
+
+    def get(self, symbol: str, timeframe: str, kind: str, **params) -> SeriesIndicator:
+        if kind not in INDICATORS:
+            raise ValueError(f"未知的指标: {kind}，可选 {list(INDICATORS)}")
+        key = (symbol, timeframe, kind, tuple(sorted(params.items())))
+        with self._lock:
+            series = self._indicators.get(key)
+            if series is None:
+                series = SeriesIndicator(symbol, timeframe, kind, params)
+                self._indicators[key] = series
+            return series
+
+    def update(self, buffer, symbol: str, timeframe: str, kind: str, **params) -> SeriesIndicator:
+        """取共享指标并用缓冲区中的新K线更新"""
+        series = self.get(symbol, timeframe, kind, **params)
+        series.sync(buffer)
+        return series
+
+_engine = IndicatorEngine()
+
+def get_indicator_engine() -> IndicatorEngine:
+    """进程内共享的指标引擎"""
+    return _engine
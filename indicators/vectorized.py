@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, Tuple
+import numpy as np
+from candle_store import timeframe_to_ms
+from indicators.streaming import ema_step, welford_add, welford_remove, wilder_step
+
+# 整段序列的技术指标（图表叠加、离线回测、批量评估）
+#
+# 一次计算整个序列，返回与输入等长的 float64 数组，预热期为 NaN。
+# 与 indicators.streaming 的结果逐位一致：
+#   - 逐元素运算（涨跌幅、真实波幅、典型价格、布林带上下轨、RSI 公式）用 NumPy 向量化，
+#     运算顺序与流式版本相同，IEEE 浮点结果一致；
+#   - 预热期的累计值和 VWAP 的时段累计用 np.cumsum（从左到右顺序累加，与流式逐个累加一致）；
+#   - Welford（SMA、布林带、stats）、EMA、Wilder 这类依赖上一步结果的递推没有逐位一致的数组算法，
+#     保留逐个递推，调用与流式版本相同的标量函数。
+
+def _as_array(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+def _seed_mean(values: np.ndarray, period: int) -> float:
+    """前 period 个值的均值（顺序累加，与流式版本的预热一致）"""
+    return float(np.cumsum(values[:period])[-1]) / period
+
+def rolling_mean_var(values, period: int) -> Tuple[np.ndarray, np.ndarray]:
+    """滚动窗口均值与总体方差（与 streaming.RollingStats 相同的 Welford 递推）"""
+    values = _as_array(values)
+    mean_out = np.full(len(values), np.nan)
+    m2_out = np.full(len(values), np.nan)
+    count, mean, m2 = 0, 0.0, 0.0
+    items = values.tolist()
+    for index, value in enumerate(items):
+        if index >= period:
+            count, mean, m2 = welford_remove(count, mean, m2, items[index - period])
+        count, mean, m2 = welford_add(count, mean, m2, value)
+        if count == period:
+            mean_out[index] = mean
+            m2_out[index] = m2
+    return mean_out, m2_out / period
+
+def sma(close, period: int) -> np.ndarray:
+    """简单移动平均（与 streaming.SMA 一致）"""
+    return rolling_mean_var(close, period)[0]
+
+def bollinger(close, period: int = 20, num_std: float = 2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """布林带: (中轨, 上轨, 下轨)"""
+    middle, variance = rolling_mean_var(close, period)
+    width = num_std * np.sqrt(variance)
+    return middle, middle + width, middle - width
+
+def ema(values, period: int) -> np.ndarray:
+    """指数移动平均（前 period 个值的均值作为初值）"""
+    values = _as_array(values)
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+    alpha = 2.0 / (period + 1)
+    current = _seed_mean(values, period)
+    out[period - 1] = current
+    for index, value in enumerate(values[period:].tolist(), start=period):
+        current = ema_step(current, value, alpha)
+        out[index] = current
+    return out
+
+def macd(close, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD: (MACD线, 信号线, 柱)"""
+    close = _as_array(close)
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = np.full(len(close), np.nan)
+    start = max(fast, slow) - 1
+    if len(close) > start:
+        signal_line[start:] = ema(line[start:], signal)
+    return line, signal_line, line - signal_line
+
+def _wilder(values: np.ndarray, period: int, offset: int, size: int) -> np.ndarray:
+    """Wilder 平滑，values[i] 对应输出位置 offset + i"""
+    out = np.full(size, np.nan)
+    if len(values) < period:
+        return out
+    current = _seed_mean(values, period)
+    out[offset + period - 1] = current
+    for index, value in enumerate(values[period:].tolist(), start=offset + period):
+        current = wilder_step(current, value, period)
+        out[index] = current
+    return out
+
+def rsi(close, period: int = 14) -> np.ndarray:
+    """Wilder 平滑的 RSI"""
+    close = _as_array(close)
+    changes = np.diff(close)
+    gains = np.where(changes > 0, changes, 0.0)
+    losses = np.where(changes < 0, -changes, 0.0)
+    avg_gain = _wilder(gains, period, 1, len(close))
+    avg_loss = _wilder(losses, period, 1, len(close))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = 100 - (100 / (1 + avg_gain / avg_loss))
+    return np.where(avg_loss == 0, 100.0, values)
+
+def atr(high, low, close, period: int = 14) -> np.ndarray:
+    """Wilder 平滑的平均真实波幅"""
+    high, low, close = _as_array(high), _as_array(low), _as_array(close)
+    ranges = high - low
+    if len(close) > 1:
+        previous = close[:-1]
+        ranges[1:] = np.maximum(np.maximum(ranges[1:], np.abs(high[1:] - previous)), np.abs(low[1:] - previous))
+    return _wilder(ranges, period, 0, len(close))
+
+def vwap(ts, high, low, close, volume, session: str = '1d') -> np.ndarray:
+    """按时段累计的成交量加权平均价"""
+    high, low, close, volume = _as_array(high), _as_array(low), _as_array(close), _as_array(volume)
+    sessions = np.asarray(ts, dtype=np.int64) // timeframe_to_ms(session)
+    typical = (high + low + close) / 3
+    weighted = typical * volume
+    pv_sum = _session_cumsum(weighted, sessions)
+    volume_sum = _session_cumsum(volume, sessions)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(volume_sum > 0, pv_sum / volume_sum, np.nan)
+
+def _session_cumsum(values: np.ndarray, sessions: np.ndarray) -> np.ndarray:
+    """每个时段从零开始的顺序累加
+
+    把各时段排成 (时段数, 最长时段) 的二维数组（末尾补零）后沿行 cumsum，
+    结果与逐段 np.cumsum 逐位一致；时段长度相差太大、补零过多时退回逐段计算。
+    """
+    n = len(values)
+    if n == 0:
+        return np.empty(0)
+    starts = np.r_[0, np.flatnonzero(np.diff(sessions)) + 1]
+    lengths = np.diff(np.r_[starts, n])
+    width = int(lengths.max())
+    if len(starts) * width > 4 * n:
+        out = np.empty(n)
+        for start, length in zip(starts, lengths):
+            out[start:start + length] = np.cumsum(values[start:start + length])
+        return out
+    # 时段在序列中连续排列，按行优先顺序写入掩码位置即可还原
+    mask = np.arange(width) < lengths[:, None]
+    grid = np.zeros((len(starts), width))
+    grid[mask] = values
+    return np.cumsum(grid, axis=1)[mask]
+
+def compute(kind: str, candles: Dict[str, np.ndarray], **params):
+    """按名称计算指标（名称与 indicators.streaming.INDICATORS 一致，stats 返回 (均值, 方差)）
+    Args:
+        candles: 包含 ts/open/high/low/close/volume 列的字典，例如 CandleRingBuffer.snapshot()
+    """
+    if kind == 'bollinger':
+        return bollinger(candles['close'], **params)
+    if kind == 'ema':
+        return ema(candles['close'], **params)
+    if kind == 'macd':
+        return macd(candles['close'], **params)
+    if kind == 'rsi':
+        return rsi(candles['close'], **params)
+    if kind == 'stats':
+        return rolling_mean_var(candles['close'], **params)
+    if kind == 'sma':
+        return sma(candles['close'], **params)
+    if kind == 'atr':
+        return atr(candles['high'], candles['low'], candles['close'], **params)
+    if kind == 'vwap':
+        return vwap(candles['ts'], candles['high'], candles['low'], candles['close'], candles['volume'], **params)
+    raise ValueError(f"未知的指标: {kind}")
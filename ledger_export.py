@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from database import ConnectionManager
+from migrations import migrate
+
+# 列式导出
+#
+# 将 trading_records 和余额流水增量导出为每列一个 .npy 文件：
+#   <export_dir>/<table>/part-<first_id>-<last_id>/<column>.npy
+# 每次导出只追加上次水位（id）之后的新行，水位保存在 <export_dir>/_state.json。
+# 读取时单个分区可以直接内存映射（零拷贝），compact_table() 可将多个分区合并为一个。
+
+# 表名 -> [(列名, dtype)]，字符串列使用定长 unicode，便于内存映射
+EXPORT_TABLES: Dict[str, List[Tuple[str, str]]] = {
+    'trading_records': [
+        ('id', 'int64'),
+        ('ts_ms', 'int64'),
+        ('account', 'str'),
+        ('symbol', 'str'),
+        ('action', 'str'),
+        ('amount', 'float64'),
+        ('price', 'float64'),
+        ('usdc_amount', 'float64'),
+        ('balance_before', 'float64'),
+        ('balance_after', 'float64'),
+        ('position_before', 'float64'),
+        ('position_after', 'float64'),
+        ('datetime', 'str'),
+        ('signal_reason', 'str'),
+    ],
+    'virtual_balance': [
+        ('id', 'int64'),
+        ('account', 'str'),
+        ('usdc_balance', 'float64'),
+        ('updated_at', 'str'),
+        ('reason', 'str'),
+    ],
+    'virtual_balance_checkpoints': [
+        ('id', 'int64'),
+        ('account', 'str'),
+        ('period_start', 'str'),
+        ('entries', 'int64'),
+        ('first_journal_id', 'int64'),
+        ('last_journal_id', 'int64'),
+        ('open_balance', 'float64'),
+        ('close_balance', 'float64'),
+        ('min_balance', 'float64'),
+        ('max_balance', 'float64'),
+    ],
+}
+
+STATE_FILE = '_state.json'
+
+def _load_state(export_dir: str) -> Dict[str, int]:
+    path = os.path.join(export_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_state(export_dir: str, state: Dict[str, int]):
+    path = os.path.join(export_dir, STATE_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _to_column(values: list, dtype: str) -> np.ndarray:
+    if dtype == 'str':
+        return np.array(['' if v is None else str(v) for v in values], dtype=str)
+    if dtype == 'int64':
+        return np.array([0 if v is None else v for v in values], dtype=np.int64)
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+def _write_partition(table_dir: str, columns: List[Tuple[str, str]], rows: list):
+    """将一批行写成一个分区（先写临时目录再原子重命名）"""
+    first_id, last_id = rows[0][0], rows[-1][0]
+    name = f'part-{first_id:012d}-{last_id:012d}'
+    tmp_dir = os.path.join(table_dir, f'.{name}.tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    for index, (column, dtype) in enumerate(columns):
+        np.save(os.path.join(tmp_dir, f'{column}.npy'), _to_column([row[index] for row in rows], dtype))
+    os.replace(tmp_dir, os.path.join(table_dir, name))
+
+def export_table(db: ConnectionManager, export_dir: str, table: str, state: Dict[str, int],
+                 partition_rows: int = 1_000_000) -> int:
+    """增量导出一张表
+    Returns: 导出的行数
+    """
+    columns = EXPORT_TABLES[table]
+    table_dir = os.path.join(export_dir, table)
+    os.makedirs(table_dir, exist_ok=True)
+
+    watermark = state.get(table, 0)
+    column_sql = ', '.join(column for column, _ in columns)
+    cursor = db.execute(f'SELECT {column_sql} FROM {table} WHERE id > ? ORDER BY id', (watermark,))
+
+    exported = 0
+    while True:
+        rows = cursor.fetchmany(partition_rows)
+        if not rows:
+            break
+        _write_partition(table_dir, columns, rows)
+        exported += len(rows)
+        # 每个分区写完就推进水位，中途失败时下次从断点继续
+        state[table] = rows[-1][0]
+        _save_state(export_dir, state)
+    return exported
+
+def export_all(db_path: str, export_dir: str, tables: Optional[List[str]] = None) -> Dict[str, int]:
+    """增量导出交易记录与余额流水
+    Returns: {表名: 本次导出行数}
+    """
+    db = ConnectionManager.get(db_path)
+    migrate(db)
+    os.makedirs(export_dir, exist_ok=True)
+    state = _load_state(export_dir)
+
+    results = {}
+    # 在同一个读事务中导出所有表，保证各表之间的一致性
+    conn = db.connection()
+    conn.execute('BEGIN')
+    try:
+        for table in tables or list(EXPORT_TABLES):
+            results[table] = export_table(db, export_dir, table, state)
+    finally:
+        conn.execute('COMMIT')
+    return results
+
+def list_partitions(export_dir: str, table: str) -> List[str]:
+    """按id顺序列出表的所有分区目录"""
+    table_dir = os.path.join(export_dir, table)
+    if not os.path.isdir(table_dir):
+        return []
+    return [os.path.join(table_dir, name) for name in sorted(os.listdir(table_dir))
+            if name.startswith('part-')]
+
+def _load_column(partition: str, column: str, dtype: str, mmap_mode: Optional[str]) -> np.ndarray:
+    path = os.path.join(partition, f'{column}.npy')
+    if os.path.exists(path):
+        return np.load(path, mmap_mode=mmap_mode)
+    # 旧版本导出的分区没有后来新增的列（例如 account），按默认值补齐
+    length = len(np.load(os.path.join(partition, 'id.npy'), mmap_mode='r'))
+    if column == 'account':
+        return np.full(length, 'default')
+    return _to_column([None] * length, dtype)
+
+def load_table(export_dir: str, table: str, columns: Optional[List[str]] = None,
+               mmap: bool = True) -> Dict[str, np.ndarray]:
+    """读取导出的表，返回 {列名: 数组}
+
+    只有一个分区时直接返回内存映射数组（零拷贝），多个分区时拼接。
+    """
+    columns = columns or [column for column, _ in EXPORT_TABLES[table]]
+    partitions = list_partitions(export_dir, table)
+    mmap_mode = 'r' if mmap else None
+
+    dtypes = dict(EXPORT_TABLES[table])
+    result = {}
+    for column in columns:
+        arrays = [_load_column(partition, column, dtypes[column], mmap_mode) for partition in partitions]
+        if not arrays:
+            result[column] = np.array([], dtype=str if dtypes[column] == 'str' else dtypes[column])
+        elif len(arrays) == 1:
+            result[column] = arrays[0]
+        else:
+            result[column] = np.concatenate(arrays)
+    return result
+
+def compact_table(export_dir: str, table: str) -> int:
+    """将表的多个分区合并为一个，之后的读取可以零拷贝
+    Returns: 合并前的分区数量
+    """
+    partitions = list_partitions(export_dir, table)
+    if len(partitions) <= 1:
+        return len(partitions)
+
+    data = load_table(export_dir, table, mmap=False)
+    first_id, last_id = int(data['id'][0]), int(data['id'][-1])
+    table_dir = os.path.join(export_dir, table)
+    name = f'part-{first_id:012d}-{last_id:012d}'
+    tmp_dir = os.path.join(table_dir, f'.{name}.tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    for column, values in data.items():
+        np.save(os.path.join(tmp_dir, f'{column}.npy'), values)
+    # 先放入合并后的分区再删除旧分区，中途失败不会丢数据
+    os.replace(tmp_dir, os.path.join(table_dir, name))
+    for partition in partitions:
+        shutil.rmtree(partition)
+    return len(partitions)
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, List, Optional
+import numpy as np
+from database import ConnectionManager
+from migrations import migrate
+
+# 账本一致性校验
+#
+# 用 trading_records 向量化重放出每个账户的余额和每个 (账户, 交易对) 的持仓，
+# 再与 virtual_balance_state / virtual_positions 中的当前状态比对。
+# 持仓数量和余额是前缀和，持仓成本是 c' = a*c + b 形式的线性递推
+# （买入 a=1, b=金额；卖出 a=剩余比例, b=0），统一用分段仿射扫描在 O(n log n) 的数组运算内完成，
+# 数百万笔交易也只需要几秒。
+
+TRADE_COLUMNS = ['id', 'account', 'symbol', 'action', 'amount', 'price', 'usdc_amount',
+                 'balance_before', 'balance_after', 'position_before', 'position_after']
+
+# 这些原因产生的余额流水来自交易，其它原因（INIT/SET/REPAIR）视为外部调整
+TRADE_REASONS = ('BUY', 'SELL')
+
+def load_trades(db: ConnectionManager, accounts: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """按 id 顺序读取交易记录，返回 {列名: 数组}"""
+    where, params = '', ()
+    if accounts:
+        where = f"WHERE account IN ({', '.join('?' * len(accounts))})"
+        params = tuple(accounts)
+
+    numeric = db.execute(f'''
+        SELECT id, action = 'BUY', amount, price, usdc_amount,
+               balance_before, balance_after, position_before, position_after
+        FROM trading_records {where} ORDER BY id
+    ''', params).fetchall()
+    labels = db.execute(f'SELECT account, symbol FROM trading_records {where} ORDER BY id', params).fetchall()
+
+    values = np.array(numeric, dtype=np.float64).reshape(-1, 9)
+    names = np.array(labels, dtype=str).reshape(-1, 2)
+    return {
+        'id': values[:, 0].astype(np.int64),
+        'account': names[:, 0],
+        'symbol': names[:, 1],
+        'is_buy': values[:, 1].astype(bool),
+        'amount': values[:, 2],
+        'price': values[:, 3],
+        'usdc_amount': values[:, 4],
+        'balance_before': values[:, 5],
+        'balance_after': values[:, 6],
+        'position_before': values[:, 7],
+        'position_after': values[:, 8],
+    }
+
+def load_trades_from_export(export_dir: str, accounts: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """从 ledger_export 的列式导出读取交易记录（内存映射，适合超大历史）"""
+    from ledger_export import load_table
+    data = load_table(export_dir, 'trading_records', TRADE_COLUMNS)
+    trades = {column: np.asarray(values) for column, values in data.items()}
+    trades['is_buy'] = trades.pop('action') == 'BUY'
+    if accounts:
+        mask = np.isin(trades['account'], accounts)
+        trades = {column: values[mask] for column, values in trades.items()}
+    order = np.argsort(trades['id'], kind='stable')
+    return {column: values[order] for column, values in trades.items()}
+
+def _segmented_affine_scan(a: np.ndarray, b: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """分段计算 x_i = a_i * x_{i-1} + b_i（每段从 x = 0 开始）
+
+    Hillis-Steele 前缀扫描：仿射变换可结合，log2(n) 轮整体数组运算即可，
+    不需要逐行的 Python 循环。
+    """
+    a = a.astype(np.float64, copy=True)
+    b = b.astype(np.float64, copy=True)
+    flags = starts.copy()
+    step = 1
+    n = len(a)
+    while step < n:
+        # 与 step 之前的部分结果合并，遇到段首则停止向前合并
+        merge = ~flags[step:]
+        new_a = np.where(merge, a[:-step] * a[step:], a[step:])
+        new_b = np.where(merge, b[:-step] * a[step:] + b[step:], b[step:])
+        flags[step:] = flags[step:] | flags[:-step]
+        a[step:] = new_a
+        b[step:] = new_b
+        step *= 2
+    return b
+
+def _group_bounds(keys: List[np.ndarray]):
+    """对已排序的键返回 (段首标记, 段首下标, 段尾下标)"""
+    n = len(keys[0])
+    starts = np.zeros(n, dtype=bool)
+    if n:
+        starts[0] = True
+        for key in keys:
+            starts[1:] |= key[1:] != key[:-1]
+    first = np.flatnonzero(starts)
+    last = np.r_[first[1:] - 1, n - 1] if n else first
+    return starts, first, last
+
+def _mismatch(actual: np.ndarray, expected: np.ndarray, tolerance: float) -> np.ndarray:
+    return ~np.isclose(actual, expected, rtol=1e-9, atol=tolerance)
+
+def replay_trades(trades: Dict[str, np.ndarray], tolerance: float = 1e-6) -> Dict:
+    """向量化重放交易记录
+    Returns: {
+        'arithmetic_errors': 单笔交易前后数值不自洽的交易 id 数组,
+        'positions': {(账户, 交易对): {...}},
+        'balances': {账户: {...}},
+    }
+    """
+    is_buy = trades['is_buy']
+    sign = np.where(is_buy, 1.0, -1.0)
+    amount = trades['amount']
+    usdc = trades['usdc_amount']
+    cash_delta = np.where(is_buy, -usdc, usdc)
+
+    # 1. 单笔交易自洽：余额/持仓变化量与成交数量、金额一致
+    bad = (_mismatch(trades['balance_after'], trades['balance_before'] + cash_delta, tolerance)
+           | _mismatch(trades['position_after'], trades['position_before'] + sign * amount, tolerance)
+           | _mismatch(usdc, amount * trades['price'], tolerance))
+    result = {'arithmetic_errors': trades['id'][bad], 'positions': {}, 'balances': {}}
+    if len(amount) == 0:
+        return result
+
+    # 2. 持仓: 按 (账户, 交易对, id) 分组重放
+    order = np.lexsort((trades['id'], trades['symbol'], trades['account']))
+    account, symbol = trades['account'][order], trades['symbol'][order]
+    starts, first, last = _group_bounds([account, symbol])
+
+    position_delta = (sign * amount)[order]
+    position_before = trades['position_before'][order]
+    position = _segmented_affine_scan(np.ones_like(position_delta), position_delta, starts)
+    position += np.repeat(position_before[first], np.diff(np.r_[first, len(order)]))
+    replayed_before = position - position_delta
+
+    # 持仓只会因交易变化，前后两笔交易衔接不上说明有记录丢失或被修改
+    chain_break = np.zeros(len(order), dtype=bool)
+    chain_break[1:] = _mismatch(position_before[1:], trades['position_after'][order][:-1], tolerance)
+    chain_break &= ~starts
+    breaks = np.add.reduceat(chain_break.astype(np.int64), first)
+
+    # 成本: 买入累加金额，卖出按剩余比例缩减（与 plan_sell 相同）
+    sell_ratio = np.divide(position, replayed_before, out=np.zeros_like(position), where=replayed_before > 0)
+    cost_a = np.where(is_buy[order], 1.0, sell_ratio)
+    cost_b = np.where(is_buy[order], usdc[order], 0.0)
+    total_cost = _segmented_affine_scan(cost_a, cost_b, starts)
+
+    for i, (start, end) in enumerate(zip(first, last)):
+        final_position = float(position[end])
+        final_cost = float(total_cost[end]) if final_position > 0 else 0.0
+        result['positions'][(str(account[start]), str(symbol[start]))] = {
+            'trades': int(end - start + 1),
+            'position_size': final_position,
+            'total_cost': final_cost,
+            'avg_price': final_cost / final_position if final_position > 0 else 0.0,
+            'chain_breaks': int(breaks[i]),
+        }
+
+    # 3. 余额: 按 (账户, id) 分组重放，交易之间的余额跳变视为外部调整（如 balance.py set）
+    order = np.lexsort((trades['id'], trades['account']))
+    account = trades['account'][order]
+    starts, first, last = _group_bounds([account])
+
+    balance_before = trades['balance_before'][order]
+    balance_after = trades['balance_after'][order]
+    gap = np.zeros(len(order))
+    gap[1:] = balance_before[1:] - balance_after[:-1]
+    gap[starts] = 0.0
+    adjusted = _mismatch(gap, np.zeros_like(gap), tolerance)
+    gap[~adjusted] = 0.0
+
+    balance = _segmented_affine_scan(np.ones_like(gap), cash_delta[order] + gap, starts)
+    adjustments = np.add.reduceat(adjusted.astype(np.int64), first)
+    adjustment_total = np.add.reduceat(gap, first)
+
+    for i, (start, end) in enumerate(zip(first, last)):
+        result['balances'][str(account[start])] = {
+            'trades': int(end - start + 1),
+            'last_trade_id': int(trades['id'][order][end]),
+            'usdc_balance': float(balance_before[start] + balance[end]),
+            'adjustments': int(adjustments[i]),
+            'adjustment_total': float(adjustment_total[i]),
+        }
+    return result
+
+def verify_ledger(db_path: str, accounts: Optional[List[str]] = None, tolerance: float = 1e-6,
+                  export_dir: Optional[str] = None) -> Dict:
+    """校验数据库中的当前余额和持仓是否与交易记录重放结果一致
+    Args:
+        accounts: 只校验这些账户，默认为数据库中的全部账户
+        export_dir: 从列式导出读取交易记录（需先执行 cmd/export_ledger.py）
+    Returns: {
+        'trades': 重放的交易笔数,
+        'arithmetic_errors': [交易id],
+        'positions': [{account, symbol, expected_*, actual_*, drift, ...}],
+        'balances': [{account, expected_balance, actual_balance, drift, ...}],
+        'ok': 是否全部一致,
+    }
+    """
+    db = ConnectionManager.get(db_path)
+    migrate(db)
+
+    # 在同一个读事务中读取交易记录和当前状态，避免校验期间的写入造成误报
+    conn = db.connection()
+    conn.execute('BEGIN')
+    try:
+        if export_dir:
+            trades = load_trades_from_export(export_dir, accounts)
+        else:
+            trades = load_trades(db, accounts)
+
+        state_balances = {account: balance for account, balance in
+                          db.execute('SELECT account, usdc_balance FROM virtual_balance_state')}
+        state_positions = {(account, symbol): (size, avg_price, total_cost)
+                           for account, symbol, size, avg_price, total_cost in db.execute('''
+                               SELECT account, symbol, position_size, avg_price, total_cost FROM virtual_positions
+                           ''')}
+        # 每个账户最新的一条余额流水，用于判断最后一笔交易之后是否还有外部调整
+        latest_journal = {account: (balance, reason) for account, balance, reason in db.execute('''
+            SELECT account, usdc_balance, reason FROM virtual_balance
+            WHERE id IN (SELECT MAX(id) FROM virtual_balance GROUP BY account)
+        ''')}
+        # 流水压缩（compact_balance_journal）后，每个账户最新检查点的收盘余额
+        latest_checkpoint = {account: balance for account, balance in db.execute('''
+            SELECT account, close_balance FROM virtual_balance_checkpoints
+            WHERE last_journal_id IN (SELECT MAX(last_journal_id) FROM virtual_balance_checkpoints GROUP BY account)
+        ''')}
+    finally:
+        conn.execute('COMMIT')
+
+    if accounts:
+        state_balances = {a: b for a, b in state_balances.items() if a in accounts}
+        state_positions = {k: v for k, v in state_positions.items() if k[0] in accounts}
+
+    replay = replay_trades(trades, tolerance)
+    report = {
+        'trades': len(trades['id']),
+        'arithmetic_errors': [int(trade_id) for trade_id in replay['arithmetic_errors']],
+        'positions': [],
+        'balances': [],
+    }
+
+    for key in sorted(set(replay['positions']) | set(state_positions)):
+        expected = replay['positions'].get(key, {'trades': 0, 'position_size': 0.0, 'total_cost': 0.0,
+                                                 'avg_price': 0.0, 'chain_breaks': 0})
+        actual_size, actual_avg, actual_cost = state_positions.get(key, (0.0, 0.0, 0.0))
+        drift = actual_size - expected['position_size']
+        cost_drift = actual_cost - expected['total_cost']
+        report['positions'].append({
+            'account': key[0],
+            'symbol': key[1],
+            'trades': expected['trades'],
+            'chain_breaks': expected['chain_breaks'],
+            'expected_position': expected['position_size'],
+            'actual_position': actual_size,
+            'drift': drift,
+            'expected_total_cost': expected['total_cost'],
+            'actual_total_cost': actual_cost,
+            'cost_drift': cost_drift,
+            'expected_avg_price': expected['avg_price'],
+            'ok': bool(expected['chain_breaks'] == 0
+                       and np.isclose(actual_size, expected['position_size'], rtol=1e-9, atol=tolerance)
+                       and np.isclose(actual_cost, expected['total_cost'], rtol=1e-9, atol=tolerance)),
+        })
+
+    for account in sorted(set(replay['balances']) | set(state_balances)):
+        replayed = replay['balances'].get(account)
+        actual = state_balances.get(account)
+        journal_balance, journal_reason = latest_journal.get(account, (None, None))
+
+        checkpoint_balance = latest_checkpoint.get(account) if journal_reason is None else None
+        if checkpoint_balance is not None:
+            # 流水已全部压缩为检查点，不知道最后一条流水的原因：
+            # 与重放一致说明最后是交易，否则最后一笔交易之后余额被外部设置过，以检查点为准
+            if replayed is not None and np.isclose(replayed['usdc_balance'], checkpoint_balance,
+                                                   rtol=1e-9, atol=tolerance):
+                expected, source = replayed['usdc_balance'], 'trades'
+            else:
+                expected, source = checkpoint_balance, 'checkpoint'
+        elif replayed is not None and journal_reason in (None, *TRADE_REASONS):
+            expected, source = replayed['usdc_balance'], 'trades'
+        elif journal_balance is not None:
+            # 最后一笔交易之后余额被外部设置过（INIT/SET/REPAIR），以流水为准
+            expected, source = journal_balance, 'journal'
+        else:
+            expected, source = actual, 'state'
+
+        drift = (actual - expected) if actual is not None and expected is not None else None
+        report['balances'].append({
+            'account': account,
+            'trades': replayed['trades'] if replayed else 0,
+            'adjustments': replayed['adjustments'] if replayed else 0,
+            'adjustment_total': replayed['adjustment_total'] if replayed else 0.0,
+            'expected_balance': expected,
+            'actual_balance': actual,
+            'drift': drift,
+            'source': source,
+            'ok': drift is not None and bool(np.isclose(actual, expected, rtol=1e-9, atol=tolerance)),
+        })
+
+    report['ok'] = (not report['arithmetic_errors']
+                    and all(item['ok'] for item in report['positions'])
+                    and all(item['ok'] for item in report['balances']))
+    return report
+
+def repair_ledger(db_path: str, report: Dict) -> int:
+    """按校验报告中的重放结果修复当前余额和持仓
+    Returns: 修复的记录数
+    """
+    from trading import VirtualTrader
+
+    db = ConnectionManager.get(db_path)
+    traders = {}
+    def trader_for(account: str) -> 'VirtualTrader':
+        if account not in traders:
+            traders[account] = VirtualTrader(db_path, async_journal=False, account=account)
+        return traders[account]
+
+    repaired = 0
+    with db.transaction():
+        for item in report['positions']:
+            if item['ok'] or item['chain_breaks']:
+                # 交易记录本身不连续时无法确定正确持仓，只报告不修复
+                continue
+            trader_for(item['account']).update_position(item['symbol'], item['expected_position'],
+                                                        item['expected_avg_price'], item['expected_total_cost'])
+            repaired += 1
+        for item in report['balances']:
+            if item['ok'] or item['expected_balance'] is None:
+                continue
+            trader_for(item['account']).update_balance(item['expected_balance'], reason='REPAIR')
+            repaired += 1
+    return repaired
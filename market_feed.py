@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+from candle_buffer import get_candle_buffer
+from candle_store import timeframe_to_ms
+
+# websockets 为可选依赖，未安装时机器人继续使用 REST 轮询
+try:
+    import websockets
+    HAS_WEBSOCKETS = True
+except ImportError:
+    HAS_WEBSOCKETS = False
+
+# OKX 行情推送
+#
+# tickers/trades 频道在 /ws/v5/public，K线频道在 /ws/v5/business。
+# 推送的数据保存在内存中：最新行情、最近成交，K线直接写入 candle_buffer 中的环形缓冲区，
+# 与 TradingFramework.fetch_market_snapshot 使用同一份数据。断线后按指数退避重连，
+# 重连成功后用 REST 补齐断线期间缺失的K线。
+
+OKX_WS_URLS = {
+    'public': 'wss://ws.okx.com:8443/ws/v5/public',
+    'business': 'wss://ws.okx.com:8443/ws/v5/business',
+}
+OKX_WS_SANDBOX_URLS = {
+    'public': 'wss://wspap.okx.com:8443/ws/v5/public?brokerId=9999',
+    'business': 'wss://wspap.okx.com:8443/ws/v5/business?brokerId=9999',
+}
+
+# 频道 -> 所在的连接
+CHANNEL_ENDPOINTS = {
+    'tickers': 'public',
+    'trades': 'public',
+    'candles': 'business',
+}
+
+def to_inst_id(symbol: str) -> str:
+    """ccxt 交易对转换为 OKX instId，例如 BTC/USDT -> BTC-USDT，BTC/USDT:USDT -> BTC-USDT-SWAP"""
+    if ':' in symbol:
+        return symbol.split(':')[0].replace('/', '-') + '-SWAP'
+    return symbol.replace('/', '-')
+
+def to_candle_channel(timeframe: str) -> str:
+    """K线周期转换为 OKX 频道名，例如 1m -> candle1m，1h -> candle1H"""
+    amount, unit = timeframe[:-1], timeframe[-1]
+    if unit in ('h', 'd', 'w'):
+        unit = unit.upper()
+    return f'candle{amount}{unit}'
+
+class MarketFeed:
+    """OKX WebSocket 行情推送，在后台线程的事件循环中运行"""
+
+    def __init__(self, symbols: List[str], timeframes: Optional[List[str]] = None,
+                 channels: Optional[List[str]] = None, urls: Optional[Dict[str, str]] = None,
+                 exchange=None, record_path: Optional[str] = None):
+        from config import Config
+        market_config = Config.get_market_data_config()
+        if urls is None:
+            sandbox = Config.get_okx_config().get('sandbox')
+            urls = dict(OKX_WS_SANDBOX_URLS if sandbox else OKX_WS_URLS)
+            urls.update(market_config.get('feed_urls') or {})
+
+        self.symbols = list(symbols)
+        self.timeframes = list(timeframes or ['1m'])
+        self.channels = list(channels or market_config['feed_channels'])
+        self.urls = urls
+        self.exchange = exchange  # 用于重连后REST补齐K线，可为 None
+        self.record_path = record_path if record_path is not None else market_config.get('feed_record_path')
+        self.reconnect_max_delay = market_config['feed_reconnect_max_delay']
+        self.stale_after = market_config['feed_stale_after']
+        self.ping_interval = market_config['feed_ping_interval']
+
+        self.tickers: Dict[str, Dict] = {}
+        self.trades: Dict[str, deque] = {symbol: deque(maxlen=1000) for symbol in self.symbols}
+        self._inst_symbols = {to_inst_id(symbol): symbol for symbol in self.symbols}
+        self._channel_timeframes = {to_candle_channel(timeframe): timeframe for timeframe in self.timeframes}
+        self._last_message: Dict[Tuple[str, str], float] = {}  # (channel, symbol) -> 最后收到推送的时间
+        self._connected: Dict[str, bool] = {}
+        self._listeners: List[Callable[[str, str, Dict], None]] = []
+        # 收盘K线计数：wait_for_update 返回后、下次调用前收盘的K线不会被遗漏
+        self._update_cond = threading.Condition()
+        self._update_seq = 0
+        self._seen_seq = 0
+        self._record_file = None
+        self._record_start = None
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.logger = logging.getLogger("market_feed")
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        """在后台线程中启动推送连接"""
+        if not HAS_WEBSOCKETS:
+            raise RuntimeError("未安装 websockets，无法启动行情推送: pip install websockets")
+        if self._thread is not None:
+            return
+        if self.record_path:
+            self._record_file = open(self.record_path, 'a', encoding='utf-8')
+            self._record_start = time.monotonic()
+        self._stopping = False
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="market-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """断开连接并停止后台线程"""
+        self._stopping = True
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._cancel_tasks)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        if self._record_file is not None:
+            self._record_file.close()
+            self._record_file = None
+
+    def _cancel_tasks(self):
+        for task in asyncio.all_tasks(self._loop):
+            task.cancel()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        tasks = []
+        for endpoint, args in self._subscriptions().items():
+            tasks.append(self._run_endpoint(endpoint, args))
+        try:
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        finally:
+            self._loop.close()
+
+    def _subscriptions(self) -> Dict[str, List[Dict[str, str]]]:
+        """按连接分组的订阅参数"""
+        subscriptions: Dict[str, List[Dict[str, str]]] = {}
+        for channel in self.channels:
+            endpoint = CHANNEL_ENDPOINTS[channel]
+            for symbol in self.symbols:
+                inst_id = to_inst_id(symbol)
+                if channel == 'candles':
+                    for timeframe in self.timeframes:
+                        subscriptions.setdefault(endpoint, []).append(
+                            {'channel': to_candle_channel(timeframe), 'instId': inst_id})
+                else:
+                    subscriptions.setdefault(endpoint, []).append({'channel': channel, 'instId': inst_id})
+        return subscriptions
+
+    # ---------- 连接与重连 ----------
+
+    async def _run_endpoint(self, endpoint: str, args: List[Dict[str, str]]):
+        delay = 1.0
+        first_connect = True
+        while not self._stopping:
+            try:
+                async with websockets.connect(self.urls[endpoint], ping_interval=None,
+                                              open_timeout=10, close_timeout=2) as ws:
+                    await ws.send(json.dumps({'op': 'subscribe', 'args': args}))
+                    self._connected[endpoint] = True
+                    self.logger.info(f"行情推送已连接: {endpoint}")
+                    delay = 1.0
+                    if not first_connect:
+                        # 先订阅再补齐，补齐期间推送的数据不会丢失
+                        await self._loop.run_in_executor(None, self.resync)
+                    first_connect = False
+                    await self._read_messages(endpoint, ws)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.logger.warning(f"行情推送连接 {endpoint} 断开: {e}")
+            finally:
+                self._connected[endpoint] = False
+
+            if self._stopping:
+                break
+            # 指数退避加随机抖动，避免多个客户端同时重连
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            delay = min(delay * 2, self.reconnect_max_delay)
+
+    async def _read_messages(self, endpoint: str, ws):
+        while not self._stopping:
+            try:
+                raw = await asyncio.wait_for(ws.recv(), timeout=self.ping_interval)
+            except asyncio.TimeoutError:
+                # OKX 要求30秒内有数据往来，空闲时发送 ping
+                await ws.send('ping')
+                raw = await asyncio.wait_for(ws.recv(), timeout=self.ping_interval)
+            if raw == 'pong':
+                continue
+            self._record(endpoint, raw)
+            try:
+                self.handle_message(json.loads(raw))
+            except Exception as e:
+                self.logger.error(f"处理行情推送失败: {e}")
+
+    def _record(self, endpoint: str, raw: str):
+        """把原始推送追加到录制文件，供 ReplayWebSocketServer 回放"""
+        if self._record_file is None:
+            return
+        offset = time.monotonic() - self._record_start
+        self._record_file.write(json.dumps({'t': round(offset, 3), 'endpoint': endpoint, 'msg': raw},
+                                           ensure_ascii=False) + '\n')
+        self._record_file.flush()
+
+    def resync(self):
+        """通过 REST 补齐断线期间缺失的K线和行情"""
+        if self.exchange is None:
+            return
+        for symbol in self.symbols:
+            for timeframe in self.timeframes:
+                try:
+                    self._resync_candles(symbol, timeframe)
+                except Exception as e:
+                    self.logger.error(f"补齐K线 {symbol} {timeframe} 失败: {e}")
+            if 'tickers' in self.channels:
+                try:
+                    ticker = self.exchange.fetch_ticker(symbol)
+                    self.tickers[symbol] = {'last': ticker['last'], 'bid': ticker.get('bid'),
+                                            'ask': ticker.get('ask'), 'ts': ticker.get('timestamp')}
+                except Exception as e:
+                    self.logger.error(f"补齐行情 {symbol} 失败: {e}")
+
+    def _resync_candles(self, symbol: str, timeframe: str):
+        """补齐一个K线序列：缺口小于缓冲区容量时从最后一根向后分页获取，否则重新获取最近 capacity 根"""
+        buffer = get_candle_buffer(symbol, timeframe)
+        step = timeframe_to_ms(timeframe)
+        now_ms = int(time.time() * 1000)
+        last_ts = buffer.last_ts
+        if last_ts is None or (now_ms - last_ts) // step + 1 >= buffer.capacity:
+            candles = self.exchange.fetch_ohlcv(symbol, timeframe, limit=buffer.capacity)
+            if candles:
+                buffer.clear()
+                buffer.extend(candles)
+            return
+
+        current_ts = now_ms // step * step  # 当前（未收盘）K线的开盘时间
+        since = last_ts
+        while since < current_ts:
+            candles = self.exchange.fetch_ohlcv(symbol, timeframe, since=since,
+                                                limit=min((current_ts - since) // step + 1, buffer.capacity))
+            candles = [candle for candle in candles if candle[0] >= since]
+            if not candles:
+                break
+            if candles[0][0] > since + step:
+                # 交易所已经没有衔接处的K线，无法补成连续序列，丢弃旧数据
+                self.logger.warning(f"补齐K线 {symbol} {timeframe} 时仍有断档，重新填充缓冲区")
+                buffer.clear()
+            buffer.extend(candles)
+            if candles[-1][0] <= since:
+                break
+            since = candles[-1][0]
+
+    # ---------- 消息处理 ----------
+
+    def handle_message(self, message: Dict):
+        """处理一条推送消息（订阅确认、错误或数据）"""
+        if 'event' in message:
+            if message['event'] == 'error':
+                self.logger.error(f"行情推送错误: {message.get('code')} {message.get('msg')}")
+            return
+        arg = message.get('arg') or {}
+        channel = arg.get('channel', '')
+        symbol = self._inst_symbols.get(arg.get('instId'))
+        if symbol is None:
+            return
+        self._last_message[(channel, symbol)] = time.monotonic()
+
+        for item in message.get('data', []):
+            if channel == 'tickers':
+                ticker = {
+                    'last': float(item['last']),
+                    'bid': float(item['bidPx']) if item.get('bidPx') else None,
+                    'ask': float(item['askPx']) if item.get('askPx') else None,
+                    'ts': int(item['ts']),
+                }
+                self.tickers[symbol] = ticker
+                self._notify('ticker', symbol, ticker)
+            elif channel == 'trades':
+                trade = {'id': item.get('tradeId'), 'price': float(item['px']), 'amount': float(item['sz']),
+                         'side': item.get('side'), 'ts': int(item['ts'])}
+                self.trades[symbol].append(trade)
+                self._notify('trade', symbol, trade)
+            elif channel in self._channel_timeframes:
+                timeframe = self._channel_timeframes[channel]
+                candle = [int(item[0]), float(item[1]), float(item[2]), float(item[3]),
+                          float(item[4]), float(item[5])]
+                get_candle_buffer(symbol, timeframe).append(candle)
+                closed = len(item) > 8 and item[8] == '1'
+                self._notify('candle', symbol, {'timeframe': timeframe, 'candle': candle, 'closed': closed})
+                if closed:
+                    # K线收盘时唤醒等待中的交易循环
+                    with self._update_cond:
+                        self._update_seq += 1
+                        self._update_cond.notify_all()
+
+    def _notify(self, kind: str, symbol: str, data: Dict):
+        for listener in self._listeners:
+            try:
+                listener(kind, symbol, data)
+            except Exception as e:
+                self.logger.error(f"行情推送回调出错: {e}")
+
+    # ---------- 对外接口 ----------
+
+    def add_listener(self, callback: Callable[[str, str, Dict], None]):
+        """注册推送回调 callback(kind, symbol, data)，kind 为 ticker/trade/candle，在推送线程中调用"""
+        self._listeners.append(callback)
+
+    def wait_for_update(self, timeout: Optional[float] = None) -> bool:
+        """等待下一根K线收盘（上次返回之后已经有K线收盘时立即返回）
+        Returns: 是否在超时前收到收盘K线
+        """
+        with self._update_cond:
+            updated = self._update_cond.wait_for(lambda: self._update_seq != self._seen_seq, timeout)
+            self._seen_seq = self._update_seq
+            return updated
+
+    def is_connected(self) -> bool:
+        endpoints = {CHANNEL_ENDPOINTS[channel] for channel in self.channels}
+        return all(self._connected.get(endpoint) for endpoint in endpoints)
+
+    def is_live(self, symbol: str, timeframe: Optional[str] = None) -> bool:
+        """连接正常且最近收到过推送时返回 True（timeframe 为空时检查行情频道）"""
+        if timeframe is None:
+            channel, endpoint = 'tickers', 'public'
+        else:
+            channel, endpoint = to_candle_channel(timeframe), 'business'
+            if timeframe not in self.timeframes:
+                return False
+        if not self._connected.get(endpoint):
+            return False
+        last = self._last_message.get((channel, symbol))
+        return last is not None and time.monotonic() - last < self.stale_after
+
+    def get_ticker(self, symbol: str) -> Optional[Dict]:
+        return self.tickers.get(symbol)
+
+    def get_trades(self, symbol: str, limit: int = 100) -> List[Dict]:
+        return list(self.trades.get(symbol, []))[-limit:]
+
+class ReplayWebSocketServer:
+    """本地 WebSocket 替身服务器，回放 MarketFeed 录制的推送（用于测试和离线调试）
+
+    客户端连接 ws://host:port/ws/v5/public 或 /ws/v5/business 并发送订阅后，
+    按录制时的时间间隔（除以 speed）回放对应连接的消息。
+    """
+
+    def __init__(self, record_path: str, host: str = '127.0.0.1', port: int = 0,
+                 speed: float = 1.0, close_after_replay: bool = False):
+        if not HAS_WEBSOCKETS:
+            raise RuntimeError("未安装 websockets: pip install websockets")
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.close_after_replay = close_after_replay
+        self.messages: Dict[str, List[Tuple[float, str]]] = {}
+        with open(record_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    self.messages.setdefault(item['endpoint'], []).append((item['t'], item['msg']))
+        self.connections = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._server = None
+        self._started = threading.Event()
+
+    def url(self, endpoint: str) -> str:
+        return f'ws://{self.host}:{self.port}/ws/v5/{endpoint}'
+
+    def urls(self) -> Dict[str, str]:
+        return {endpoint: self.url(endpoint) for endpoint in ('public', 'business')}
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="replay-ws-server", daemon=True)
+        self._thread.start()
+        self._started.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+
+        async def main():
+            self._server = await websockets.serve(self._handle, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+            self._started.set()
+            await self._server.wait_closed()
+
+        self._loop.run_until_complete(main())
+        self._loop.close()
+
+    async def _handle(self, ws, path: Optional[str] = None):
+        self.connections += 1
+        if path is None:
+            path = ws.request.path
+        endpoint = path.rstrip('/').split('/')[-1].split('?')[0]
+
+        subscribe = json.loads(await ws.recv())
+        for arg in subscribe.get('args', []):
+            await ws.send(json.dumps({'event': 'subscribe', 'arg': arg}))
+
+        async def answer_pings():
+            async for message in ws:
+                if message == 'ping':
+                    await ws.send('pong')
+
+        pinger = asyncio.ensure_future(answer_pings())
+        try:
+            previous = None
+            for offset, message in self.messages.get(endpoint, []):
+                if previous is not None and self.speed > 0:
+                    await asyncio.sleep(max(0.0, offset - previous) / self.speed)
+                previous = offset
+                await ws.send(message)
+            if self.close_after_replay:
+                await ws.close()
+            else:
+                await pinger
+        except Exception:
+            pass
+        finally:
+            pinger.cancel()
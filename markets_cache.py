@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+# 交易所市场信息（交易对、精度、限制等）的磁盘缓存
+#
+# ccxt 在第一次真正需要市场信息时（下单、获取K线等）才调用 load_markets，
+# 这是一次较重的网络请求。缓存有效时直接用 set_markets 填充，不发起请求；
+# 缓存过期或不存在时由 ccxt 正常加载，加载结果写回缓存供其它进程使用。
+
+logger = logging.getLogger("markets_cache")
+
+def cache_key(exchange) -> str:
+    """缓存键：交易所 + 是否沙盒 + 默认合约类型，不同配置的市场信息不能混用"""
+    sandbox = bool(getattr(exchange, 'isSandboxModeEnabled', False))
+    default_type = exchange.options.get('defaultType', 'spot')
+    return f"{exchange.id}:{'sandbox' if sandbox else 'live'}:{default_type}"
+
+def read_markets_cache(path: str, key: str, ttl: float) -> Optional[Dict]:
+    """读取未过期的缓存
+    Returns: {'markets': ..., 'currencies': ...}，缓存无效时返回 None
+    """
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError) as e:
+        if os.path.exists(path):
+            logger.warning(f"市场信息缓存读取失败，将重新加载: {e}")
+        return None
+    if cached.get('key') != key or not cached.get('markets'):
+        return None
+    return cached
+
+def write_markets_cache(path: str, key: str, markets: Dict, currencies: Optional[Dict]):
+    """写入缓存（先写临时文件再替换，并发读取的进程不会读到半个文件）"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump({'key': key, 'saved_at': time.time(), 'markets': markets,
+                       'currencies': currencies}, f, default=str)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"市场信息缓存写入失败: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def install_markets_cache(exchange, path: Optional[str] = None, ttl: Optional[float] = None) -> bool:
+    """为 ccxt 交易所对象启用市场信息缓存（不发起网络请求）
+
+    缓存有效时立即 set_markets；并替换该对象的 load_markets，
+    之后 ccxt 内部触发的真实加载会把结果写回缓存。
+    Returns: 是否命中缓存
+    """
+    from config import Config
+    market_config = Config.get_market_data_config()
+    path = path or market_config['markets_cache_path']
+    ttl = market_config['markets_cache_ttl'] if ttl is None else ttl
+    if not path:
+        return False
+
+    key = cache_key(exchange)
+    cached = read_markets_cache(path, key, ttl)
+    if cached is not None:
+        exchange.set_markets(list(cached['markets'].values()), cached.get('currencies'))
+
+    load_markets = exchange.load_markets
+
+    def cached_load_markets(reload=False, params={}):
+        if exchange.markets and not reload:
+            return load_markets(reload, params)
+        markets = load_markets(reload, params)
+        write_markets_cache(path, key, exchange.markets, exchange.currencies)
+        return markets
+    exchange.load_markets = cached_load_markets
+    return cached is not None
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+from typing import Callable, List, Tuple
+from database import ConnectionManager
+
+# 数据库迁移
+#
+# 每个迁移对应一个版本号，已应用的版本记录在 PRAGMA user_version 中。
+# 迁移必须可以在旧版本（未记录版本号）的数据库上安全重放。
+# database_schema.sql 是迁移全部执行后的结构参考，新增迁移时同步更新。
+
+def _v1_base_tables(cursor: sqlite3.Cursor):
+    """基础表: 余额、交易记录、持仓"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS virtual_balance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usdc_balance REAL NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS trading_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            action TEXT NOT NULL,
+            amount REAL NOT NULL,
+            price REAL NOT NULL,
+            usdc_amount REAL NOT NULL,
+            balance_before REAL NOT NULL,
+            balance_after REAL NOT NULL,
+            position_before REAL NOT NULL,
+            position_after REAL NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            datetime TEXT,  -- 添加可读日期时间
+            signal_reason TEXT  -- 添加交易信号原因
+        )
+    ''')
+    
+    # 新增持仓表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS virtual_positions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL UNIQUE,
+            position_size REAL NOT NULL DEFAULT 0.0,
+            avg_price REAL NOT NULL DEFAULT 0.0,
+            total_cost REAL NOT NULL DEFAULT 0.0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _v2_balance_state(cursor: sqlite3.Cursor):
+    """当前余额单行表 + 余额流水 + 流水压缩检查点"""
+    # virtual_balance 为余额变动流水，当前余额保存在 virtual_balance_state 单行中
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(virtual_balance)')]
+    if 'reason' not in columns:
+        cursor.execute('ALTER TABLE virtual_balance ADD COLUMN reason TEXT')  # 变动原因: INIT/BUY/SELL/SET
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS virtual_balance_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            usdc_balance REAL NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # 流水压缩后的按日检查点
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS virtual_balance_checkpoints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            period_start TEXT NOT NULL,
+            entries INTEGER NOT NULL,
+            first_journal_id INTEGER NOT NULL,
+            last_journal_id INTEGER NOT NULL,
+            open_balance REAL NOT NULL,
+            close_balance REAL NOT NULL,
+            min_balance REAL NOT NULL,
+            max_balance REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Initialize balance if empty（旧数据库从最新一条流水迁移当前余额）
+    cursor.execute('SELECT COUNT(*) FROM virtual_balance_state')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('SELECT usdc_balance FROM virtual_balance ORDER BY id DESC LIMIT 1')
+        result = cursor.fetchone()
+        if result is None:
+            cursor.execute("INSERT INTO virtual_balance (usdc_balance, reason) VALUES (1000.0, 'INIT')")
+            initial_balance = 1000.0
+        else:
+            initial_balance = result[0]
+        cursor.execute('INSERT INTO virtual_balance_state (id, usdc_balance) VALUES (1, ?)',
+                       (initial_balance,))
+
+def _v3_trade_indexes(cursor: sqlite3.Cursor):
+    """交易记录增加毫秒时间戳列和组合索引"""
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(trading_records)')]
+    if 'ts_ms' not in columns:
+        cursor.execute('ALTER TABLE trading_records ADD COLUMN ts_ms INTEGER')  # 本地时间对应的epoch毫秒
+    
+    # datetime 为本地时间文本，timestamp 为UTC文本
+    cursor.execute('''
+        UPDATE trading_records
+        SET ts_ms = CAST(strftime('%s', COALESCE(datetime(datetime, 'utc'), timestamp)) AS INTEGER) * 1000
+        WHERE ts_ms IS NULL
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_trading_records_symbol_ts ON trading_records (symbol, ts_ms)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_trading_records_ts ON trading_records (ts_ms)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_virtual_balance_updated_at ON virtual_balance (updated_at)')
+
+def _v4_audit_events(cursor: sqlite3.Cursor):
+    """审计事件表（异步交易流水写入器使用）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audit_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            payload TEXT,  -- JSON
+            ts_ms INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_events_ts ON audit_events (ts_ms)')
+
+def _v5_accounts(cursor: sqlite3.Cursor):
+    """多账户子账本: 所有表增加 account 列，已有数据归入 default 账户"""
+    for table in ('virtual_balance', 'virtual_balance_checkpoints', 'trading_records', 'audit_events'):
+        columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+        if 'account' not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN account TEXT NOT NULL DEFAULT 'default'")
+    
+    # 当前余额: 每个账户一行
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(virtual_balance_state)')]
+    if 'account' not in columns:
+        cursor.execute('''
+            CREATE TABLE virtual_balance_state_new (
+                account TEXT PRIMARY KEY,
+                usdc_balance REAL NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO virtual_balance_state_new (account, usdc_balance, updated_at)
+            SELECT 'default', usdc_balance, updated_at FROM virtual_balance_state
+        ''')
+        cursor.execute('DROP TABLE virtual_balance_state')
+        cursor.execute('ALTER TABLE virtual_balance_state_new RENAME TO virtual_balance_state')
+    
+    # 持仓: 唯一约束改为 (account, symbol)
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(virtual_positions)')]
+    if 'account' not in columns:
+        cursor.execute('''
+            CREATE TABLE virtual_positions_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                account TEXT NOT NULL DEFAULT 'default',
+                symbol TEXT NOT NULL,
+                position_size REAL NOT NULL DEFAULT 0.0,
+                avg_price REAL NOT NULL DEFAULT 0.0,
+                total_cost REAL NOT NULL DEFAULT 0.0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (account, symbol)
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO virtual_positions_new (id, account, symbol, position_size, avg_price, total_cost, updated_at)
+            SELECT id, 'default', symbol, position_size, avg_price, total_cost, updated_at FROM virtual_positions
+        ''')
+        cursor.execute('DROP TABLE virtual_positions')
+        cursor.execute('ALTER TABLE virtual_positions_new RENAME TO virtual_positions')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_trading_records_account_symbol_ts
+        ON trading_records (account, symbol, ts_ms)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_virtual_balance_account ON virtual_balance (account, id)')
+    
+    # 跨账户汇总的持仓视图
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS consolidated_positions AS
+        SELECT symbol,
+               SUM(position_size) AS position_size,
+               SUM(total_cost) AS total_cost,
+               CASE WHEN SUM(position_size) > 0 THEN SUM(total_cost) / SUM(position_size) ELSE 0.0 END AS avg_price,
+               COUNT(*) AS accounts
+        FROM virtual_positions
+        WHERE position_size > 0
+        GROUP BY symbol
+    ''')
+
+def _v6_ledger_version(cursor: sqlite3.Cursor):
+    """账本版本号: 余额或持仓每次修改时加一，账本缓存据此判断是否需要重新加载"""
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(virtual_balance_state)')]
+    if 'ledger_version' not in columns:
+        cursor.execute('ALTER TABLE virtual_balance_state ADD COLUMN ledger_version INTEGER NOT NULL DEFAULT 0')
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, '基础表结构', _v1_base_tables),
+    (2, '当前余额单行表与余额流水', _v2_balance_state),
+    (3, '交易记录毫秒时间戳与索引', _v3_trade_indexes),
+    (4, '审计事件表', _v4_audit_events),
+    (5, '多账户子账本', _v5_accounts),
+    (6, '账本版本号', _v6_ledger_version),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(db: ConnectionManager) -> int:
+    """获取数据库当前的结构版本"""
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(db: ConnectionManager) -> int:
+    """执行所有尚未应用的迁移，每个迁移在独立事务中提交
+    Returns: 迁移后的结构版本
+    """
+    if get_schema_version(db) >= SCHEMA_VERSION:
+        return SCHEMA_VERSION
+    
+    for version, description, apply in MIGRATIONS:
+        with db.transaction() as conn:
+            # 持有写锁后重新读取版本，避免多个进程重复执行同一迁移
+            current = conn.execute('PRAGMA user_version').fetchone()[0]
+            if current >= version:
+                continue
+            apply(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version}')
+            print(f"✓ 数据库迁移到版本 {version}: {description}")
+    
+    return get_schema_version(db)
@@ -25,17 +25,29 @@ class OKXTradingBot:
         self.okx_trader = OKXTrader()
         self.exchange = self.okx_trader.get_exchange()
         
-        # 初始化框架和虚拟交易器
-        self.framework = TradingFramework()
-        self.trader = VirtualTrader()
-        
         # 从配置文件获取交易参数
         trading_config = Config.get_trading_config()
         self.symbol = trading_config['default_symbol']
         self.check_interval = trading_config['check_interval']
+        self.account = trading_config['account']
+        
+        # 初始化框架和虚拟交易器（每个机器人使用自己的虚拟子账户）
+        self.framework = TradingFramework()
+        self.trader = VirtualTrader(account=self.account)
         
         # 注册插件
         self._register_plugins()
+        
+        # 可选的异步交易所，每轮所有交易对/周期的K线并发获取
+        self.snapshot_exchange = self.exchange
+        self.async_exchange = None
+        if Config.get_market_data_config()['async_fetch']:
+            self._start_async_exchange()
+        
+        # 可选的 WebSocket 行情推送，K线收盘即触发决策，不再等待完整的检查间隔
+        self.feed = None
+        if Config.get_market_data_config()['feed_enabled']:
+            self._start_market_feed()
     
     def _register_plugins(self):
         """注册所有插件"""
@@ -53,22 +65,51 @@ class OKXTradingBot:
         for name, info in self.framework.list_plugins().items():
             print(f"  - {name}: 启用={info['enabled']}, 依赖={info['dependencies']}")
     
+    def _start_async_exchange(self):
+        """创建异步交易所（共享连接池），用于并发获取市场快照"""
+        from async_trading import SyncOKXTrader, HAS_ASYNC_CCXT
+        if Config.get_replay_config()['mode']:
+            print("⚠️ 交易所录制/回放模式下不使用异步交易所")
+            return
+        if not HAS_ASYNC_CCXT:
+            print("⚠️ 未安装 aiohttp，逐个请求K线: pip install aiohttp")
+            return
+        self.async_exchange = SyncOKXTrader()
+        self.snapshot_exchange = self.async_exchange
+        print("✓ 异步交易所已启动，K线并发获取")
+    
+    def _start_market_feed(self):
+        """启动行情推送，订阅插件需要的所有K线周期"""
+        from market_feed import MarketFeed, HAS_WEBSOCKETS
+        if not HAS_WEBSOCKETS:
+            print("⚠️ 未安装 websockets，使用 REST 轮询: pip install websockets")
+            return
+        requirements = self.framework.get_data_requirements()
+        symbols = sorted({self.symbol} | {symbol for symbol, _ in requirements})
+        timeframes = sorted({timeframe for _, timeframe in requirements}) or ['1m']
+        self.feed = MarketFeed(symbols, timeframes, exchange=self.exchange)
+        self.feed.resync()  # 先用 REST 填充缓冲区，推送只需维护增量
+        self.feed.start()
+        print(f"✓ 行情推送已启动: {symbols} {timeframes}")
+    
+    def _wait_next_tick(self):
+        """等待下一轮：有行情推送时在K线收盘时立即返回，否则固定间隔轮询"""
+        if self.feed is not None:
+            self.feed.wait_for_update(self.check_interval)
+        else:
+            time.sleep(self.check_interval)
+    
     def get_current_market_data(self) -> MarketData:
-        """获取当前市场数据"""
+        """获取当前市场数据（包含所有插件共享的K线快照）"""
         try:
-            ticker = self.exchange.fetch_ticker(self.symbol)
-            return MarketData(
-                symbol=self.symbol,
-                price=ticker['last'],
-                timestamp=time.time()
-            )
+            return self.framework.fetch_market_snapshot(self.snapshot_exchange, self.symbol, feed=self.feed)
         except Exception as e:
             print(f"获取市场数据失败: {e}")
             return None
     
     def get_position_info(self) -> Dict:
         """获取持仓信息"""
-        position_size, avg_price, total_cost = get_position("virtual", self.symbol)
+        position_size, avg_price, total_cost = get_position("virtual", self.symbol, account=self.account)
         return {
             'position_size': position_size,
             'avg_price': avg_price,
@@ -85,7 +126,8 @@ class OKXTradingBot:
                 signal.symbol, 
                 signal.price,
                 buy_amount_usdc=signal.amount_usdc or 100.0,
-                signal_reason=signal.reason
+                signal_reason=signal.reason,
+                account=self.account
             )
             print(f"买入完成，新持仓: {position_size:.4f}")
             
@@ -96,13 +138,14 @@ class OKXTradingBot:
                 signal.symbol,
                 signal.price,
                 sell_percentage=signal.sell_percentage or 1.0,
-                signal_reason=signal.reason
+                signal_reason=signal.reason,
+                account=self.account
             )
             print(f"卖出完成，剩余持仓: {position_size:.4f}")
     
     def run(self):
         """运行交易机器人"""
-        print(f"🚀 OKX交易机器人启动 - {self.symbol}")
+        print(f"🚀 OKX交易机器人启动 - {self.symbol} (虚拟账户: {self.account})")
         print(f"初始余额: {self.trader.get_usdc_balance():.2f} USDC")
         
         # 显示初始持仓
@@ -120,10 +163,11 @@ class OKXTradingBot:
                 market_data = self.get_current_market_data()
                 if not market_data:
                     print("❌ 无法获取市场数据，跳过本轮")
-                    time.sleep(self.check_interval)
+                    self._wait_next_tick()
                     continue
                 
-                # 获取持仓信息
+                # 获取持仓信息（外部工具修改过账本时先刷新缓存）
+                self.trader.refresh_ledger()
                 position_info = self.get_position_info()
                 
                 # 显示当前状态
@@ -151,17 +195,32 @@ class OKXTradingBot:
                     if final_signal:
                         print(f"🎯 最终决策: {final_signal.signal_type.value} "
                               f"(来自: {final_signal.plugin_name})")
+                        self.trader.record_event('DECISION', {
+                            'symbol': final_signal.symbol,
+                            'signal': final_signal.signal_type.value,
+                            'plugin': final_signal.plugin_name,
+                            'confidence': final_signal.confidence,
+                            'price': final_signal.price,
+                            'reason': final_signal.reason,
+                        })
                         self.execute_signal(final_signal)
                     else:
                         print("⚖️ 信号冲突或置信度不足，保持观望")
                 else:
                     print("📊 所有插件建议持有")
                 
-                print(f"⏳ 等待 {self.check_interval} 秒...")
-                time.sleep(self.check_interval)
+                print(f"⏳ 等待 {self.check_interval} 秒..." if self.feed is None
+                      else f"⏳ 等待K线收盘（最长 {self.check_interval} 秒）...")
+                self._wait_next_tick()
                 
             except KeyboardInterrupt:
                 print("\n👋 用户中断，正在退出...")
+                if self.feed is not None:
+                    self.feed.stop()
+                if self.async_exchange is not None:
+                    self.async_exchange.close()
+                self.framework.shutdown()
+                self.trader.close()
                 break
             except Exception as e:
                 print(f"❌ 运行出错: {e}")
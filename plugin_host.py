@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import multiprocessing
+import pickle
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from candle_buffer import CandleRingBuffer
+
+# 插件进程隔离
+#
+# 声明 execution = "process" 的插件在独立的工作进程中运行，不占用机器人主进程的 GIL，
+# 计算量大的策略（机器学习模型、大窗口统计等）不会拖慢主循环和其它插件。
+#
+# 每轮主进程把K线缓冲区的完整存储拷贝到共享内存（每个序列一块，跨轮复用），
+# 通过管道只发送共享内存名称和价格等少量字段；工作进程直接在共享内存上构造只读的
+# CandleRingBuffer，不需要序列化K线数据。工作进程退出、崩溃或超时未返回时被结束，
+# 下一轮自动重新启动，主进程不受影响。
+#
+# 注意：插件发送到工作进程时不包含 exchange（见 TradingPlugin.__getstate__），
+# 需要的K线请通过 get_data_requirements 声明；工作进程中对插件属性的修改不会同步回主进程。
+
+class PluginWorkerError(RuntimeError):
+    """工作进程崩溃、超时或插件执行出错"""
+
+class SharedSnapshot:
+    """主进程一侧：把每轮的市场快照发布到共享内存"""
+
+    def __init__(self):
+        self._blocks: Dict[Tuple[str, str], shared_memory.SharedMemory] = {}
+
+    def publish(self, market_data) -> Dict[str, Any]:
+        """把K线缓冲区拷贝到共享内存
+        Returns: 发送给工作进程的快照描述（可序列化，不包含K线数据本身）
+        """
+        candles = {}
+        for key, buffer in (market_data.candles or {}).items():
+            block = self._blocks.get(key)
+            if block is None or block.size < buffer.nbytes:
+                if block is not None:
+                    self._release(block)
+                block = shared_memory.SharedMemory(create=True, size=buffer.nbytes)
+                self._blocks[key] = block
+            buffer.copy_into(np.ndarray(buffer.nbytes // 8, dtype=np.int64, buffer=block.buf))
+            candles[key] = (block.name, buffer.nbytes // 8)
+        return {
+            'symbol': market_data.symbol,
+            'price': market_data.price,
+            'timestamp': market_data.timestamp,
+            'additional_data': market_data.additional_data,
+            'candles': candles,
+        }
+
+    @staticmethod
+    def _release(block: shared_memory.SharedMemory):
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        for block in self._blocks.values():
+            self._release(block)
+        self._blocks.clear()
+
+class _SnapshotReader:
+    """工作进程一侧：按快照描述在共享内存上构造 MarketData"""
+
+    def __init__(self):
+        self._blocks: Dict[str, shared_memory.SharedMemory] = {}
+
+    def read(self, snapshot: Dict[str, Any], upstream=None):
+        from trading_framework import MarketData, UpstreamResults
+        candles = {}
+        for key, (name, size) in snapshot['candles'].items():
+            block = self._blocks.get(name)
+            if block is None:
+                block = shared_memory.SharedMemory(name=name)
+                self._blocks[name] = block
+            storage = np.ndarray(size, dtype=np.int64, buffer=block.buf)
+            candles[key] = CandleRingBuffer(storage=storage, readonly=True)
+        return MarketData(symbol=snapshot['symbol'], price=snapshot['price'], timestamp=snapshot['timestamp'],
+                          additional_data=snapshot['additional_data'], candles=candles,
+                          upstream=upstream or UpstreamResults())
+
+def _worker_main(conn, payload: bytes):
+    """工作进程入口：循环接收快照并执行插件"""
+    # Ctrl+C 由主进程处理，工作进程由主进程结束
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    plugin = pickle.loads(payload)
+    reader = _SnapshotReader()
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message[0] == 'stop':
+            break
+        _, snapshot, position_info, upstream = message
+        try:
+            result = ('ok', plugin.analyze(reader.read(snapshot, upstream), position_info))
+        except Exception as e:
+            result = ('error', f"{type(e).__name__}: {e}")
+        conn.send(result)
+
+class PluginWorker:
+    """一个进程隔离插件的工作进程，崩溃或超时后在下一次调用时重新启动"""
+
+    def __init__(self, plugin, context, timeout: Optional[float] = None):
+        self.name = plugin.name
+        self.timeout = timeout
+        self.restarts = 0
+        self._payload = pickle.dumps(plugin)
+        self._context = context
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(f"plugin_host.{plugin.name}")
+
+    def _start(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_conn, self._payload),
+                                        name=f"plugin-{self.name}", daemon=True)
+        process.start()
+        child_conn.close()
+        self._process, self._conn = process, parent_conn
+
+    def _stop(self, graceful: bool = False):
+        process, conn = self._process, self._conn
+        self._process = self._conn = None
+        if process is None:
+            return
+        if graceful and process.is_alive():
+            try:
+                conn.send(('stop',))
+                process.join(1.0)
+            except (OSError, ValueError):
+                pass
+        if process.is_alive():
+            process.terminate()
+            process.join(1.0)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        conn.close()
+
+    def analyze(self, snapshot: Dict[str, Any], position_info: Dict, upstream=None):
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                if self._process is not None:
+                    self.restarts += 1
+                    self.logger.warning(f"插件 {self.name} 的工作进程已退出"
+                                        f"（退出码 {self._process.exitcode}），重新启动")
+                    self._stop()
+                self._start()
+            try:
+                self._conn.send(('analyze', snapshot, position_info, upstream))
+                if not self._conn.poll(self.timeout):
+                    raise TimeoutError(f"超过 {self.timeout} 秒未返回")
+                status, result = self._conn.recv()
+            except TimeoutError as e:
+                # 卡住的工作进程直接结束，下一次调用时重新启动
+                self._stop()
+                self.restarts += 1
+                raise PluginWorkerError(f"插件 {self.name} {e}，工作进程已结束")
+            except (EOFError, OSError):
+                self._process.join(1.0)
+                exitcode = self._process.exitcode
+                self._stop()
+                self.restarts += 1
+                raise PluginWorkerError(f"插件 {self.name} 的工作进程崩溃（退出码 {exitcode}）")
+            if status == 'error':
+                raise PluginWorkerError(result)
+            return result
+
+    def close(self):
+        with self._lock:
+            self._stop(graceful=True)
+
+class PluginHost:
+    """管理所有进程隔离插件的工作进程"""
+
+    def __init__(self, timeout: Optional[float] = None, start_method: str = 'spawn'):
+        self.timeout = timeout
+        # 默认 spawn：主进程有行情推送、请求调度等后台线程，fork 可能复制到被持有的锁
+        self._context = multiprocessing.get_context(start_method)
+        self._workers: Dict[str, PluginWorker] = {}
+        self._snapshot = SharedSnapshot()
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger("plugin_host")
+
+    def publish(self, market_data) -> Dict[str, Any]:
+        """每轮调用一次，把市场快照发布到共享内存"""
+        start = time.perf_counter()
+        snapshot = self._snapshot.publish(market_data)
+        self.logger.debug(f"发布快照 {len(snapshot['candles'])} 个序列，耗时 {(time.perf_counter() - start) * 1000:.2f} ms")
+        return snapshot
+
+    def _get_worker(self, plugin) -> PluginWorker:
+        with self._lock:
+            worker = self._workers.get(plugin.name)
+            if worker is None:
+                worker = PluginWorker(plugin, self._context, self.timeout)
+                self._workers[plugin.name] = worker
+            return worker
+
+    def analyze(self, plugin, snapshot: Dict[str, Any], position_info: Dict, upstream=None):
+        """在插件的工作进程中执行 analyze（upstream: 上游插件本轮的结果，UpstreamResults）"""
+        return self._get_worker(plugin).analyze(snapshot, position_info, upstream)
+
+    def remove(self, plugin_name: str):
+        """结束插件的工作进程（插件注销或重新注册时）"""
+        with self._lock:
+            worker = self._workers.pop(plugin_name, None)
+        if worker is not None:
+            worker.close()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: {'restarts': worker.restarts,
+                       'alive': worker._process is not None and worker._process.is_alive()}
+                for name, worker in self._workers.items()}
+
+    def close(self):
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
+        self._snapshot.close()
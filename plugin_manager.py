@@ -30,11 +30,13 @@ def main():
     for name, info in framework.list_plugins().items():
         print(f"\n插件名: {name}")
         print(f"  状态: {'启用' if info['enabled'] else '禁用'}")
-        print(f"  依赖: {info['dependencies']}")
+        print(f"  依赖: {info['dependencies']}（层级 {info['depth']}）")
         print(f"  配置: {info['config']}")
     
     # 测试插件执行顺序
     print(f"\n插件执行顺序: {framework.plugin_order}")
+    for depth, names in enumerate(framework.get_plugin_levels()):
+        print(f"  第 {depth} 层: {names}")
 
 if __name__ == '__main__':
     main()
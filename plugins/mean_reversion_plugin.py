@@ -1,12 +1,22 @@
 # -*- coding: utf-8 -*-
 
-import ccxt
-import numpy as np
-from typing import Dict, Any
-from trading_framework import TradingPlugin, TradingSignal, SignalType, MarketData
+from typing import Dict, Any, List, TypedDict
+from trading_framework import TradingPlugin, TradingSignal, SignalType, MarketData, DataRequirement
+
+class BollingerOutputs(TypedDict):
+    """MeanReversion 信号的 outputs：本轮的布林带"""
+    symbol: str
+    timeframe: str
+    last_price: float
+    sma: float
+    upper_band: float
+    lower_band: float
 
 class MeanReversionPlugin(TradingPlugin):
-    """均值回归策略插件"""
+    """均值回归策略插件
+    
+    信号的 outputs 发布本轮的布林带（BollingerOutputs），供下游插件使用
+    """
     
     def __init__(self, exchange, symbol: str = 'BTC/USDT'):
         super().__init__("MeanReversion")
@@ -21,21 +31,20 @@ class MeanReversionPlugin(TradingPlugin):
         self.sell_percentage = 1.0
         self.max_position_usdc = 500.0
     
-    def fetch_bollinger_bands(self):
-        """获取布林带数据"""
+    def get_data_requirements(self) -> List[DataRequirement]:
+        return [DataRequirement(self.symbol, self.timeframe, self.bb_period + 1)]
+    
+    def fetch_bollinger_bands(self, market_data: MarketData = None):
+        """获取布林带数据（基于已收盘K线增量更新，最新一根K线的收盘价作为当前价格）"""
         try:
-            ohlcv = self.exchange.fetch_ohlcv(self.symbol, self.timeframe, limit=self.bb_period + 1)
-            if len(ohlcv) < self.bb_period + 1:
+            series = self.get_indicator(market_data, self.symbol, self.timeframe, 'bollinger',
+                                        period=self.bb_period, num_std=self.bb_stddev)
+            bands = series.indicator.value
+            if bands is None or series.latest_close is None:
                 return None, None, None, None
-
-            closes = np.array([candle[4] for candle in ohlcv])
-            last_price = closes[-1]
-            sma = np.mean(closes[:-1])
-            std = np.std(closes[:-1])
             
-            upper_band = sma + self.bb_stddev * std
-            lower_band = sma - self.bb_stddev * std
-
+            last_price = series.latest_close
+            sma, upper_band, lower_band = bands
             return last_price, sma, upper_band, lower_band
         except Exception as e:
             self.logger.error(f"获取布林带数据失败: {e}")
@@ -43,12 +52,20 @@ class MeanReversionPlugin(TradingPlugin):
     
     def analyze(self, market_data: MarketData, position_info: Dict) -> TradingSignal:
         """分析市场数据并返回交易信号"""
-        last_price, sma, upper_band, lower_band = self.fetch_bollinger_bands()
+        last_price, sma, upper_band, lower_band = self.fetch_bollinger_bands(market_data)
         
         if not all([last_price, sma, upper_band, lower_band]):
             return TradingSignal(SignalType.HOLD, self.symbol, market_data.price, 0.0, 
                                reason="数据不足")
         
+        outputs = BollingerOutputs(
+            symbol=self.symbol,
+            timeframe=self.timeframe,
+            last_price=last_price,
+            sma=sma,
+            upper_band=upper_band,
+            lower_band=lower_band,
+        )
         position_size = position_info.get('position_size', 0.0)
         is_in_position = position_size > 0
         
@@ -62,7 +79,8 @@ class MeanReversionPlugin(TradingPlugin):
                 last_price, 
                 confidence,
                 sell_percentage=self.sell_percentage,
-                reason=f"价格{last_price:.2f}高于上轨{upper_band:.2f}"
+                reason=f"价格{last_price:.2f}高于上轨{upper_band:.2f}",
+                outputs=outputs
             )
         
         elif last_price < lower_band and not is_in_position:
@@ -74,12 +92,13 @@ class MeanReversionPlugin(TradingPlugin):
                 last_price, 
                 confidence,
                 amount_usdc=self.buy_amount_usdc,
-                reason=f"价格{last_price:.2f}低于下轨{lower_band:.2f}"
+                reason=f"价格{last_price:.2f}低于下轨{lower_band:.2f}",
+                outputs=outputs
             )
         
         else:
             return TradingSignal(SignalType.HOLD, self.symbol, last_price, 0.0, 
-                               reason="价格在布林带内")
+                               reason="价格在布林带内", outputs=outputs)
     
     def get_config(self) -> Dict[str, Any]:
         """获取插件配置"""
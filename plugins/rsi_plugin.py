@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 
-import ccxt
-import numpy as np
-from typing import Dict, Any
-from trading_framework import TradingPlugin, TradingSignal, SignalType, MarketData
+from typing import Dict, Any, List, Optional
+from trading_framework import TradingPlugin, TradingSignal, SignalType, MarketData, DataRequirement
+from plugins.mean_reversion_plugin import BollingerOutputs
 
 class RSIPlugin(TradingPlugin):
-    """RSI策略插件"""
+    """RSI策略插件
+    
+    依赖 MeanReversion 时使用它本轮发布的布林带：价格同时突破布林带时提高信号置信度。
+    """
     
     def __init__(self, exchange, symbol: str = 'BTC/USDT'):
         super().__init__("RSI")
@@ -20,37 +22,35 @@ class RSIPlugin(TradingPlugin):
         self.overbought_level = 70
         self.buy_amount_usdc = 50.0
         self.sell_percentage = 0.5  # 只卖出一半
+        self.band_confirm_boost = 0.2  # 价格同时突破布林带时增加的置信度
+    
+    def get_data_requirements(self) -> List[DataRequirement]:
+        return [DataRequirement(self.symbol, self.timeframe, self.rsi_period + 10)]
     
-    def calculate_rsi(self):
-        """计算RSI指标"""
+    def calculate_rsi(self, market_data: MarketData = None):
+        """计算RSI指标（Wilder 平滑，包含最新一根未收盘K线）"""
         try:
-            ohlcv = self.exchange.fetch_ohlcv(self.symbol, self.timeframe, limit=self.rsi_period + 10)
-            if len(ohlcv) < self.rsi_period + 1:
+            series = self.get_indicator(market_data, self.symbol, self.timeframe, 'rsi', period=self.rsi_period)
+            if series.latest_close is None:
                 return None
-            
-            closes = np.array([candle[4] for candle in ohlcv])
-            deltas = np.diff(closes)
-            
-            gains = np.where(deltas > 0, deltas, 0)
-            losses = np.where(deltas < 0, -deltas, 0)
-            
-            avg_gain = np.mean(gains[-self.rsi_period:])
-            avg_loss = np.mean(losses[-self.rsi_period:])
-            
-            if avg_loss == 0:
-                return 100
-            
-            rs = avg_gain / avg_loss
-            rsi = 100 - (100 / (1 + rs))
-            
-            return rsi
+            return series.indicator.peek(series.latest_close)
         except Exception as e:
             self.logger.error(f"计算RSI失败: {e}")
             return None
     
+    def get_bands(self, market_data: MarketData) -> Optional[BollingerOutputs]:
+        """上游 MeanReversion 插件本轮的布林带（同一交易对和周期），没有时返回 None"""
+        if market_data is None or market_data.upstream is None:
+            return None
+        outputs: BollingerOutputs = market_data.upstream.outputs("MeanReversion")
+        if outputs.get('symbol') != self.symbol or outputs.get('timeframe') != self.timeframe:
+            return None
+        return outputs
+    
     def analyze(self, market_data: MarketData, position_info: Dict) -> TradingSignal:
         """分析RSI并返回交易信号"""
-        rsi = self.calculate_rsi()
+        rsi = self.calculate_rsi(market_data)
+        bands = self.get_bands(market_data)
         
         if rsi is None:
             return TradingSignal(SignalType.HOLD, self.symbol, market_data.price, 0.0, 
@@ -62,25 +62,33 @@ class RSIPlugin(TradingPlugin):
         if rsi < self.oversold_level and not is_in_position:
             # RSI超卖且无持仓 -> 买入信号
             confidence = (self.oversold_level - rsi) / self.oversold_level
+            reason = f"RSI超卖({rsi:.1f})"
+            if bands and bands['last_price'] < bands['lower_band']:
+                confidence = min(1.0, confidence + self.band_confirm_boost)
+                reason += f"，价格低于布林带下轨{bands['lower_band']:.2f}"
             return TradingSignal(
                 SignalType.BUY,
                 self.symbol,
                 market_data.price,
                 confidence,
                 amount_usdc=self.buy_amount_usdc,
-                reason=f"RSI超卖({rsi:.1f})"
+                reason=reason
             )
         
         elif rsi > self.overbought_level and is_in_position:
             # RSI超买且有持仓 -> 卖出信号
             confidence = (rsi - self.overbought_level) / (100 - self.overbought_level)
+            reason = f"RSI超买({rsi:.1f})"
+            if bands and bands['last_price'] > bands['upper_band']:
+                confidence = min(1.0, confidence + self.band_confirm_boost)
+                reason += f"，价格高于布林带上轨{bands['upper_band']:.2f}"
             return TradingSignal(
                 SignalType.SELL,
                 self.symbol,
                 market_data.price,
                 confidence,
                 sell_percentage=self.sell_percentage,
-                reason=f"RSI超买({rsi:.1f})"
+                reason=reason
             )
         
         else:
@@ -95,5 +103,6 @@ class RSIPlugin(TradingPlugin):
             'oversold_level': self.oversold_level,
             'overbought_level': self.overbought_level,
             'buy_amount_usdc': self.buy_amount_usdc,
-            'sell_percentage': self.sell_percentage
+            'sell_percentage': self.sell_percentage,
+            'band_confirm_boost': self.band_confirm_boost
         }
\ No newline at end of file
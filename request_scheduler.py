@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# 交易所请求调度
+#
+# 所有对 ccxt 交易所对象的调用经过 ScheduledExchange 代理：
+#   1. 按 OKX 接口分组的令牌桶限速，等待令牌时按优先级排队（下单优先于图表回填）；
+#   2. 相同参数的并发 fetch_* 请求合并，只有一个真正发出，其余等待同一结果。
+# 异步交易所（async_trading）通过 call_async 使用同一组令牌桶，同步和异步请求共享限速额度。
+
+# 优先级通道，数字越小越优先
+PRIORITY_LANES = {
+    'order': 0,
+    'account': 1,
+    'market': 2,
+    'backfill': 3,
+}
+
+# ccxt 方法 -> (限速分组, 默认优先级通道)
+METHOD_ENDPOINTS = {
+    'fetch_ohlcv': ('candles', 'market'),
+    'fetch_ticker': ('ticker', 'market'),
+    'fetch_tickers': ('tickers', 'market'),
+    'fetch_order_book': ('books', 'market'),
+    'fetch_trades': ('trades', 'market'),
+    'load_markets': ('instruments', 'market'),
+    'fetch_markets': ('instruments', 'market'),
+    'fetch_balance': ('balance', 'account'),
+    'fetch_positions': ('positions', 'account'),
+    'fetch_open_orders': ('orders', 'account'),
+    'fetch_order': ('orders', 'account'),
+    'create_order': ('order', 'order'),
+    'cancel_order': ('order', 'order'),
+    'edit_order': ('order', 'order'),
+}
+
+# 这些前缀的方法会发出网络请求，需要调度
+SCHEDULED_PREFIXES = ('fetch_', 'create_', 'cancel_', 'edit_', 'load_markets')
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    # 按类名判断，避免为此导入 ccxt（RateLimitExceeded 是 DDoSProtection 的子类）
+    return any(cls.__name__ == 'DDoSProtection' for cls in type(error).__mro__)
+
+class TokenBucket:
+    """令牌桶，等待者按 (优先级, 到达顺序) 获得令牌"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _try_take(self, ticket: Tuple[int, int], deadline: Optional[float]) -> Optional[float]:
+        """排在队首且有令牌时取走一个（调用方持有锁）
+        Returns: None 表示已获得；否则为需要等待的秒数，超时返回 0
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if self._waiters[0] == ticket and self.tokens >= 1 and now >= self.paused_until:
+            heapq.heappop(self._waiters)
+            self.tokens -= 1
+            self._cond.notify_all()
+            return None
+        wait = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.001)
+        if deadline is not None:
+            if now >= deadline:
+                return 0.0
+            wait = min(wait, deadline - now)
+        return wait
+
+    def _leave(self, ticket: Tuple[int, int]):
+        """超时或取消时离开等待队列（调用方持有锁）"""
+        if ticket in self._waiters:
+            self._waiters.remove(ticket)
+            heapq.heapify(self._waiters)
+            self._cond.notify_all()
+
+    def acquire(self, priority: int = 0, timeout: Optional[float] = None) -> bool:
+        """获取一个令牌
+        Returns: 是否在超时前获得
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            ticket = (priority, next(self._counter))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    wait = self._try_take(ticket, deadline)
+                    if wait is None:
+                        return True
+                    if wait == 0.0:
+                        self._leave(ticket)
+                        return False
+                    self._cond.wait(wait)
+            except BaseException:
+                self._leave(ticket)
+                raise
+
+    async def acquire_async(self, priority: int = 0, timeout: Optional[float] = None) -> bool:
+        """acquire 的协程版本：与同步调用方在同一个队列中排队，等待时不阻塞事件循环"""
+        import asyncio  # 只有异步交易所用到，同步进程不为此多付导入时间
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            ticket = (priority, next(self._counter))
+            heapq.heappush(self._waiters, ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(ticket, deadline)
+                    if wait is None:
+                        return True
+                    if wait == 0.0:
+                        self._leave(ticket)
+                        return False
+                await asyncio.sleep(wait)
+        except BaseException:
+            with self._cond:
+                self._leave(ticket)
+            raise
+
+    def penalize(self, seconds: float):
+        """收到限速错误后清空令牌并暂停一段时间"""
+        with self._cond:
+            self.tokens = 0.0
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+class RequestScheduler:
+    """按接口限速、按优先级排队、合并并发相同请求"""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_retries: Optional[int] = None, penalty: Optional[float] = None):
+        from config import Config
+        scheduler_config = Config.get_scheduler_config()
+        limits = limits if limits is not None else scheduler_config['limits']
+        self.buckets = {endpoint: TokenBucket(count / period, count) for endpoint, (count, period) in limits.items()}
+        self.max_retries = scheduler_config['max_retries'] if max_retries is None else max_retries
+        self.penalty = scheduler_config['rate_limit_penalty'] if penalty is None else penalty
+        self.coalesce = scheduler_config['coalesce']
+        # 当前优先级通道；用 ContextVar 而不是 threading.local，
+        # 提交到线程池时用 contextvars.copy_context().run 即可把通道带到工作线程
+        self._lane = contextvars.ContextVar(f'scheduler_lane_{id(self)}', default=None)
+        self._inflight: Dict[Tuple, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self.stats = {'requests': 0, 'coalesced': 0, 'rate_limited': 0}
+        self.logger = logging.getLogger("scheduler")
+
+    @contextmanager
+    def priority(self, lane: str):
+        """在 with 块内把当前上下文的请求放入指定优先级通道"""
+        if lane not in PRIORITY_LANES:
+            raise ValueError(f"未知的优先级通道: {lane}，可选 {list(PRIORITY_LANES)}")
+        token = self._lane.set(lane)
+        try:
+            yield
+        finally:
+            self._lane.reset(token)
+
+    def _bucket(self, endpoint: str) -> TokenBucket:
+        return self.buckets.get(endpoint) or self.buckets['default']
+
+    def call(self, method: str, func: Callable, *args, **kwargs) -> Any:
+        """按调度规则执行一次交易所调用"""
+        endpoint, default_lane = METHOD_ENDPOINTS.get(method, ('default', 'market'))
+        lane = self._lane.get() or default_lane
+
+        if not (self.coalesce and method.startswith('fetch_')):
+            return self._execute(endpoint, lane, func, args, kwargs)
+
+        # 合并并发的相同请求，只有第一个调用方真正发出请求
+        key = (method, repr(args), repr(sorted(kwargs.items())))
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.stats['coalesced'] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._execute(endpoint, lane, func, args, kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    async def call_async(self, method: str, func: Callable, *args, **kwargs) -> Any:
+        """call 的协程版本，func 为 ccxt 异步交易所的方法；与同步请求共用令牌桶和请求合并"""
+        import asyncio
+        endpoint, default_lane = METHOD_ENDPOINTS.get(method, ('default', 'market'))
+        lane = self._lane.get() or default_lane
+
+        if not (self.coalesce and method.startswith('fetch_')):
+            return await self._execute_async(endpoint, lane, func, args, kwargs)
+
+        key = (method, repr(args), repr(sorted(kwargs.items())))
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.stats['coalesced'] += 1
+        if not owner:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await self._execute_async(endpoint, lane, func, args, kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    async def _execute_async(self, endpoint: str, lane: str, func: Callable, args, kwargs) -> Any:
+        bucket = self._bucket(endpoint)
+        attempt = 0
+        while True:
+            await bucket.acquire_async(PRIORITY_LANES[lane])
+            self.stats['requests'] += 1
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if not _is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.stats['rate_limited'] += 1
+                self.logger.warning(f"接口 {endpoint} 触发限速，{self.penalty} 秒后重试: {e}")
+                bucket.penalize(self.penalty)
+
+    def _execute(self, endpoint: str, lane: str, func: Callable, args, kwargs) -> Any:
+        bucket = self._bucket(endpoint)
+        attempt = 0
+        while True:
+            bucket.acquire(PRIORITY_LANES[lane])
+            self.stats['requests'] += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not _is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.stats['rate_limited'] += 1
+                self.logger.warning(f"接口 {endpoint} 触发限速，{self.penalty} 秒后重试: {e}")
+                bucket.penalize(self.penalty)
+
+class ScheduledExchange:
+    """ccxt 交易所代理：网络请求经过 RequestScheduler，其余属性直接转发
+
+    合并的请求会把同一个结果对象返回给多个调用方，调用方不要原地修改返回值。
+    """
+
+    def __init__(self, exchange, scheduler: RequestScheduler):
+        object.__setattr__(self, '_exchange', exchange)
+        object.__setattr__(self, '_scheduler', scheduler)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._exchange, name)
+        if callable(attr) and name.startswith(SCHEDULED_PREFIXES):
+            scheduler = self._scheduler
+
+            def scheduled(*args, **kwargs):
+                return scheduler.call(name, attr, *args, **kwargs)
+            scheduled.__name__ = name
+            return scheduled
+        return attr
+
+    def __setattr__(self, name: str, value):
+        setattr(self._exchange, name, value)
+
+    @property
+    def unwrapped(self):
+        """原始的 ccxt 交易所对象"""
+        return self._exchange
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import SCHEMA_VERSION, _v1_base_tables
+from trading import VirtualTrader, list_accounts
+
+def _user_version(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.close()
+
+def test_list_accounts_on_current_schema(tmp_path):
+    db_path = str(tmp_path / 'trading.db')
+    VirtualTrader(db_path, async_journal=False)
+    VirtualTrader(db_path, async_journal=False, account='alt')
+
+    assert list_accounts(db_path) == {'alt': db_path, 'default': db_path}
+    assert _user_version(db_path) == SCHEMA_VERSION
+
+def test_list_accounts_does_not_migrate_or_take_write_lock(tmp_path):
+    # 版本 1 的旧数据库，另一个连接持有写锁
+    db_path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    _v1_base_tables(conn.cursor())
+    conn.execute('PRAGMA user_version = 1')
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        started = time.monotonic()
+        assert list_accounts(db_path) == {'default': db_path}
+        # 没有等待写锁（迁移会阻塞到 busy_timeout）
+        assert time.monotonic() - started < 1.0
+    finally:
+        conn.execute('ROLLBACK')
+        conn.close()
+    assert _user_version(db_path) == 1
+
+    # 写路径照常迁移
+    VirtualTrader(db_path, async_journal=False)
+    assert _user_version(db_path) == SCHEMA_VERSION
+    assert list_accounts(db_path) == {'default': db_path}
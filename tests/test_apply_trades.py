@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ConnectionManager
+from trading import VirtualTrader
+
+# 覆盖正常买卖、部分卖出、无持仓卖出、超出持仓上限调整和余额不足
+TRADES = [
+    ('BTC/USDC', 'BUY', 50000.0, 100.0, 'b1'),
+    ('ETH/USDC', 'BUY', 3000.0, 200.0, 'b2'),
+    ('BTC/USDC', 'BUY', 51000.0, 150.0, 'b3'),
+    ('BTC/USDC', 'SELL', 52000.0, 0.5, 's1'),
+    ('SOL/USDC', 'SELL', 150.0, 1.0, 'no position'),
+    ('ETH/USDC', 'BUY', 3100.0, 400.0, 'capped'),
+    ('ETH/USDC', 'SELL', 2900.0, 1.0, 's2'),
+    ('BTC/USDC', 'BUY', 49000.0, 5000.0, 'too much'),
+    ('BTC/USDC', 'SELL', 53000.0, 1.0, 's3'),
+]
+MAX_POSITION_USDC = 500.0
+
+# 交易记录中与执行方式无关的列（时间戳列不参与比较）
+RECORD_COLUMNS = ('symbol, action, amount, price, usdc_amount, balance_before, balance_after, '
+                  'position_before, position_after, signal_reason, account')
+
+def _snapshot(trader):
+    db = ConnectionManager.get(trader.db_path)
+    records = db.execute(f'SELECT {RECORD_COLUMNS} FROM trading_records ORDER BY id').fetchall()
+    positions = db.execute('''
+        SELECT symbol, position_size, avg_price, total_cost FROM virtual_positions
+        WHERE account = ? ORDER BY symbol
+    ''', (trader.account,)).fetchall()
+    balances = db.execute('SELECT usdc_balance, reason FROM virtual_balance ORDER BY id').fetchall()
+    state = db.execute('SELECT usdc_balance FROM virtual_balance_state WHERE account = ?',
+                       (trader.account,)).fetchone()[0]
+    return records, positions, balances, state
+
+def test_batched_trades_match_sequential_replay(tmp_path):
+    sequential = VirtualTrader(str(tmp_path / 'sequential.db'), async_journal=False)
+    for symbol, side, price, size, reason in TRADES:
+        if side == 'BUY':
+            sequential.virtual_buy(symbol, price, size, MAX_POSITION_USDC, reason)
+        else:
+            sequential.virtual_sell(symbol, price, size, reason)
+
+    batched = VirtualTrader(str(tmp_path / 'batched.db'), async_journal=False)
+    symbols, sides, prices, sizes, reasons = zip(*TRADES)
+    fills = batched.apply_trades(symbols, sides, prices, sizes, MAX_POSITION_USDC, reasons)
+    assert [fill.executed for fill in fills] == [True, True, True, True, False, True, True, False, True]
+
+    seq_records, seq_positions, seq_balances, seq_state = _snapshot(sequential)
+    batch_records, batch_positions, batch_balances, batch_state = _snapshot(batched)
+    # 逐位比较：两条路径使用同一套计算逻辑，不允许出现浮点误差
+    assert batch_records == seq_records
+    assert batch_positions == seq_positions
+    assert batch_balances == seq_balances
+    assert batch_state == seq_state
+    assert len(batch_records) == 7
+
+    # 内存账本与数据库一致
+    assert batched.get_usdc_balance() == sequential.get_usdc_balance() == batch_state
+    for symbol in ('BTC/USDC', 'ETH/USDC'):
+        assert batched.get_position(symbol) == sequential.get_position(symbol)
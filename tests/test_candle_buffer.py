@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from candle_buffer import COLUMNS, CandleRingBuffer
+
+STEP = 60 * 1000
+
+def _writer(buffer, count, done):
+    """先写入新K线，再原地更新同一根（未收盘K线），每次写入时各价格列取相同的值"""
+    try:
+        for i in range(count):
+            buffer.append([i * STEP] + [float(i)] * 5)
+            buffer.append([i * STEP] + [i + 0.5] * 5)
+    finally:
+        done.set()
+
+def test_snapshot_is_consistent_with_concurrent_writer(tmp_path):
+    buffer = CandleRingBuffer(64, str(tmp_path / 'BTC-USDT_1m.candles'))
+    reader = CandleRingBuffer(path=buffer.path, readonly=True)
+    done = threading.Event()
+    writer = threading.Thread(target=_writer, args=(buffer, 20000, done))
+    writer.start()
+
+    snapshots = 0
+    try:
+        while not done.is_set() or snapshots == 0:
+            data = reader.snapshot(limit=32)
+            snapshots += 1
+            ts = data['ts']
+            if len(ts) == 0:
+                continue
+            # K线连续，且每一行都不是写了一半的状态
+            assert np.all(np.diff(ts) == STEP)
+            index = ts // STEP
+            for name in COLUMNS[1:]:
+                assert np.array_equal(data[name], data['open'])
+            assert np.all((data['open'] == index) | (data['open'] == index + 0.5))
+            # 只有最新一根可能尚未被原地更新
+            assert np.all(data['open'][:-1] == index[:-1] + 0.5)
+    finally:
+        writer.join()
+
+    assert snapshots > 0
+    final = reader.snapshot()
+    assert len(final['ts']) == 64
+    assert final['ts'][-1] == 19999 * STEP
+    assert final['close'][-1] == 19999.5
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import math
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from indicators import vectorized
+from indicators.streaming import INDICATORS
+
+N = 2000
+
+@pytest.fixture(scope='module')
+def candles():
+    rng = np.random.default_rng(7)
+    close = 50000 + np.cumsum(rng.normal(0, 25, N))
+    high = close + rng.random(N) * 40
+    low = close - rng.random(N) * 40
+    volume = rng.random(N) * 5
+    volume[300:400] = 0.0  # 整段无成交的时段
+    # 7 分钟K线，跨越多个自然日时段
+    ts = np.arange(N, dtype=np.int64) * 7 * 60 * 1000 + 1_700_000_000_000
+    return {'ts': ts, 'open': close, 'high': high, 'low': low, 'close': close, 'volume': volume}
+
+CASES = [
+    ('sma', {'period': 20}),
+    ('stats', {'period': 20}),
+    ('bollinger', {'period': 20, 'num_std': 2.0}),
+    ('ema', {'period': 26}),
+    ('macd', {'fast': 12, 'slow': 26, 'signal': 9}),
+    ('rsi', {'period': 14}),
+    ('atr', {'period': 14}),
+    ('vwap', {'session': '1d'}),
+]
+
+def _stream(kind, params, candles):
+    """逐根K线更新流式指标（与 SeriesIndicator.sync 相同，输入为 Python float）"""
+    indicator = INDICATORS[kind](**params)
+    columns = [candles[name].tolist() for name in getattr(indicator, 'inputs', ('close',))]
+    values = []
+    for index in range(N):
+        indicator.update(*(column[index] for column in columns))
+        if kind == 'stats':
+            values.append((indicator.mean, indicator.variance) if indicator.ready else None)
+        else:
+            values.append(indicator.value)
+    return values
+
+def _columns(result):
+    return list(result) if isinstance(result, tuple) else [result]
+
+def test_every_streaming_indicator_is_covered():
+    assert {kind for kind, _ in CASES} == set(INDICATORS)
+
+@pytest.mark.parametrize('kind,params', CASES, ids=[kind for kind, _ in CASES])
+def test_vectorized_matches_streaming_bit_for_bit(kind, params, candles):
+    streamed = _stream(kind, params, candles)
+    columns = _columns(vectorized.compute(kind, candles, **params))
+    ready = [index for index, value in enumerate(streamed) if value is not None]
+    assert ready, "测试数据不足以让指标完成预热"
+
+    for index in ready:
+        expected = streamed[index] if isinstance(streamed[index], tuple) else (streamed[index],)
+        actual = tuple(float(column[index]) for column in columns)
+        # 逐位比较（== 对 NaN 不成立，用 repr 同时覆盖 NaN 和 -0.0）
+        assert [repr(value) for value in actual] == [repr(float(value)) for value in expected], \
+            f"{kind} 第 {index} 根K线不一致: {actual} != {expected}"
+
+    # 流式版本未就绪时向量化结果为 NaN（MACD 线在信号线就绪前已经有值，只检查信号线）
+    checked = columns[1:2] if kind == 'macd' else columns
+    for index in range(N):
+        if streamed[index] is None:
+            assert all(math.isnan(column[index]) for column in checked), f"{kind} 第 {index} 根应为 NaN"
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from database import ConnectionManager
+from trading import VirtualTrader
+
+# 与 cmd/balance.py set 相同的写入路径，在独立进程中执行
+SET_BALANCE_SCRIPT = '''
+import sys
+from trading import VirtualTrader
+VirtualTrader(sys.argv[1], async_journal=False).update_balance(float(sys.argv[2]))
+'''
+
+def _set_balance_in_other_process(db_path, amount):
+    subprocess.run([sys.executable, '-c', SET_BALANCE_SCRIPT, db_path, str(amount)],
+                   cwd=ROOT, check=True, capture_output=True)
+
+def test_set_from_other_process_is_detected(tmp_path):
+    db_path = str(tmp_path / 'ledger.db')
+    trader = VirtualTrader(db_path, async_journal=False)
+    trader.virtual_buy('BTC/USDC', 50000.0, 100.0)
+    assert trader.get_usdc_balance() == 900.0
+
+    _set_balance_in_other_process(db_path, 5000.0)
+
+    # 读取仍走内存缓存，直到检查版本号
+    assert trader.get_usdc_balance() == 900.0
+    assert trader.refresh_ledger()
+    assert trader.get_usdc_balance() == 5000.0
+    assert trader.get_position('BTC/USDC')[0] > 0
+    # 版本号没有再变化时不会重复加载
+    assert not trader.refresh_ledger()
+
+    # 交易路径在写锁内自动检查，基于外部设置后的余额计算
+    balance, _ = trader.virtual_buy('BTC/USDC', 50000.0, 100.0)
+    assert balance == 4900.0
+
+def test_own_writes_do_not_trigger_reload(tmp_path):
+    trader = VirtualTrader(str(tmp_path / 'ledger.db'), async_journal=False)
+    trader.update_balance(2000.0)
+    trader.virtual_buy('BTC/USDC', 50000.0, 100.0)
+    assert not trader.refresh_ledger()
+    assert trader.get_usdc_balance() == 1900.0
+
+def test_raw_sql_write_requires_invalidate(tmp_path):
+    db_path = str(tmp_path / 'ledger.db')
+    trader = VirtualTrader(db_path, async_journal=False)
+    assert trader.get_usdc_balance() == 1000.0
+
+    # 绕过 VirtualTrader 直接改表，且不增加 ledger_version
+    db = ConnectionManager.get(db_path)
+    with db.transaction():
+        db.execute("UPDATE virtual_balance_state SET usdc_balance = 3000.0 WHERE account = 'default'")
+
+    # 版本号未变化，缓存无法察觉这次写入
+    assert not trader.refresh_ledger()
+    assert trader.get_usdc_balance() == 1000.0
+
+    invalidated = []
+    trader.ledger.add_invalidation_listener(lambda: invalidated.append(True))
+    trader.invalidate_cache()
+    assert invalidated
+    assert trader.get_usdc_balance() == 3000.0
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ConnectionManager
+from ledger_verify import repair_ledger, verify_ledger
+from trading import VirtualTrader
+
+def _trade_then_compact(db_path, set_balance=None):
+    """买入一笔，可选地再外部设置余额，然后把全部余额流水压缩为检查点"""
+    trader = VirtualTrader(db_path, async_journal=False)
+    trader.virtual_buy('BTC/USDC', 50000.0, 50.0)
+    if set_balance is not None:
+        trader.update_balance(set_balance, reason='SET')
+    db = ConnectionManager.get(db_path)
+    db.execute("UPDATE virtual_balance SET updated_at = datetime('now', '-30 days')")
+    assert trader.compact_balance_journal(keep_days=7) > 0
+    assert db.execute('SELECT COUNT(*) FROM virtual_balance').fetchone()[0] == 0
+    return trader
+
+def _balance_item(report, account='default'):
+    return next(item for item in report['balances'] if item['account'] == account)
+
+def test_compacted_trades_verify_against_replay(tmp_path):
+    db_path = str(tmp_path / 'ledger.db')
+    _trade_then_compact(db_path)
+
+    report = verify_ledger(db_path)
+    assert report['ok']
+    assert _balance_item(report)['source'] == 'trades'
+    assert _balance_item(report)['expected_balance'] == 950.0
+
+def test_set_after_last_trade_survives_compaction(tmp_path):
+    db_path = str(tmp_path / 'ledger.db')
+    trader = _trade_then_compact(db_path, set_balance=5000.0)
+
+    report = verify_ledger(db_path)
+    assert report['ok']
+    assert _balance_item(report)['source'] == 'checkpoint'
+    assert _balance_item(report)['expected_balance'] == 5000.0
+
+    assert repair_ledger(db_path, report) == 0
+    trader.invalidate_cache()
+    assert trader.get_usdc_balance() == 5000.0
+
+def test_drift_after_compaction_repairs_to_checkpoint(tmp_path):
+    db_path = str(tmp_path / 'ledger.db')
+    trader = _trade_then_compact(db_path, set_balance=5000.0)
+    ConnectionManager.get(db_path).execute("UPDATE virtual_balance_state SET usdc_balance = 123.0")
+
+    report = verify_ledger(db_path)
+    assert not report['ok']
+    assert _balance_item(report)['expected_balance'] == 5000.0
+
+    assert repair_ledger(db_path, report) == 1
+    trader.invalidate_cache()
+    assert trader.get_usdc_balance() == 5000.0
+    assert verify_ledger(db_path)['ok']
+
+def test_report_is_json_serializable(tmp_path):
+    db_path = str(tmp_path / 'ledger.db')
+    trader = VirtualTrader(db_path, async_journal=False)
+    trader.virtual_buy('BTC/USDC', 50000.0, 100.0)
+    trader.virtual_sell('BTC/USDC', 52000.0, 0.5)
+
+    report = verify_ledger(db_path)
+    assert report['ok']
+    # 余额与持仓条目的 ok 都是 Python bool（而不是 numpy.bool_）
+    assert all(type(item['ok']) is bool for item in report['positions'] + report['balances'])
+    assert json.loads(json.dumps(report))['positions'][0]['ok'] is True
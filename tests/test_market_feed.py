@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from candle_buffer import get_candle_buffer
+from market_feed import HAS_WEBSOCKETS, MarketFeed, ReplayWebSocketServer
+
+STEP = 60 * 1000
+
+def _candle(ts, close=100.0):
+    return [ts, close, close, close, close, 1.0]
+
+class PagedExchange:
+    """每次最多返回 page_limit 根K线的 REST 替身"""
+
+    def __init__(self, start_ts, end_ts, page_limit=3):
+        self.candles = [_candle(ts, float(ts // STEP)) for ts in range(start_ts, end_ts + 1, STEP)]
+        self.page_limit = page_limit
+        self.calls = []
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append((since, limit))
+        limit = min(limit or self.page_limit, self.page_limit)
+        if since is None:
+            return self.candles[-limit:]
+        return [candle for candle in self.candles if candle[0] >= since][:limit]
+
+def _feed(symbol, exchange=None, urls=None, channels=('candles',)):
+    return MarketFeed([symbol], timeframes=['1m'], channels=list(channels), exchange=exchange,
+                      urls=urls or {'public': '', 'business': ''}, record_path='')
+
+def test_resync_pages_forward_over_gap():
+    symbol = 'PAGE/USDT'
+    current_ts = int(time.time() * 1000) // STEP * STEP
+    buffer = get_candle_buffer(symbol, '1m', capacity=50)
+    buffer.extend([_candle(current_ts - (20 - i) * STEP) for i in range(5)])
+
+    exchange = PagedExchange(current_ts - 30 * STEP, current_ts, page_limit=3)
+    _feed(symbol, exchange).resync()
+
+    timestamps = buffer.timestamps.tolist()
+    assert timestamps[-1] == current_ts
+    assert all(b - a == STEP for a, b in zip(timestamps, timestamps[1:]))
+    assert len(exchange.calls) > 1
+
+def test_resync_refills_when_gap_exceeds_capacity():
+    symbol = 'REFILL/USDT'
+    current_ts = int(time.time() * 1000) // STEP * STEP
+    buffer = get_candle_buffer(symbol, '1m', capacity=10)
+    buffer.extend([_candle(current_ts - 100 * STEP)])
+
+    exchange = PagedExchange(current_ts - 200 * STEP, current_ts, page_limit=10)
+    _feed(symbol, exchange).resync()
+
+    timestamps = buffer.timestamps.tolist()
+    assert len(timestamps) == 10
+    assert timestamps[-1] == current_ts
+    assert all(b - a == STEP for a, b in zip(timestamps, timestamps[1:]))
+
+def _candle_message(inst_id, ts, closed=True):
+    return {'arg': {'channel': 'candle1m', 'instId': inst_id},
+            'data': [[str(ts), '1', '2', '0.5', '1.5', '10', '0', '0', '1' if closed else '0']]}
+
+def test_wait_for_update_keeps_candles_closed_between_calls():
+    feed = _feed('WAIT/USDT')
+    feed.handle_message(_candle_message('WAIT-USDT', 0))
+    assert feed.wait_for_update(0)
+    assert not feed.wait_for_update(0)
+
+    # 两次等待之间收盘的K线不会丢失
+    feed.handle_message(_candle_message('WAIT-USDT', STEP))
+    assert feed.wait_for_update(0)
+
+@pytest.mark.skipif(not HAS_WEBSOCKETS, reason="未安装 websockets")
+def test_replay_server_drives_feed(tmp_path):
+    record_path = tmp_path / 'feed.jsonl'
+    messages = [_candle_message('REPLAY-USDT', ts, closed=ts > 0) for ts in (0, STEP, 2 * STEP)]
+    with open(record_path, 'w', encoding='utf-8') as f:
+        for i, message in enumerate(messages):
+            f.write(json.dumps({'t': i * 0.01, 'endpoint': 'business', 'msg': json.dumps(message)}) + '\n')
+
+    server = ReplayWebSocketServer(str(record_path), speed=0).start()
+    feed = _feed('REPLAY/USDT', urls=server.urls())
+    feed.start()
+    try:
+        deadline = time.monotonic() + 5
+        buffer = get_candle_buffer('REPLAY/USDT', '1m')
+        while buffer.last_ts != 2 * STEP and time.monotonic() < deadline:
+            feed.wait_for_update(0.5)
+        assert buffer.timestamps.tolist() == [0, STEP, 2 * STEP]
+        assert feed.is_connected()
+        assert feed.is_live('REPLAY/USDT', '1m')
+        assert server.connections == 1
+    finally:
+        feed.stop()
+        server.stop()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from request_scheduler import RequestScheduler
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.001)
+
+def _run_concurrently(count, target):
+    """在 count 个线程中执行 target，返回每个线程的 (结果, 异常)"""
+    outcomes = [None] * count
+
+    def worker(index):
+        try:
+            outcomes[index] = (target(), None)
+        except Exception as e:
+            outcomes[index] = (None, e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+class BlockingTicker:
+    """在 release 之前阻塞的 fetch_ticker 替身"""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.release = threading.Event()
+        self.error = error
+
+    def __call__(self, symbol):
+        self.calls += 1
+        assert self.release.wait(5.0)
+        if self.error is not None:
+            raise self.error
+        return {'symbol': symbol, 'last': 100.0}
+
+def test_concurrent_identical_calls_are_coalesced():
+    scheduler = RequestScheduler(limits={'default': (100, 1)})
+    fetch_ticker = BlockingTicker()
+
+    threads, outcomes = _run_concurrently(
+        10, lambda: scheduler.call('fetch_ticker', fetch_ticker, 'BTC/USDT'))
+    # 第一个调用方发出请求后，其余 9 个都在等待同一个结果
+    _wait_until(lambda: scheduler.stats['coalesced'] == 9)
+    fetch_ticker.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert fetch_ticker.calls == 1
+    assert scheduler.stats['requests'] == 1
+    results = [result for result, error in outcomes]
+    assert all(error is None for result, error in outcomes)
+    assert all(result is results[0] for result in results)
+    assert results[0] == {'symbol': 'BTC/USDT', 'last': 100.0}
+
+    # 请求完成后不再合并，下一次调用重新发出
+    assert scheduler.call('fetch_ticker', lambda symbol: symbol, 'ETH/USDT') == 'ETH/USDT'
+    assert scheduler.stats['requests'] == 2
+
+def test_coalesced_error_reaches_every_waiter():
+    scheduler = RequestScheduler(limits={'default': (100, 1)})
+    failure = ValueError("交易所返回错误")
+    fetch_ticker = BlockingTicker(error=failure)
+
+    threads, outcomes = _run_concurrently(
+        10, lambda: scheduler.call('fetch_ticker', fetch_ticker, 'BTC/USDT'))
+    _wait_until(lambda: scheduler.stats['coalesced'] == 9)
+    fetch_ticker.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert fetch_ticker.calls == 1
+    assert all(result is None and error is failure for result, error in outcomes)
+
+    # 失败的请求不会留在合并表中
+    fetch_ticker.error = None
+    assert scheduler.call('fetch_ticker', fetch_ticker, 'BTC/USDT')['last'] == 100.0
+    assert fetch_ticker.calls == 2
+
+def test_waiters_are_served_by_priority_then_arrival():
+    scheduler = RequestScheduler(limits={'default': (1, 0.02)})
+    bucket = scheduler.buckets['default']
+    served = []
+
+    def request(lane, name):
+        with scheduler.priority(lane):
+            scheduler.call('fetch_ticker', served.append, name)
+
+    # 暂停令牌桶，让所有请求先排队
+    bucket.penalize(0.5)
+    arrivals = [('backfill', 'backfill'), ('market', 'market-1'), ('account', 'account'),
+                ('order', 'order'), ('market', 'market-2')]
+    threads = []
+    for lane, name in arrivals:
+        thread = threading.Thread(target=request, args=(lane, name))
+        thread.start()
+        threads.append(thread)
+        _wait_until(lambda: len(bucket._waiters) == len(threads))
+    assert not served
+    for thread in threads:
+        thread.join()
+
+    assert served == ['order', 'account', 'market-1', 'market-2', 'backfill']
+
+def test_unknown_priority_lane_is_rejected():
+    scheduler = RequestScheduler(limits={'default': (100, 1)})
+    with pytest.raises(ValueError):
+        with scheduler.priority('urgent'):
+            pass
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ConnectionManager
+from trading import VirtualTrader
+
+class InjectedFailure(Exception):
+    pass
+
+def _fail_after_balance_update(monkeypatch, trader):
+    """余额已经写入之后、持仓和交易记录写入之前抛出异常"""
+    original = trader.update_balance
+    calls = []
+
+    def update_balance(*args, **kwargs):
+        original(*args, **kwargs)
+        calls.append(args)
+
+    def update_position(*args, **kwargs):
+        raise InjectedFailure("持仓写入失败")
+
+    monkeypatch.setattr(trader, 'update_balance', update_balance)
+    monkeypatch.setattr(trader, 'update_position', update_position)
+    return calls
+
+def _persisted(trader):
+    db = ConnectionManager.get(trader.db_path)
+    state = db.execute('SELECT usdc_balance FROM virtual_balance_state WHERE account = ?',
+                       (trader.account,)).fetchone()[0]
+    journal = db.execute('SELECT COUNT(*) FROM virtual_balance').fetchone()[0]
+    trades = db.execute('SELECT COUNT(*) FROM trading_records').fetchone()[0]
+    positions = db.execute('SELECT COUNT(*) FROM virtual_positions').fetchone()[0]
+    return state, journal, trades, positions
+
+def test_failed_buy_rolls_back_balance_and_trade(tmp_path, monkeypatch):
+    trader = VirtualTrader(str(tmp_path / 'ledger.db'), async_journal=False)
+    before = _persisted(trader)
+    calls = _fail_after_balance_update(monkeypatch, trader)
+
+    with pytest.raises(InjectedFailure):
+        trader.virtual_buy('BTC/USDC', 50000.0, 100.0)
+
+    assert calls, "异常必须发生在余额更新之后"
+    assert _persisted(trader) == before
+    # 提交后回调被丢弃，内存账本也没有变化
+    assert trader.get_usdc_balance() == before[0]
+    assert not trader.db.in_transaction()
+
+def test_failed_sell_rolls_back_balance_and_trade(tmp_path, monkeypatch):
+    trader = VirtualTrader(str(tmp_path / 'ledger.db'), async_journal=False)
+    trader.virtual_buy('BTC/USDC', 50000.0, 100.0)
+    before = _persisted(trader)
+    position = trader.get_position('BTC/USDC')
+    calls = _fail_after_balance_update(monkeypatch, trader)
+
+    with pytest.raises(InjectedFailure):
+        trader.virtual_sell('BTC/USDC', 52000.0, 1.0)
+
+    assert calls
+    assert _persisted(trader) == before
+    assert trader.get_usdc_balance() == before[0]
+    assert trader.get_position('BTC/USDC') == position
+
+def test_nested_failure_rolls_back_outer_transaction(tmp_path, monkeypatch):
+    trader = VirtualTrader(str(tmp_path / 'ledger.db'), async_journal=False)
+    before = _persisted(trader)
+
+    with pytest.raises(InjectedFailure):
+        with trader.db.transaction():
+            # 内层事务正常完成，但只有最外层负责提交
+            trader.virtual_buy('BTC/USDC', 50000.0, 100.0)
+            _fail_after_balance_update(monkeypatch, trader)
+            trader.virtual_buy('ETH/USDC', 3000.0, 100.0)
+
+    # 第一笔成交与失败的第二笔一起回滚
+    assert _persisted(trader) == before
+    assert trader.get_usdc_balance() == before[0]
+    assert trader.get_position('BTC/USDC') == (0.0, 0.0, 0.0)
+    assert not trader.db.in_transaction()
+
+    # 回滚后连接可以继续正常使用
+    monkeypatch.undo()
+    trader.virtual_buy('BTC/USDC', 50000.0, 100.0)
+    state, journal, trades, positions = _persisted(trader)
+    assert (state, journal, trades, positions) == (before[0] - 100.0, before[1] + 1, 1, 1)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trading_framework import MarketData, SignalType, TradingFramework, TradingPlugin, TradingSignal
+
+class DelayPlugin(TradingPlugin):
+    """等待 delay 秒后返回信号；设置 release 时一直等到 release 被设置"""
+
+    def __init__(self, name, signal_type=SignalType.HOLD, delay=0.0, release=None, dependencies=()):
+        super().__init__(name)
+        self.signal_type = signal_type
+        self.delay = delay
+        self.release = release
+        self.calls = 0
+        self.set_dependencies(list(dependencies))
+
+    def analyze(self, market_data, position_info):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(10.0)
+        time.sleep(self.delay)
+        # 依赖其它插件时带上上游的信号，顺便检查依赖结果有没有传到
+        upstream = ','.join(f"{dep}={market_data.get_upstream(dep).signal_type.value}"
+                            for dep in self.dependencies if market_data.get_upstream(dep))
+        return TradingSignal(self.signal_type, market_data.symbol, market_data.price, 0.5, reason=upstream)
+
+    def get_config(self):
+        return {}
+
+def _market_data():
+    return MarketData(symbol='BTC/USDT', price=50000.0, timestamp=time.time())
+
+def _framework(parallel, release=None, plugin_timeout=None):
+    """完成顺序与注册顺序相反：越靠前的插件越慢"""
+    framework = TradingFramework(parallel=parallel, max_workers=4, plugin_timeout=plugin_timeout)
+    framework.register_plugin(DelayPlugin('trend', SignalType.BUY, delay=0.15))
+    framework.register_plugin(DelayPlugin('slow', SignalType.SELL, release=release))
+    framework.register_plugin(DelayPlugin('momentum', SignalType.HOLD, delay=0.05))
+    framework.register_plugin(DelayPlugin('filter', SignalType.BUY, dependencies=['trend', 'momentum']))
+    framework.register_plugin(DelayPlugin('volume', SignalType.SELL))
+    return framework
+
+def _summary(signals):
+    return [(signal.plugin_name, signal.signal_type, signal.reason) for signal in signals]
+
+def test_parallel_signal_order_matches_sequential():
+    sequential = _framework(parallel=False)
+    parallel = _framework(parallel=True, plugin_timeout=5.0)
+    try:
+        expected = _summary(sequential.get_trading_decision(_market_data(), {}))
+        assert [name for name, _, _ in expected] == sequential.plugin_order
+        assert ('filter', SignalType.BUY, 'trend=BUY,momentum=HOLD') in expected
+        assert _summary(parallel.get_trading_decision(_market_data(), {})) == expected
+    finally:
+        parallel.shutdown()
+
+def test_slow_plugin_times_out_and_straggler_is_skipped():
+    release = threading.Event()
+    framework = _framework(parallel=True, release=release, plugin_timeout=0.3)
+    sequential = _framework(parallel=False)
+    slow = framework.plugins['slow']
+    try:
+        expected = [item for item in _summary(sequential.get_trading_decision(_market_data(), {}))
+                    if item[0] != 'slow']
+
+        started = time.monotonic()
+        signals = framework.get_trading_decision(_market_data(), {})
+        elapsed = time.monotonic() - started
+        # 慢插件的结果被丢弃，其余插件的信号顺序与逐个执行时一致
+        assert _summary(signals) == expected
+        assert 0.3 <= elapsed < 2.0
+        assert slow.cancel_event.is_set()
+        assert 'slow' in framework._stragglers
+
+        # 上一轮超时的插件仍在运行，本轮跳过，不会再提交一次
+        assert _summary(framework.get_trading_decision(_market_data(), {})) == expected
+        assert slow.calls == 1
+
+        # 插件结束后下一轮恢复执行
+        release.set()
+        framework._stragglers['slow'].result(timeout=5.0)
+        signals = framework.get_trading_decision(_market_data(), {})
+        assert [signal.plugin_name for signal in signals] == framework.plugin_order
+        assert slow.calls == 2
+        assert not slow.cancel_event.is_set()
+    finally:
+        release.set()
+        framework.shutdown()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from database import ConnectionManager
+
+TRADE_INSERT_SQL = '''
+    INSERT INTO trading_records
+    (symbol, action, amount, price, usdc_amount, balance_before, balance_after,
+     position_before, position_after, datetime, signal_reason, ts_ms, account)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+EVENT_INSERT_SQL = '''
+    INSERT INTO audit_events (event_type, payload, ts_ms, account)
+    VALUES (?, ?, ?, ?)
+'''
+
+class TradeJournalWriter:
+    """异步交易流水写入器
+
+    交易记录和审计事件先进入有界队列，由后台线程批量写入（group commit），
+    交易决策线程不再等待磁盘I/O。flush() 作为屏障，保证调用前提交的数据都已落库。
+    余额和持仓已经同步提交，交易记录不能丢失：批量写入失败时按退避间隔重试同一批次，
+    直到成功为止（期间队列写满时提交方阻塞，交易暂停而不是账本不一致）。
+    """
+
+    # 持久性级别 -> 写入线程连接的 synchronous 设置
+    DURABILITY_LEVELS = {
+        'off': 'OFF',  # 不等待落盘，进程崩溃不丢数据，系统崩溃可能丢失最近的批次
+        'normal': 'NORMAL',  # WAL模式下检查点时才fsync
+        'full': 'FULL',  # 每个批次提交都fsync
+    }
+
+    # 写入失败后的重试间隔（秒），逐次翻倍
+    RETRY_DELAY = 0.1
+    RETRY_MAX_DELAY = 5.0
+
+    _writers: Dict[str, 'TradeJournalWriter'] = {}
+    _writers_lock = threading.Lock()
+
+    def __init__(self, db_path: str, queue_size: int = 10000, flush_interval: float = 0.5,
+                 batch_size: int = 500, durability: str = 'normal'):
+        if durability not in self.DURABILITY_LEVELS:
+            raise ValueError(f"durability 必须是 {list(self.DURABILITY_LEVELS)} 之一")
+        self.db_path = db_path
+        self.db = ConnectionManager.get(db_path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.durability = durability
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._unwritten = 0  # 正在写入（或重试中）的批次条数
+        self.logger = logging.getLogger("trade_journal")
+
+    @classmethod
+    def get(cls, db_path: str) -> 'TradeJournalWriter':
+        """获取指定数据库共享的写入器（按配置创建并启动）"""
+        from config import Config
+        key = os.path.abspath(db_path)
+        with cls._writers_lock:
+            writer = cls._writers.get(key)
+            if writer is None or writer._closed:
+                db_config = Config.get_database_config()
+                writer = cls(
+                    db_path,
+                    queue_size=db_config.get('journal_queue_size', 10000),
+                    flush_interval=db_config.get('journal_flush_interval', 0.5),
+                    batch_size=db_config.get('journal_batch_size', 500),
+                    durability=db_config.get('journal_durability', 'normal'),
+                )
+                writer.start()
+                cls._writers[key] = writer
+        return writer
+
+    def start(self):
+        """启动后台写入线程"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="trade-journal-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit_trade(self, row: Tuple):
+        """提交一条交易记录（参数顺序与 TRADE_INSERT_SQL 一致），队列满时阻塞"""
+        self._put(('trade', row))
+
+    def submit_event(self, event_type: str, payload: Dict[str, Any], account: str = 'default'):
+        """提交一条审计事件"""
+        ts_ms = int(time.time() * 1000)
+        self._put(('event', (event_type, json.dumps(payload, ensure_ascii=False, default=str), ts_ms, account)))
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def _put(self, item):
+        if self._closed:
+            raise RuntimeError("交易流水写入器已关闭")
+        self._queue.put(item)
+
+    def flush(self, fsync: bool = False, timeout: Optional[float] = None) -> bool:
+        """等待此前提交的所有数据写入数据库
+        Args:
+            fsync: 是否额外执行WAL检查点，确保数据已同步到磁盘
+        Returns: 是否在超时前完成
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.empty()
+        done = threading.Event()
+        self._queue.put(('barrier', (done, fsync)))
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """刷新剩余数据并停止写入线程（进程退出时自动调用）"""
+        if self._closed:
+            return
+        self.flush(fsync=True, timeout=timeout)
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(('stop', None))
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                pending = self._unwritten + self._queue.qsize()
+                self.logger.error(f"交易流水写入器未能在 {timeout} 秒内完成写入，约 {pending} 条记录尚未落库")
+
+    def _run(self):
+        conn = self.db.connection()
+        conn.execute(f'PRAGMA synchronous={self.DURABILITY_LEVELS[self.durability]}')
+
+        while True:
+            batch = self._collect_batch()
+            trades = [payload for kind, payload in batch if kind == 'trade']
+            events = [payload for kind, payload in batch if kind == 'event']
+            barriers = [payload for kind, payload in batch if kind == 'barrier']
+
+            if trades or events:
+                self._write_batch(trades, events)
+
+            if any(fsync for _, fsync in barriers):
+                try:
+                    conn.execute('PRAGMA wal_checkpoint(FULL)')
+                except Exception as e:
+                    self.logger.error(f"WAL检查点失败: {e}")
+            for done, _ in barriers:
+                done.set()
+
+            if any(kind == 'stop' for kind, _ in batch):
+                self.db.close()
+                return
+
+    def _write_batch(self, trades: List[Tuple], events: List[Tuple]):
+        """写入一个批次，失败时重试直到成功（不丢弃数据）"""
+        self._unwritten = len(trades) + len(events)
+        delay = self.RETRY_DELAY
+        attempt = 0
+        while True:
+            try:
+                with self.db.transaction():
+                    if trades:
+                        self.db.executemany(TRADE_INSERT_SQL, trades)
+                    if events:
+                        self.db.executemany(EVENT_INSERT_SQL, events)
+                break
+            except Exception as e:
+                attempt += 1
+                self.logger.error(f"批量写入交易流水失败（第 {attempt} 次），{delay:.1f} 秒后重试 "
+                                  f"{len(trades)} 条交易和 {len(events)} 条事件: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.RETRY_MAX_DELAY)
+        if attempt:
+            self.logger.info(f"交易流水批次重试成功（共重试 {attempt} 次）")
+        self._unwritten = 0
+
+    def _collect_batch(self) -> List[Tuple[str, Any]]:
+        """阻塞等待第一条数据，然后在 flush_interval 内尽量凑满一个批次"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            # 屏障和停止请求需要尽快处理，不再继续等待
+            if batch[-1][0] in ('barrier', 'stop'):
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
@@ -1,248 +1,567 @@
 # -*- coding: utf-8 -*-
 
-import sqlite3
-import ccxt
 import os
+import threading
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from database import ConnectionManager
+from migrations import get_schema_version, migrate
+from request_scheduler import RequestScheduler, ScheduledExchange
+from trade_journal import EVENT_INSERT_SQL, TRADE_INSERT_SQL, TradeJournalWriter
+
+DEFAULT_ACCOUNT = 'default'
+
+def resolve_db_path(account: str = DEFAULT_ACCOUNT) -> str:
+    """根据配置确定账户使用的数据库文件
+
+    开启 per_account_db 后，非默认账户使用独立的数据库文件，
+    不同账户的机器人不再争用同一个SQLite写锁。
+    """
+    from config import Config
+    db_config = Config.get_database_config()
+    if db_config.get('per_account_db') and account != DEFAULT_ACCOUNT:
+        return db_config['account_db_template'].format(account=account)
+    return db_config['db_path']
+
+class LedgerCache:
+    """虚拟账本内存缓存
+
+    启动时从数据库加载一次余额和持仓，之后所有读取都走内存；
+    写操作先落库，提交成功后再更新缓存（写穿透）。
+    其他连接或进程（例如 cmd/balance.py set）修改余额或持仓时会增加
+    virtual_balance_state.ledger_version，缓存据此检测并重新加载，也可调用 invalidate() 强制失效。
+    交易流水、审计事件等其它表的写入不影响缓存。
+
+    注意：缓存只认 ledger_version。绕过 VirtualTrader 直接用 SQL 修改
+    virtual_balance_state 或 virtual_positions 而不增加版本号时（无论是否在同一进程），
+    refresh_if_stale() 察觉不到这次修改，写入方必须随后调用 invalidate()。
+    """
+
+    def __init__(self, db: ConnectionManager, account: str = DEFAULT_ACCOUNT):
+        self.db = db
+        self.account = account
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._usdc_balance = 0.0
+        self._positions: Dict[str, Tuple[float, float, float]] = {}
+        self._version: Optional[int] = None  # 加载时的账本版本号
+        self._listeners: List[Callable[[], None]] = []
+
+    def _read_version(self) -> int:
+        row = self.db.execute('SELECT ledger_version FROM virtual_balance_state WHERE account = ?',
+                              (self.account,)).fetchone()
+        return row[0] if row else 0
+
+    def load(self):
+        """从数据库加载余额和持仓"""
+        with self._lock:
+            # 先读版本号：读取期间发生的修改会在下次检查时触发重新加载
+            version = self._read_version()
+            result = self.db.execute('SELECT usdc_balance FROM virtual_balance_state WHERE account = ?',
+                                     (self.account,)).fetchone()
+            rows = self.db.execute('''
+                SELECT symbol, position_size, avg_price, total_cost
+                FROM virtual_positions
+                WHERE account = ?
+            ''', (self.account,)).fetchall()
+            self._usdc_balance = result[0] if result else 0.0
+            self._positions = {row[0]: (row[1], row[2], row[3]) for row in rows}
+            self._version = version
+            self._loaded = True
+            # 在写事务中加载时可能读到本事务尚未提交的修改，事务回滚后需要丢弃
+            self.db.on_rollback(self.invalidate)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def invalidate(self):
+        """使缓存失效，下次读取时重新加载，并通知监听者"""
+        with self._lock:
+            self._loaded = False
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def add_invalidation_listener(self, listener: Callable[[], None]):
+        """注册缓存失效回调"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def advance_version(self, previous: int, current: int):
+        """本进程的写入提交后记录新版本号（写入前缓存是最新的才记录，否则保持过期以便重新加载）"""
+        with self._lock:
+            if self._loaded and self._version == previous:
+                self._version = current
+
+    def refresh_if_stale(self) -> bool:
+        """检查账本是否被其他连接修改过，若是则重新加载
+        Returns: 是否发生了重新加载
+        """
+        with self._lock:
+            if not self._loaded:
+                self.load()
+                return True
+            if self._version == self._read_version():
+                return False
+        self.invalidate()
+        self.load()
+        return True
+
+    def get_balance(self) -> float:
+        with self._lock:
+            self._ensure_loaded()
+            return self._usdc_balance
+
+    def get_position(self, symbol: str) -> Tuple[float, float, float]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._positions.get(symbol, (0.0, 0.0, 0.0))
+
+    def get_all_positions(self) -> Dict[str, Tuple[float, float, float]]:
+        with self._lock:
+            self._ensure_loaded()
+            return dict(self._positions)
+
+    def set_balance(self, usdc_balance: float):
+        """写穿透：数据库提交后更新缓存中的余额"""
+        with self._lock:
+            self._usdc_balance = usdc_balance
+
+    def set_position(self, symbol: str, position_size: float, avg_price: float, total_cost: float):
+        """写穿透：数据库提交后更新缓存中的持仓"""
+        with self._lock:
+            self._positions[symbol] = (position_size, avg_price, total_cost)
+
+@dataclass
+class TradeFill:
+    """单笔虚拟成交的计算结果（成交前后的余额与持仓）"""
+    symbol: str
+    action: str
+    executed: bool
+    price: float
+    balance_before: float
+    balance_after: float
+    position_before: float
+    position_after: float
+    amount: float = 0.0
+    usdc_amount: float = 0.0
+    avg_price_after: float = 0.0
+    total_cost_after: float = 0.0
+    realized_pnl: float = 0.0
+    note: str = ""  # 未执行原因或金额调整说明
+
+def plan_buy(symbol: str, usdc_balance: float, position: Tuple[float, float, float], current_price: float,
+             buy_amount_usdc: float, max_position_usdc: Optional[float] = None) -> TradeFill:
+    """计算一笔虚拟买入（不读写数据库）"""
+    position_size, avg_price, total_cost = position
+    
+    # 检查余额是否足够
+    if usdc_balance < buy_amount_usdc:
+        return TradeFill(symbol, 'BUY', False, current_price, usdc_balance, usdc_balance,
+                         position_size, position_size, avg_price_after=avg_price, total_cost_after=total_cost,
+                         note=f"虚拟 USDC 余额不足，当前余额: {usdc_balance:.2f}, 需要: {buy_amount_usdc:.2f}")
+    
+    # 检查是否超过最大持仓限制
+    note = ""
+    current_position_value = position_size * current_price
+    if max_position_usdc and (current_position_value + buy_amount_usdc) > max_position_usdc:
+        available_buy = max_position_usdc - current_position_value
+        if available_buy <= 0:
+            return TradeFill(symbol, 'BUY', False, current_price, usdc_balance, usdc_balance,
+                             position_size, position_size, avg_price_after=avg_price, total_cost_after=total_cost,
+                             note=f"已达到最大持仓限制 {max_position_usdc:.2f} USDC，无法继续买入")
+        buy_amount_usdc = min(buy_amount_usdc, available_buy)
+        note = f"调整买入金额至 {buy_amount_usdc:.2f} USDC 以符合持仓限制"
+    
+    amount_to_buy = buy_amount_usdc / current_price
+    
+    # 计算新的持仓信息
+    new_position_size = position_size + amount_to_buy
+    new_total_cost = total_cost + buy_amount_usdc
+    new_avg_price = new_total_cost / new_position_size if new_position_size > 0 else 0.0
+    
+    new_usdc_balance = usdc_balance - buy_amount_usdc
+    
+    return TradeFill(symbol, 'BUY', True, current_price, usdc_balance, new_usdc_balance,
+                     position_size, new_position_size, amount=amount_to_buy, usdc_amount=buy_amount_usdc,
+                     avg_price_after=new_avg_price, total_cost_after=new_total_cost, note=note)
+
+def plan_sell(symbol: str, usdc_balance: float, position: Tuple[float, float, float], current_price: float,
+              sell_percentage: float = 1.0) -> TradeFill:
+    """计算一笔虚拟卖出（不读写数据库）"""
+    position_size, avg_price, total_cost = position
+    
+    if position_size <= 0:
+        return TradeFill(symbol, 'SELL', False, current_price, usdc_balance, usdc_balance,
+                         position_size, 0.0, avg_price_after=avg_price, total_cost_after=total_cost,
+                         note="没有虚拟持仓可以卖出。")
+    
+    # 计算卖出数量
+    amount_to_sell = position_size * sell_percentage
+    if amount_to_sell <= 0:
+        return TradeFill(symbol, 'SELL', False, current_price, usdc_balance, usdc_balance,
+                         position_size, position_size, avg_price_after=avg_price, total_cost_after=total_cost,
+                         note="卖出数量为0，无需执行交易。")
+    
+    usdc_gained = amount_to_sell * current_price
+    
+    # 计算新的持仓信息
+    new_position_size = position_size - amount_to_sell
+    new_total_cost = total_cost * (new_position_size / position_size) if position_size > 0 else 0.0
+    new_avg_price = avg_price if new_position_size > 0 else 0.0
+    
+    # 盈亏信息
+    cost_of_sold = (amount_to_sell / position_size) * total_cost if position_size > 0 else 0.0
+    profit_loss = usdc_gained - cost_of_sold
+    
+    new_usdc_balance = usdc_balance + usdc_gained
+    
+    return TradeFill(symbol, 'SELL', True, current_price, usdc_balance, new_usdc_balance,
+                     position_size, new_position_size, amount=amount_to_sell, usdc_amount=usdc_gained,
+                     avg_price_after=new_avg_price, total_cost_after=new_total_cost, realized_pnl=profit_loss)
 
 class VirtualTrader:
-    def __init__(self, db_path: str = "trading.db"):
-        self.db_path = db_path
+    # 已完成建表的数据库（同一进程内只初始化一次）
+    _initialized_dbs = set()
+    # 同一进程内按 (数据库, 账户) 共享的账本缓存
+    _ledgers: Dict[Tuple[str, str], LedgerCache] = {}
+
+    def __init__(self, db_path: Optional[str] = None, async_journal: Optional[bool] = None,
+                 account: str = DEFAULT_ACCOUNT):
+        self.account = account
+        self.db_path = db_path or resolve_db_path(account)
+        self.db = ConnectionManager.get(self.db_path)
         self._init_database()
+        ledger_key = (os.path.abspath(self.db_path), account)
+        if ledger_key not in VirtualTrader._ledgers:
+            self._init_account()
+            VirtualTrader._ledgers[ledger_key] = LedgerCache(self.db, account)
+        self.ledger = VirtualTrader._ledgers[ledger_key]
+        
+        # 异步交易流水模式：交易记录和审计事件由后台线程批量提交
+        if async_journal is None:
+            from config import Config
+            async_journal = Config.get_database_config().get('async_journal', False)
+        self.journal = TradeJournalWriter.get(self.db_path) if async_journal else None
     
     def _init_database(self):
-        """Initialize database with tables if they don't exist"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create tables
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS virtual_balance (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                usdc_balance REAL NOT NULL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS trading_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol TEXT NOT NULL,
-                action TEXT NOT NULL,
-                amount REAL NOT NULL,
-                price REAL NOT NULL,
-                usdc_amount REAL NOT NULL,
-                balance_before REAL NOT NULL,
-                balance_after REAL NOT NULL,
-                position_before REAL NOT NULL,
-                position_after REAL NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                datetime TEXT,  -- 添加可读日期时间
-                signal_reason TEXT  -- 添加交易信号原因
-            )
-        ''')
-        
-        # 新增持仓表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS virtual_positions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol TEXT NOT NULL UNIQUE,
-                position_size REAL NOT NULL DEFAULT 0.0,
-                avg_price REAL NOT NULL DEFAULT 0.0,
-                total_cost REAL NOT NULL DEFAULT 0.0,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        """Initialize database: 按版本执行尚未应用的迁移"""
+        db_key = os.path.abspath(self.db_path)
+        if db_key in VirtualTrader._initialized_dbs:
+            return
         
-        # Initialize balance if empty
-        cursor.execute('SELECT COUNT(*) FROM virtual_balance')
-        if cursor.fetchone()[0] == 0:
-            cursor.execute('INSERT INTO virtual_balance (usdc_balance) VALUES (1000.0)')
-        
-        conn.commit()
-        conn.close()
+        migrate(self.db)
+        VirtualTrader._initialized_dbs.add(db_key)
+    
+    def _init_account(self):
+        """新账户初始化余额"""
+        with self.db.transaction():
+            cursor = self.db.execute('''
+                INSERT OR IGNORE INTO virtual_balance_state (account, usdc_balance) VALUES (?, 1000.0)
+            ''', (self.account,))
+            if cursor.rowcount:
+                self.db.execute("INSERT INTO virtual_balance (usdc_balance, reason, account) VALUES (1000.0, 'INIT', ?)",
+                                (self.account,))
     
     def get_usdc_balance(self) -> float:
         """Get current virtual USDC balance"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT usdc_balance FROM virtual_balance ORDER BY id DESC LIMIT 1')
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else 0.0
-    
-    def update_balance(self, new_balance: float):
-        """Update virtual USDC balance"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO virtual_balance (usdc_balance) VALUES (?)', (new_balance,))
-        conn.commit()
-        conn.close()
+        return self.ledger.get_balance()
+    
+    def update_balance(self, new_balance: float, reason: str = 'SET'):
+        """Update virtual USDC balance（原地更新当前余额，并追加一条流水）"""
+        with self.db.transaction():
+            self.db.execute('''
+                UPDATE virtual_balance_state SET usdc_balance = ?, updated_at = CURRENT_TIMESTAMP,
+                ledger_version = ledger_version + 1
+                WHERE account = ?
+            ''', (new_balance, self.account))
+            self.db.execute('INSERT INTO virtual_balance (usdc_balance, reason, account) VALUES (?, ?, ?)',
+                            (new_balance, reason, self.account))
+            self.db.on_commit(lambda: self.ledger.set_balance(new_balance))
+            self._track_ledger_version()
+    
+    def _bump_ledger_version(self):
+        """账本版本号加一（余额以外的账本修改，例如持仓）"""
+        self.db.execute('UPDATE virtual_balance_state SET ledger_version = ledger_version + 1 WHERE account = ?',
+                        (self.account,))
+        self._track_ledger_version()
+    
+    def _track_ledger_version(self):
+        """版本号加一之后调用：提交后缓存记录新版本号，本进程自己的写入不会触发重新加载"""
+        row = self.db.execute('SELECT ledger_version FROM virtual_balance_state WHERE account = ?',
+                              (self.account,)).fetchone()
+        if row is not None:
+            version = row[0]
+            self.db.on_commit(lambda: self.ledger.advance_version(version - 1, version))
+
+    def compact_balance_journal(self, keep_days: int = 7, accounts: Optional[Sequence[str]] = None) -> int:
+        """将 keep_days 天之前的余额流水按账户、按天汇总为检查点并删除原始流水
+        Args:
+            accounts: 只压缩这些账户，默认为该数据库中的全部账户
+        Returns: 被压缩的流水条数
+        """
+        # 只压缩完整的自然日（UTC），避免同一天生成多个检查点
+        cutoff = self.db.execute("SELECT date('now', ?)", (f'-{int(keep_days)} days',)).fetchone()[0]
+        where, params = 'updated_at < ?', (cutoff,)
+        if accounts:
+            where += f" AND account IN ({', '.join('?' * len(accounts))})"
+            params += tuple(accounts)
+        with self.db.transaction():
+            self.db.execute(f'''
+                INSERT INTO virtual_balance_checkpoints
+                (account, period_start, entries, first_journal_id, last_journal_id,
+                 open_balance, close_balance, min_balance, max_balance)
+                SELECT account, day, entries, first_id, last_id,
+                       (SELECT usdc_balance FROM virtual_balance WHERE id = first_id),
+                       (SELECT usdc_balance FROM virtual_balance WHERE id = last_id),
+                       min_balance, max_balance
+                FROM (
+                    SELECT account, date(updated_at) AS day, COUNT(*) AS entries,
+                           MIN(id) AS first_id, MAX(id) AS last_id,
+                           MIN(usdc_balance) AS min_balance, MAX(usdc_balance) AS max_balance
+                    FROM virtual_balance
+                    WHERE {where}
+                    GROUP BY account, day
+                )
+                ORDER BY account, day
+            ''', params)
+            cursor = self.db.execute(f'DELETE FROM virtual_balance WHERE {where}', params)
+            return cursor.rowcount
+
+    def refresh_ledger(self) -> bool:
+        """检查外部修改（例如 cmd/balance.py set）并在需要时重新加载账本缓存"""
+        return self.ledger.refresh_if_stale()
+
+    def invalidate_cache(self):
+        """强制账本缓存失效"""
+        self.ledger.invalidate()
 
     def record_trade(self, symbol: str, action: str, amount: float, price: float, 
                     usdc_amount: float, balance_before: float, balance_after: float,
                     position_before: float, position_after: float, signal_reason: str = ""):
         """Record a trading transaction"""
-        from datetime import datetime
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # 添加可读的日期时间格式，以及用于索引范围查询的毫秒时间戳
+        now = datetime.now()
+        readable_datetime = now.strftime('%Y-%m-%d %H:%M:%S')
+        ts_ms = int(now.timestamp() * 1000)
         
-        # 添加可读的日期时间格式
-        readable_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        row = (symbol, action, amount, price, usdc_amount, balance_before, balance_after,
+               position_before, position_after, readable_datetime, signal_reason, ts_ms, self.account)
         
-        cursor.execute('''
-            INSERT INTO trading_records 
-            (symbol, action, amount, price, usdc_amount, balance_before, balance_after, 
-             position_before, position_after, datetime, signal_reason)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (symbol, action, amount, price, usdc_amount, balance_before, balance_after,
-              position_before, position_after, readable_datetime, signal_reason))
-        conn.commit()
-        conn.close()
+        if self.journal is not None and not self.journal.closed:
+            # 异步模式：余额/持仓所在事务提交后才入队，回滚的成交不会留下交易记录
+            self.db.on_commit(lambda: self._submit_trade(row))
+        else:
+            self.db.execute(TRADE_INSERT_SQL, row)
+    
+    def _submit_trade(self, row: Tuple):
+        """提交后把交易记录交给异步写入器；写入器已关闭（例如进程正在退出）时同步写入"""
+        try:
+            self.journal.submit_trade(row)
+        except RuntimeError:
+            self.db.execute(TRADE_INSERT_SQL, row)
+
+    def record_event(self, event_type: str, payload: Dict):
+        """记录审计事件（例如交易决策）"""
+        if self.journal is not None and not self.journal.closed:
+            try:
+                self.journal.submit_event(event_type, payload, self.account)
+                return
+            except RuntimeError:
+                pass  # 写入器刚刚关闭，改为同步写入
+        import json
+        self.db.execute(EVENT_INSERT_SQL, (event_type, json.dumps(payload, ensure_ascii=False, default=str),
+                                           int(datetime.now().timestamp() * 1000), self.account))
+
+    def flush_journal(self, fsync: bool = False, timeout: Optional[float] = None) -> bool:
+        """等待异步交易流水全部落库（同步模式下直接返回）"""
+        if self.journal is None:
+            return True
+        return self.journal.flush(fsync=fsync, timeout=timeout)
+
+    def close(self):
+        """关闭前刷新异步交易流水"""
+        if self.journal is not None:
+            self.journal.close()
 
     def virtual_buy(self, symbol: str, current_price: float, buy_amount_usdc: float = 50.0, 
                    max_position_usdc: float = None, signal_reason: str = "") -> Tuple[float, float]:
-        """执行虚拟买入交易"""
-        usdc_balance = self.get_usdc_balance()
-        
-        # 检查余额是否足够
-        if usdc_balance < buy_amount_usdc:
-            print(f"虚拟 USDC 余额不足，当前余额: {usdc_balance:.2f}, 需要: {buy_amount_usdc:.2f}")
-            return usdc_balance, self.get_position(symbol)[0]
-
-        # 获取当前持仓
-        position_size, avg_price, total_cost = self.get_position(symbol)
-        
-        # 检查是否超过最大持仓限制
-        current_position_value = position_size * current_price
-        if max_position_usdc and (current_position_value + buy_amount_usdc) > max_position_usdc:
-            available_buy = max_position_usdc - current_position_value
-            if available_buy <= 0:
-                print(f"已达到最大持仓限制 {max_position_usdc:.2f} USDC，无法继续买入")
-                return usdc_balance, position_size
-            buy_amount_usdc = min(buy_amount_usdc, available_buy)
-            print(f"调整买入金额至 {buy_amount_usdc:.2f} USDC 以符合持仓限制")
-
-        amount_to_buy = buy_amount_usdc / current_price
-        print(f"执行虚拟买入订单：{amount_to_buy:.4f} {symbol} @ {current_price:.2f} (金额: {buy_amount_usdc:.2f} USDC)")
-        
-        # 计算新的持仓信息
-        new_position_size = position_size + amount_to_buy
-        new_total_cost = total_cost + buy_amount_usdc
-        new_avg_price = new_total_cost / new_position_size if new_position_size > 0 else 0.0
-        
-        new_usdc_balance = usdc_balance - buy_amount_usdc
-        
-        # 更新数据库
-        self.update_balance(new_usdc_balance)
-        self.update_position(symbol, new_position_size, new_avg_price, new_total_cost)
-        self.record_trade(symbol, 'BUY', amount_to_buy, current_price, buy_amount_usdc,
-                         usdc_balance, new_usdc_balance, position_size, new_position_size, signal_reason)
-        
-        return new_usdc_balance, new_position_size
+        """执行虚拟买入交易（读取与更新余额、持仓、交易记录在同一事务内完成）"""
+        with self.db.transaction():
+            # 持有写锁后确认缓存没有被其他连接改过
+            self.ledger.refresh_if_stale()
+            
+            fill = plan_buy(symbol, self.get_usdc_balance(), self.get_position(symbol),
+                            current_price, buy_amount_usdc, max_position_usdc)
+            if fill.note:
+                print(fill.note)
+            if not fill.executed:
+                return fill.balance_after, fill.position_after
+            
+            print(f"执行虚拟买入订单：{fill.amount:.4f} {symbol} @ {current_price:.2f} (金额: {fill.usdc_amount:.2f} USDC)")
+            
+            # 更新数据库（与上面的读取处于同一事务，只提交一次）
+            self._persist_fill(fill, signal_reason)
+            
+            return fill.balance_after, fill.position_after
 
     def virtual_sell(self, symbol: str, current_price: float, sell_percentage: float = 1.0, 
                     signal_reason: str = "") -> Tuple[float, float]:
-        """执行虚拟卖出交易"""
-        # 获取当前持仓
-        position_size, avg_price, total_cost = self.get_position(symbol)
-        
-        if position_size <= 0:
-            print("没有虚拟持仓可以卖出。")
-            return self.get_usdc_balance(), 0.0
-        
-        # 计算卖出数量
-        amount_to_sell = position_size * sell_percentage
-        if amount_to_sell <= 0:
-            print("卖出数量为0，无需执行交易。")
-            return self.get_usdc_balance(), position_size
-        
-        usdc_balance = self.get_usdc_balance()
-        usdc_gained = amount_to_sell * current_price
-        
-        # 计算新的持仓信息
-        new_position_size = position_size - amount_to_sell
-        new_total_cost = total_cost * (new_position_size / position_size) if position_size > 0 else 0.0
-        new_avg_price = avg_price if new_position_size > 0 else 0.0
-        
-        sell_type = "全仓" if sell_percentage >= 1.0 else f"{sell_percentage*100:.1f}%"
-        print(f"执行虚拟{sell_type}卖出订单：{amount_to_sell:.4f} {symbol} @ {current_price:.2f} (获得: {usdc_gained:.2f} USDC)")
-        
-        # 显示盈亏信息
-        cost_of_sold = (amount_to_sell / position_size) * total_cost if position_size > 0 else 0.0
-        profit_loss = usdc_gained - cost_of_sold
-        print(f"本次交易盈亏: {profit_loss:.2f} USDC")
+        """执行虚拟卖出交易（读取与更新余额、持仓、交易记录在同一事务内完成）"""
+        with self.db.transaction():
+            # 持有写锁后确认缓存没有被其他连接改过
+            self.ledger.refresh_if_stale()
+            
+            fill = plan_sell(symbol, self.get_usdc_balance(), self.get_position(symbol),
+                             current_price, sell_percentage)
+            if not fill.executed:
+                print(fill.note)
+                return fill.balance_after, fill.position_after
+            
+            sell_type = "全仓" if sell_percentage >= 1.0 else f"{sell_percentage*100:.1f}%"
+            print(f"执行虚拟{sell_type}卖出订单：{fill.amount:.4f} {symbol} @ {current_price:.2f} (获得: {fill.usdc_amount:.2f} USDC)")
+            
+            # 显示盈亏信息
+            print(f"本次交易盈亏: {fill.realized_pnl:.2f} USDC")
+            
+            # 更新数据库（与上面的读取处于同一事务，只提交一次）
+            self._persist_fill(fill, signal_reason)
+            
+            return fill.balance_after, fill.position_after
+
+    def _persist_fill(self, fill: 'TradeFill', signal_reason: str):
+        """写入单笔成交的余额、持仓和交易记录（需在事务中调用）"""
+        self.update_balance(fill.balance_after, reason=fill.action)
+        self.update_position(fill.symbol, fill.position_after, fill.avg_price_after, fill.total_cost_after)
+        self.record_trade(fill.symbol, fill.action, fill.amount, fill.price, fill.usdc_amount,
+                          fill.balance_before, fill.balance_after, fill.position_before, fill.position_after,
+                          signal_reason)
+
+    def apply_trades(self, symbols: Sequence[str], sides: Sequence[str], prices: Sequence[float],
+                     sizes: Sequence[float], max_position_usdc: Optional[float] = None,
+                     signal_reasons: Optional[Sequence[str]] = None) -> List['TradeFill']:
+        """批量执行虚拟交易，适用于大批量模拟成交
         
-        new_usdc_balance = usdc_balance + usdc_gained
+        参数按列传入（list 或 numpy 数组均可），sizes 的含义与逐笔接口一致：
+        BUY 为买入金额（USDC），SELL 为卖出比例。
+        所有成交在内存中按顺序计算（与 virtual_buy/virtual_sell 使用同一套计算逻辑，
+        结果完全一致），然后在一个事务中用 executemany 批量落库。
+        Returns: 每笔交易的 TradeFill（未执行的交易 executed=False）
+        """
+        count = len(symbols)
+        if not (len(sides) == len(prices) == len(sizes) == count):
+            raise ValueError("symbols、sides、prices、sizes 长度必须一致")
+        if signal_reasons is not None and len(signal_reasons) != count:
+            raise ValueError("signal_reasons 长度必须与交易数量一致")
         
-        # 更新数据库
-        self.update_balance(new_usdc_balance)
-        self.update_position(symbol, new_position_size, new_avg_price, new_total_cost)
-        self.record_trade(symbol, 'SELL', amount_to_sell, current_price, usdc_gained,
-                         usdc_balance, new_usdc_balance, position_size, new_position_size, signal_reason)
+        with self.db.transaction():
+            self.ledger.refresh_if_stale()
+            
+            usdc_balance = self.get_usdc_balance()
+            positions: Dict[str, Tuple[float, float, float]] = {}
+            changed_symbols = set()
+            fills: List[TradeFill] = []
+            balance_rows = []
+            trade_rows = []
+            
+            now = datetime.now()
+            readable_datetime = now.strftime('%Y-%m-%d %H:%M:%S')
+            ts_ms = int(now.timestamp() * 1000)
+            
+            for i in range(count):
+                symbol = str(symbols[i])
+                side = str(sides[i]).upper()
+                if symbol not in positions:
+                    positions[symbol] = self.get_position(symbol)
+                
+                if side == 'BUY':
+                    fill = plan_buy(symbol, usdc_balance, positions[symbol], float(prices[i]),
+                                    float(sizes[i]), max_position_usdc)
+                elif side == 'SELL':
+                    fill = plan_sell(symbol, usdc_balance, positions[symbol], float(prices[i]), float(sizes[i]))
+                else:
+                    raise ValueError(f"未知的交易方向: {sides[i]}")
+                fills.append(fill)
+                
+                if not fill.executed:
+                    continue
+                usdc_balance = fill.balance_after
+                positions[symbol] = (fill.position_after, fill.avg_price_after, fill.total_cost_after)
+                changed_symbols.add(symbol)
+                balance_rows.append((fill.balance_after, fill.action, self.account))
+                trade_rows.append((symbol, fill.action, fill.amount, fill.price, fill.usdc_amount,
+                                   fill.balance_before, fill.balance_after, fill.position_before,
+                                   fill.position_after, readable_datetime,
+                                   str(signal_reasons[i]) if signal_reasons is not None else "", ts_ms,
+                                   self.account))
+            
+            if not trade_rows:
+                return fills
+            
+            self.db.execute('''
+                UPDATE virtual_balance_state SET usdc_balance = ?, updated_at = CURRENT_TIMESTAMP,
+                ledger_version = ledger_version + 1
+                WHERE account = ?
+            ''', (usdc_balance, self.account))
+            self.db.executemany('INSERT INTO virtual_balance (usdc_balance, reason, account) VALUES (?, ?, ?)',
+                                balance_rows)
+            self.db.executemany('''
+                INSERT OR REPLACE INTO virtual_positions 
+                (account, symbol, position_size, avg_price, total_cost, updated_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', [(self.account, symbol) + positions[symbol] for symbol in changed_symbols])
+            use_journal = self.journal is not None and not self.journal.closed
+            if not use_journal:
+                self.db.executemany(TRADE_INSERT_SQL, trade_rows)
+            
+            def on_commit():
+                self.ledger.set_balance(usdc_balance)
+                for symbol in changed_symbols:
+                    self.ledger.set_position(symbol, *positions[symbol])
+                if use_journal:
+                    for row in trade_rows:
+                        self._submit_trade(row)
+            self.db.on_commit(on_commit)
+            self._track_ledger_version()
         
-        return new_usdc_balance, new_position_size
+        return fills
 
     def get_position(self, symbol: str) -> Tuple[float, float, float]:
         """获取指定交易对的持仓信息
         Returns: (position_size, avg_price, total_cost)
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT position_size, avg_price, total_cost 
-            FROM virtual_positions 
-            WHERE symbol = ?
-        ''', (symbol,))
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return result[0], result[1], result[2]
-        else:
-            return 0.0, 0.0, 0.0
+        return self.ledger.get_position(symbol)
     
     def update_position(self, symbol: str, position_size: float, avg_price: float, total_cost: float):
         """更新持仓信息"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         # 使用 INSERT OR REPLACE 来更新或插入
-        cursor.execute('''
+        self.db.execute('''
             INSERT OR REPLACE INTO virtual_positions 
-            (symbol, position_size, avg_price, total_cost, updated_at)
-            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (symbol, position_size, avg_price, total_cost))
-        
-        conn.commit()
-        conn.close()
+            (account, symbol, position_size, avg_price, total_cost, updated_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (self.account, symbol, position_size, avg_price, total_cost))
+        self.db.on_commit(lambda: self.ledger.set_position(symbol, position_size, avg_price, total_cost))
+        self._bump_ledger_version()
     
     def get_all_positions(self) -> dict:
         """获取所有持仓信息"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT symbol, position_size, avg_price, total_cost 
-            FROM virtual_positions 
-            WHERE position_size > 0
-        ''')
-        results = cursor.fetchall()
-        conn.close()
-        
         positions = {}
-        for row in results:
-            positions[row[0]] = {
-                'position_size': row[1],
-                'avg_price': row[2],
-                'total_cost': row[3]
+        for symbol, (position_size, avg_price, total_cost) in self.ledger.get_all_positions().items():
+            if position_size <= 0:
+                continue
+            positions[symbol] = {
+                'position_size': position_size,
+                'avg_price': avg_price,
+                'total_cost': total_cost
             }
         return positions
 
 class OKXTrader:
     _instance = None
     _exchange = None
+    _scheduler = None
     
     def __new__(cls):
         """单例模式，确保只有一个OKXTrader实例"""
@@ -251,23 +570,48 @@ class OKXTrader:
         return cls._instance
     
     def __init__(self):
-        if self._exchange is None:
-            self._init_exchange()
+        # 交易所对象在第一次 get_exchange() 时才创建，只读虚拟账本的进程不会连接交易所
+        pass
+    
+    @classmethod
+    def _get_scheduler(cls):
+        """所有请求经过调度器：按接口限速、按优先级排队、合并并发的相同请求"""
+        from config import Config
+        if cls._scheduler is None and Config.get_scheduler_config()['enabled']:
+            cls._scheduler = RequestScheduler()
+        return cls._scheduler
     
     def _init_exchange(self):
-        """初始化交易所连接"""
+        """初始化交易所连接（不发起网络请求，市场信息在第一次真正需要时加载）"""
         from config import Config
+        from exchange_replay import create_exchange
+        
+        replay_config = Config.get_replay_config()
+        if replay_config['mode'] == 'replay':
+            # 回放录制文件，不访问网络，也不需要限速
+            OKXTrader._exchange = create_exchange()
+            print(f"✓ 交易所回放模式: {replay_config['path']}")
+            return
+        
+        # ccxt 导入较慢，只在需要连接交易所时加载，只读虚拟账本的命令不受影响
+        import ccxt
+        from markets_cache import install_markets_cache
         
         config = Config.get_okx_config()
-        self._exchange = ccxt.okx(config)
+        exchange = ccxt.okx(config)
+        # 市场信息优先使用磁盘缓存，过期后由 ccxt 按需重新加载并写回缓存
+        cached = install_markets_cache(exchange)
+        if replay_config['mode'] == 'record':
+            # 录制在调度器内层，被合并的重复请求只记录一次
+            exchange = create_exchange(exchange)
+            print(f"✓ 交易所录制模式: {replay_config['path']}")
         
-        # 测试连接
-        try:
-            self._exchange.load_markets()
-            print("✓ OKX交易所连接成功")
-        except Exception as e:
-            print(f"✗ OKX交易所连接失败: {e}")
-            raise
+        scheduler = self._get_scheduler()
+        if scheduler is not None:
+            exchange.enableRateLimit = False
+            exchange = ScheduledExchange(exchange, scheduler)
+        OKXTrader._exchange = exchange
+        print(f"✓ OKX交易所已初始化{'（市场信息来自缓存）' if cached else ''}")
     
     def get_exchange(self):
         """获取交易所对象"""
@@ -275,10 +619,18 @@ class OKXTrader:
             self._init_exchange()
         return self._exchange
     
+    def priority(self, lane: str):
+        """在 with 块内以指定优先级通道发出请求，例如 with trader.priority('backfill'): ..."""
+        scheduler = self._get_scheduler()
+        if scheduler is None:
+            from contextlib import nullcontext
+            return nullcontext()
+        return scheduler.priority(lane)
+    
     def get_usdc_balance(self) -> float:
         """Get actual USDC balance from OKX"""
         try:
-            balance = self._exchange.fetch_balance()
+            balance = self.get_exchange().fetch_balance()
             return balance.get('USDC', {}).get('free', 0.0)
         except Exception as e:
             print(f"Error fetching OKX balance: {e}")
@@ -286,18 +638,19 @@ class OKXTrader:
     
     def reconnect(self):
         """重新连接交易所"""
-        self._exchange = None
+        OKXTrader._exchange = None
         self._init_exchange()
 
-def get_balance(source: str = "virtual", **kwargs) -> float:
+def get_balance(source: str = "virtual", account: str = DEFAULT_ACCOUNT, **kwargs) -> float:
     """
     Get balance from different sources
     Args:
         source: 'virtual' or 'okx'
+        account: 虚拟账户名称
         **kwargs: 已废弃，现在使用配置文件
     """
     if source == "virtual":
-        trader = VirtualTrader()
+        trader = VirtualTrader(account=account)
         return trader.get_usdc_balance()
     elif source == "okx":
         trader = OKXTrader()
@@ -308,10 +661,10 @@ def get_balance(source: str = "virtual", **kwargs) -> float:
 # 添加统一的买卖接口函数
 def buy(source: str = "virtual", symbol: str = "", current_price: float = 0.0, 
         buy_amount_usdc: float = 50.0, max_position_usdc: float = None, 
-        signal_reason: str = "", **kwargs) -> Tuple[float, float]:
+        signal_reason: str = "", account: str = DEFAULT_ACCOUNT, **kwargs) -> Tuple[float, float]:
     """执行买入操作"""
     if source == "virtual":
-        trader = VirtualTrader()
+        trader = VirtualTrader(account=account)
         return trader.virtual_buy(symbol, current_price, buy_amount_usdc, max_position_usdc, signal_reason)
     elif source == "okx":
         raise NotImplementedError("OKX 真实交易功能尚未实现")
@@ -319,22 +672,78 @@ def buy(source: str = "virtual", symbol: str = "", current_price: float = 0.0,
         raise ValueError("source 必须是 'virtual' 或 'okx'")
 
 def sell(source: str = "virtual", symbol: str = "", current_price: float = 0.0, 
-         sell_percentage: float = 1.0, signal_reason: str = "", **kwargs) -> Tuple[float, float]:
+         sell_percentage: float = 1.0, signal_reason: str = "", account: str = DEFAULT_ACCOUNT,
+         **kwargs) -> Tuple[float, float]:
     """执行卖出操作"""
     if source == "virtual":
-        trader = VirtualTrader()
+        trader = VirtualTrader(account=account)
         return trader.virtual_sell(symbol, current_price, sell_percentage, signal_reason)
     elif source == "okx":
         raise NotImplementedError("OKX 真实交易功能尚未实现")
     else:
         raise ValueError("source 必须是 'virtual' 或 'okx'")
 
-def get_position(source: str = "virtual", symbol: str = "", **kwargs) -> Tuple[float, float, float]:
+def get_position(source: str = "virtual", symbol: str = "", account: str = DEFAULT_ACCOUNT,
+                 **kwargs) -> Tuple[float, float, float]:
     """获取持仓信息"""
     if source == "virtual":
-        trader = VirtualTrader()
+        trader = VirtualTrader(account=account)
         return trader.get_position(symbol)
     elif source == "okx":
         raise NotImplementedError("OKX 真实交易功能尚未实现")
     else:
         raise ValueError("source 必须是 'virtual' 或 'okx'")
+
+def list_accounts(db_path: Optional[str] = None) -> Dict[str, str]:
+    """列出所有虚拟账户
+    Returns: {账户名: 数据库路径}，包含主库中的账户和独立数据库文件中的账户
+    """
+    import glob
+    from config import Config
+    db_config = Config.get_database_config()
+    main_db = db_path or db_config['db_path']
+    
+    accounts = {}
+    if os.path.exists(main_db):
+        # 只读：不在列出账户时执行迁移（迁移需要写锁），旧结构的数据库在首次写入时再迁移
+        db = ConnectionManager.get(main_db)
+        if get_schema_version(db) >= 5:
+            for (account,) in db.execute('SELECT account FROM virtual_balance_state ORDER BY account'):
+                accounts[account] = main_db
+        elif db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'virtual_balance'").fetchone():
+            # 多账户子账本（版本 5）之前的数据库只有 default 账户
+            accounts[DEFAULT_ACCOUNT] = main_db
+    
+    if db_config.get('per_account_db'):
+        template = db_config['account_db_template']
+        prefix, suffix = template.split('{account}')
+        for path in sorted(glob.glob(template.format(account='*'))):
+            account = path[len(prefix):len(path) - len(suffix)]
+            accounts.setdefault(account, path)
+    return accounts
+
+def get_consolidated_view(accounts: Optional[Dict[str, str]] = None) -> Dict:
+    """跨账户汇总的只读视图（余额与按交易对合并的持仓）
+    Args:
+        accounts: {账户名: 数据库路径}，默认使用 list_accounts()
+    """
+    accounts = accounts if accounts is not None else list_accounts()
+    
+    view = {'accounts': {}, 'total_usdc_balance': 0.0, 'positions': {}}
+    for account, db_path in accounts.items():
+        trader = VirtualTrader(db_path, account=account)
+        trader.refresh_ledger()
+        usdc_balance = trader.get_usdc_balance()
+        positions = trader.get_all_positions()
+        view['accounts'][account] = {'usdc_balance': usdc_balance, 'positions': positions}
+        view['total_usdc_balance'] += usdc_balance
+        
+        for symbol, pos_info in positions.items():
+            total = view['positions'].setdefault(symbol, {'position_size': 0.0, 'total_cost': 0.0, 'avg_price': 0.0})
+            total['position_size'] += pos_info['position_size']
+            total['total_cost'] += pos_info['total_cost']
+    
+    for total in view['positions'].values():
+        if total['position_size'] > 0:
+            total['avg_price'] = total['total_cost'] / total['position_size']
+    return view
@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
 
 import abc
+import contextvars
+import dataclasses
 import time
 import threading
-from typing import Dict, List, Optional, Tuple, Any
-from dataclasses import dataclass
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
 import logging
+import numpy as np
+from candle_buffer import CandleRingBuffer, get_candle_buffer
+from candle_store import timeframe_to_ms
 
 class SignalType(Enum):
     BUY = "BUY"
@@ -23,6 +29,38 @@ class TradingSignal:
     sell_percentage: Optional[float] = None
     reason: str = ""
     plugin_name: str = ""
+    # 供依赖本插件的下游插件使用的中间结果，键和类型由发布方插件用 TypedDict 声明
+    # （例如 plugins.mean_reversion_plugin.BollingerOutputs）
+    outputs: Mapping[str, Any] = field(default_factory=dict)
+
+@dataclass(frozen=True)
+class UpstreamResults:
+    """本轮上游插件（dependencies）的结果，按插件名索引；未启用、出错或超时的插件不在其中"""
+    signals: Dict[str, TradingSignal] = field(default_factory=dict)
+    
+    def get(self, plugin_name: str) -> Optional[TradingSignal]:
+        return self.signals.get(plugin_name)
+    
+    def outputs(self, plugin_name: str) -> Mapping[str, Any]:
+        """上游插件发布的中间结果，没有时为空字典"""
+        signal = self.signals.get(plugin_name)
+        return signal.outputs if signal is not None else {}
+    
+    def __contains__(self, plugin_name: str) -> bool:
+        return plugin_name in self.signals
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.signals)
+    
+    def __len__(self) -> int:
+        return len(self.signals)
+
+@dataclass
+class DataRequirement:
+    """插件声明需要的K线数据"""
+    symbol: str
+    timeframe: str
+    limit: int  # 需要的最近K线根数
 
 @dataclass
 class MarketData:
@@ -30,15 +68,59 @@ class MarketData:
     price: float
     timestamp: float
     additional_data: Dict[str, Any] = None
+    # 实时K线环形缓冲区: {(symbol, timeframe): CandleRingBuffer}
+    candles: Dict[Tuple[str, str], CandleRingBuffer] = None
+    # 本轮上游插件（dependencies）的结果，由框架为每个插件单独填入
+    upstream: Optional[UpstreamResults] = None
+    _ohlcv: Dict[Tuple[str, str], List[List[float]]] = field(default=None, init=False, repr=False, compare=False)
+    
+    @property
+    def ohlcv(self) -> Dict[Tuple[str, str], List[List[float]]]:
+        """本轮K线快照的列表形式: {(symbol, timeframe): [[ts, open, high, low, close, volume], ...]}
+        
+        第一次访问时由 candles 生成（兼容按列表读取K线的旧插件），新插件请直接使用 candles。
+        """
+        if self._ohlcv is None:
+            self._ohlcv = {key: buffer.to_list() for key, buffer in (self.candles or {}).items()}
+        return self._ohlcv
+    
+    def get_upstream(self, plugin_name: str) -> Optional['TradingSignal']:
+        """取上游插件本轮的结果，插件未启用、出错或超时时返回 None"""
+        return self.upstream.get(plugin_name) if self.upstream is not None else None
+    
+    def get_output(self, plugin_name: str, key: str, default: Any = None) -> Any:
+        """取上游插件发布的中间结果（TradingSignal.outputs）中的一项"""
+        if self.upstream is None:
+            return default
+        return self.upstream.outputs(plugin_name).get(key, default)
+    
+    def get_candle_buffer(self, symbol: str, timeframe: str, limit: int) -> Optional[CandleRingBuffer]:
+        """取K线缓冲区，没有或数量不够 limit 时返回 None"""
+        if not self.candles:
+            return None
+        buffer = self.candles.get((symbol, timeframe))
+        if buffer is None or len(buffer) < limit:
+            return None
+        return buffer
+    
+    def get_ohlcv(self, symbol: str, timeframe: str, limit: int) -> Optional[List[List[float]]]:
+        """从快照中取最近 limit 根K线（列表形式），快照中没有或数量不够时返回 None"""
+        buffer = self.get_candle_buffer(symbol, timeframe, limit)
+        return buffer.to_list(limit) if buffer is not None else None
 
 class TradingPlugin(abc.ABC):
     """交易插件基类"""
     
+    # "thread": 在主进程中执行；"process": 在独立的工作进程中执行（计算量大的插件，见 plugin_host）
+    execution = "thread"
+    
     def __init__(self, name: str):
         self.name = name
         self.enabled = True
         self.dependencies = []
         self.logger = logging.getLogger(f"plugin.{name}")
+        # 并发执行时超时会被设置，耗时较长的插件可以检查后提前返回
+        self.cancel_event = threading.Event()
     
     @abc.abstractmethod
     def analyze(self, market_data: MarketData, position_info: Dict) -> TradingSignal:
@@ -50,8 +132,61 @@ class TradingPlugin(abc.ABC):
         """获取插件配置"""
         pass
     
+    def get_data_requirements(self) -> List[DataRequirement]:
+        """声明需要的K线数据，框架每轮统一获取一次并通过 MarketData.candles 共享"""
+        return []
+    
+    def fetch_ohlcv(self, market_data: MarketData, symbol: str, timeframe: str, limit: int) -> List[List[float]]:
+        """优先使用本轮快照中的K线，快照中没有时才通过插件自己的 exchange 请求"""
+        candles = market_data.get_ohlcv(symbol, timeframe, limit) if market_data else None
+        if candles is not None:
+            return candles
+        return self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+    
+    def fetch_closes(self, market_data: MarketData, symbol: str, timeframe: str, limit: int) -> np.ndarray:
+        """最近 limit 根K线的收盘价，有K线缓冲区时直接返回视图（不拷贝）"""
+        buffer = market_data.get_candle_buffer(symbol, timeframe, limit) if market_data else None
+        if buffer is not None:
+            return buffer.window('close', limit)
+        ohlcv = self.fetch_ohlcv(market_data, symbol, timeframe, limit)
+        return np.array([candle[4] for candle in ohlcv], dtype=np.float64)
+    
+    def get_indicator(self, market_data: MarketData, symbol: str, timeframe: str, kind: str, **params):
+        """取共享的流式指标（indicators.streaming），并用最新K线增量更新
+        
+        同一 (symbol, timeframe, 指标, 参数) 在所有插件间只维护一份状态。
+        Returns: SeriesIndicator，.indicator 为指标对象
+        """
+        from indicators.streaming import get_indicator_engine
+        buffer = market_data.get_candle_buffer(symbol, timeframe, 1) if market_data else None
+        if buffer is None:
+            # 没有本轮快照时自行获取K线写入共享缓冲区
+            buffer = get_candle_buffer(symbol, timeframe)
+            candles = self.exchange.fetch_ohlcv(symbol, timeframe, limit=buffer.capacity)
+            if candles and buffer.last_ts is not None and candles[0][0] > buffer.last_ts + timeframe_to_ms(timeframe):
+                buffer.clear()
+            buffer.extend(candles)
+        return get_indicator_engine().update(buffer, symbol, timeframe, kind, **params)
+    
+    def __getstate__(self):
+        # 发送到工作进程时不包含交易所连接、日志器和线程事件
+        state = self.__dict__.copy()
+        for name in ('exchange', 'logger', 'cancel_event'):
+            state.pop(name, None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.exchange = None
+        self.logger = logging.getLogger(f"plugin.{self.name}")
+        self.cancel_event = threading.Event()
+    
+    def is_cancelled(self) -> bool:
+        """本轮执行是否已超时被取消（结果会被丢弃）"""
+        return self.cancel_event.is_set()
+    
     def set_dependencies(self, dependencies: List[str]):
-        """设置依赖的插件名称列表"""
+        """设置依赖的插件名称列表（依赖的插件先执行，结果通过 MarketData.upstream 传入）"""
         self.dependencies = dependencies
     
     def enable(self):
@@ -63,12 +198,26 @@ class TradingPlugin(abc.ABC):
 class TradingFramework:
     """交易框架主类"""
     
-    def __init__(self):
+    def __init__(self, parallel: Optional[bool] = None, max_workers: Optional[int] = None,
+                 plugin_timeout: Optional[float] = None):
+        from config import Config
+        plugin_config = Config.get_plugin_config()
         self.plugins: Dict[str, TradingPlugin] = {}
         self.plugin_order: List[str] = []
+        self.plugin_depths: Dict[str, int] = {}  # 依赖图中的层级，没有依赖的插件为 0
         self.running = False
         self.logger = logging.getLogger("framework")
         
+        # 插件并发执行，默认开启（PLUGIN_CONFIG['parallel']），线程池在第一次并发执行时创建
+        self.parallel = plugin_config['parallel'] if parallel is None else parallel
+        self.max_workers = max_workers or plugin_config['max_workers']
+        self.plugin_timeout = plugin_config['timeout'] if plugin_timeout is None else plugin_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stragglers: Dict[str, Future] = {}  # 超时后仍在运行的插件
+        # 进程隔离插件的工作进程（第一次执行 execution="process" 的插件时创建）
+        self.process_start_method = plugin_config['process_start_method']
+        self._host = None
+        
         # 配置日志
         logging.basicConfig(
             level=logging.INFO,
@@ -79,6 +228,8 @@ class TradingFramework:
         """注册插件"""
         if plugin.name in self.plugins:
             self.logger.warning(f"插件 {plugin.name} 已存在，将被覆盖")
+            if self._host is not None:
+                self._host.remove(plugin.name)
         
         self.plugins[plugin.name] = plugin
         self._update_plugin_order()
@@ -92,6 +243,8 @@ class TradingFramework:
             return False
         
         del self.plugins[plugin_name]
+        if self._host is not None:
+            self._host.remove(plugin_name)
         self._update_plugin_order()
         self.logger.info(f"插件 {plugin_name} 注销成功")
         return True
@@ -125,29 +278,262 @@ class TradingFramework:
                 dfs(plugin_name)
         
         self.plugin_order = order
+        # 拓扑序中依赖总在前面，层级 = 依赖的最大层级 + 1
+        self.plugin_depths = {}
+        for plugin_name in order:
+            dependencies = [dep for dep in self.plugins[plugin_name].dependencies if dep in self.plugins]
+            self.plugin_depths[plugin_name] = max((self.plugin_depths[dep] + 1 for dep in dependencies), default=0)
         self.logger.info(f"插件执行顺序: {self.plugin_order}")
     
-    def get_trading_decision(self, market_data: MarketData, position_info: Dict) -> List[TradingSignal]:
-        """获取所有插件的交易决策"""
-        signals = []
-        
+    def get_plugin_levels(self) -> List[List[str]]:
+        """按依赖层级分组的插件，同一层的插件互不依赖，并发模式下可以同时执行"""
+        levels: List[List[str]] = []
+        for plugin_name in self.plugin_order:
+            depth = self.plugin_depths[plugin_name]
+            while len(levels) <= depth:
+                levels.append([])
+            levels[depth].append(plugin_name)
+        return levels
+    
+    def get_data_requirements(self) -> Dict[Tuple[str, str], int]:
+        """合并所有启用插件的数据需求，同一K线序列取最长回看长度
+        Returns: {(symbol, timeframe): limit}
+        """
+        requirements = {}
         for plugin_name in self.plugin_order:
             plugin = self.plugins[plugin_name]
-            
             if not plugin.enabled:
                 continue
-            
-            try:
-                signal = plugin.analyze(market_data, position_info)
-                if signal:
-                    signal.plugin_name = plugin_name
-                    signals.append(signal)
-                    self.logger.info(f"插件 {plugin_name} 返回信号: {signal.signal_type.value}")
-            except Exception as e:
-                self.logger.error(f"插件 {plugin_name} 执行出错: {e}")
+            for requirement in plugin.get_data_requirements():
+                key = (requirement.symbol, requirement.timeframe)
+                requirements[key] = max(requirements.get(key, 0), requirement.limit)
+        return requirements
+    
+    def fetch_market_snapshot(self, exchange, symbol: str, feed=None) -> MarketData:
+        """每轮获取一次市场快照，供所有插件共享
+        
+        每个K线序列只请求一次，结果写入该序列的环形缓冲区；缓冲区已有足够历史时
+        只请求最新一根K线之后的部分。当前价格取交易对最新一根K线的收盘价，
+        没有插件需要该交易对的K线时才退回 fetch_ticker。
+        传入 feed（market_feed.MarketFeed）且推送数据新鲜时，完全不发起 REST 请求。
+        exchange 提供 fetch_ohlcv_many（async_trading.SyncOKXTrader）时所有序列并发请求。
+        """
+        candles = {}
+        pending = []  # 需要通过 REST 更新的序列
+        for (series_symbol, timeframe), limit in self.get_data_requirements().items():
+            if feed is not None and feed.is_live(series_symbol, timeframe):
+                buffer = get_candle_buffer(series_symbol, timeframe)
+                if len(buffer) >= limit:
+                    candles[(series_symbol, timeframe)] = buffer
+                    continue
+            pending.append((series_symbol, timeframe, limit))
+        
+        if hasattr(exchange, 'fetch_ohlcv_many'):
+            # 异步交易所（async_trading.SyncOKXTrader）: 所有序列并发请求
+            requests = []
+            for series_symbol, timeframe, limit in pending:
+                try:
+                    requests.append((series_symbol, timeframe) + self._candle_request(series_symbol,
+                                                                                      timeframe, limit))
+                except Exception as e:
+                    self.logger.error(f"获取K线 {series_symbol} {timeframe} 失败: {e}")
+            results = exchange.fetch_ohlcv_many(requests) if requests else {}
+            for series_symbol, timeframe, since, _ in requests:
+                result = results.get((series_symbol, timeframe))
+                if isinstance(result, BaseException):
+                    self.logger.error(f"获取K线 {series_symbol} {timeframe} 失败: {result}")
+                    continue
+                candles[(series_symbol, timeframe)] = self._apply_candles(series_symbol, timeframe,
+                                                                          since, result)
+        else:
+            for series_symbol, timeframe, limit in pending:
+                try:
+                    candles[(series_symbol, timeframe)] = self._update_candle_buffer(exchange, series_symbol,
+                                                                                     timeframe, limit)
+                except Exception as e:
+                    # 单个序列失败时插件会自行重试获取
+                    self.logger.error(f"获取K线 {series_symbol} {timeframe} 失败: {e}")
+        
+        price = None
+        if feed is not None and feed.is_live(symbol):
+            price = feed.get_ticker(symbol)['last']
+        symbol_buffers = [buffer for (series_symbol, _), buffer in candles.items()
+                          if series_symbol == symbol and len(buffer)]
+        if price is None and symbol_buffers:
+            # 多个周期时取最新的那根K线
+            latest = max(symbol_buffers, key=lambda buffer: buffer.last_ts)
+            price = float(latest.window('close', 1)[0])
+        if price is None:
+            price = exchange.fetch_ticker(symbol)['last']
+        
+        return MarketData(symbol=symbol, price=price, timestamp=time.time(), candles=candles)
+    
+    def _candle_request(self, symbol: str, timeframe: str, limit: int) -> Tuple[Optional[int], int]:
+        """计算更新K线缓冲区需要的请求参数
+        Returns: (since, limit)，since 为 None 表示请求最近 limit 根
+        """
+        buffer = get_candle_buffer(symbol, timeframe)
+        if buffer.capacity < limit:
+            raise ValueError(f"K线缓冲区容量 {buffer.capacity} 小于需要的 {limit} 根")
+        
+        step = timeframe_to_ms(timeframe)
+        last_ts = buffer.last_ts
+        now_ms = int(time.time() * 1000)
+        if len(buffer) >= limit and now_ms - last_ts < limit * step:
+            # 从最新一根（可能未收盘）K线开始，只取增量
+            return last_ts, limit
+        return None, limit
+    
+    def _apply_candles(self, symbol: str, timeframe: str, since: Optional[int],
+                       new_candles: List[List[float]]) -> CandleRingBuffer:
+        """把请求到的K线写入缓冲区"""
+        buffer = get_candle_buffer(symbol, timeframe)
+        last_ts = buffer.last_ts
+        if since is None and new_candles and last_ts is not None \
+                and new_candles[0][0] > last_ts + timeframe_to_ms(timeframe):
+            # 与缓冲区中的旧数据之间有断档，丢弃旧数据
+            buffer.clear()
+        buffer.extend(new_candles)
+        return buffer
+    
+    def _update_candle_buffer(self, exchange, symbol: str, timeframe: str, limit: int) -> CandleRingBuffer:
+        """增量更新K线缓冲区"""
+        since, limit = self._candle_request(symbol, timeframe, limit)
+        new_candles = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+        return self._apply_candles(symbol, timeframe, since, new_candles)
+    
+    def get_trading_decision(self, market_data: MarketData, position_info: Dict) -> List[TradingSignal]:
+        """获取所有插件的交易决策（信号按插件执行顺序排列，与是否并发执行无关）
+        
+        按依赖关系执行：每个插件在它依赖的插件结束后执行，并通过 MarketData.upstream
+        收到这些插件本轮的结果，共用的中间计算每轮只做一次。
+        默认（parallel=True）互不依赖的插件在线程池中同时执行；parallel=False 时按依赖顺序逐个执行。
+        """
+        names = [name for name in self.plugin_order if self.plugins[name].enabled]
+        snapshot = None
+        if any(self.plugins[name].execution == "process" for name in names):
+            # 每轮发布一次共享内存快照，所有进程隔离插件共用
+            snapshot = self._get_host().publish(market_data)
+        if self.parallel and len(names) > 1:
+            results = self._analyze_parallel(names, market_data, position_info, snapshot)
+        else:
+            results = {}
+            for name in names:
+                self.plugins[name].cancel_event.clear()
+                results[name] = self._analyze(name, market_data, position_info, snapshot,
+                                              self._upstream(name, results))
+        
+        signals = []
+        for plugin_name in names:
+            signal = results.get(plugin_name)
+            if signal:
+                signals.append(signal)
+                self.logger.info(f"插件 {plugin_name} 返回信号: {signal.signal_type.value}")
         
         return signals
     
+    def _upstream(self, plugin_name: str, results: Dict[str, Optional[TradingSignal]]) -> UpstreamResults:
+        """插件依赖的插件本轮的结果"""
+        return UpstreamResults({dep: results[dep] for dep in self.plugins[plugin_name].dependencies
+                                if results.get(dep)})
+    
+    def _analyze(self, plugin_name: str, market_data: MarketData, position_info: Dict,
+                 snapshot: Optional[Dict] = None,
+                 upstream: Optional[UpstreamResults] = None) -> Optional[TradingSignal]:
+        plugin = self.plugins[plugin_name]
+        try:
+            if plugin.execution == "process":
+                signal = self._host.analyze(plugin, snapshot, position_info, upstream)
+            else:
+                if plugin.dependencies:
+                    # 浅拷贝，各插件的 upstream 互不影响，K线等数据仍然共享
+                    market_data = dataclasses.replace(market_data, upstream=upstream or UpstreamResults())
+                signal = plugin.analyze(market_data, position_info)
+        except Exception as e:
+            self.logger.error(f"插件 {plugin_name} 执行出错: {e}")
+            return None
+        if signal:
+            signal.plugin_name = plugin_name
+        return signal
+    
+    def _get_host(self):
+        if self._host is None:
+            from plugin_host import PluginHost
+            self._host = PluginHost(timeout=self.plugin_timeout, start_method=self.process_start_method)
+        return self._host
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='plugin')
+        return self._executor
+    
+    def _analyze_parallel(self, names: List[str], market_data: MarketData, position_info: Dict,
+                          snapshot: Optional[Dict] = None) -> Dict[str, Optional[TradingSignal]]:
+        """在线程池中并发执行插件
+        
+        插件在它依赖的插件结束后才提交；超过 plugin_timeout 的插件设置取消标志并丢弃结果，
+        上一轮超时仍未结束的插件本轮跳过，避免占满线程池。
+        """
+        executor = self._get_executor()
+        results: Dict[str, Optional[TradingSignal]] = {}
+        finished = set()
+        waiting = []
+        for name in names:
+            straggler = self._stragglers.get(name)
+            if straggler is not None and not straggler.done():
+                self.logger.warning(f"插件 {name} 上一轮仍在运行，本轮跳过")
+                finished.add(name)
+                continue
+            self._stragglers.pop(name, None)
+            waiting.append(name)
+        
+        running: Dict[Future, Tuple[str, Optional[float]]] = {}  # future -> (插件名, 截止时间)
+        while waiting or running:
+            for name in list(waiting):
+                plugin = self.plugins[name]
+                if all(dep in finished for dep in plugin.dependencies if dep in names):
+                    waiting.remove(name)
+                    plugin.cancel_event.clear()
+                    # 复制上下文，请求调度器的优先级等上下文变量在线程中依然有效
+                    future = executor.submit(contextvars.copy_context().run, self._analyze,
+                                             name, market_data, position_info, snapshot,
+                                             self._upstream(name, results))
+                    deadline = None
+                    if self.plugin_timeout and plugin.execution != "process":
+                        # 进程隔离插件的超时由 PluginHost 处理（结束并重启工作进程）
+                        deadline = time.monotonic() + self.plugin_timeout
+                    running[future] = (name, deadline)
+            
+            deadlines = [deadline for _, deadline in running.values() if deadline is not None]
+            timeout = max(min(deadlines) - time.monotonic(), 0.0) if deadlines else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future, (name, deadline) in list(running.items()):
+                if future in done:
+                    results[name] = future.result()
+                elif deadline is not None and now >= deadline:
+                    self.plugins[name].cancel_event.set()
+                    if not future.cancel():  # 尚未开始执行的直接取消
+                        self._stragglers[name] = future
+                    self.logger.warning(f"插件 {name} 超过 {self.plugin_timeout} 秒未返回，结果已丢弃")
+                else:
+                    continue
+                del running[future]
+                finished.add(name)
+        
+        return results
+    
+    def shutdown(self):
+        """停止插件线程池和工作进程，正在运行的插件收到取消标志"""
+        for plugin in self.plugins.values():
+            plugin.cancel_event.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._host is not None:
+            self._host.close()
+            self._host = None
+    
     def aggregate_signals(self, signals: List[TradingSignal]) -> Optional[TradingSignal]:
         """聚合多个插件的信号"""
         if not signals:
@@ -181,6 +567,8 @@ class TradingFramework:
         for name, plugin in self.plugins.items():
             plugin_info[name] = {
                 'enabled': plugin.enabled,
+                'execution': plugin.execution,
+                'depth': self.plugin_depths.get(name, 0),
                 'dependencies': plugin.dependencies,
                 'config': plugin.get_config()
             }